@@ -1,15 +1,40 @@
-from flask import Flask, render_template, request, jsonify, flash, make_response, session
+from flask import (
+    Flask, render_template, request, jsonify, flash, make_response, session, g, url_for,
+    Response, stream_with_context
+)
 import os
 from dotenv import load_dotenv
 import logging
+import functools
+import math
 import pandas as pd
 from io import BytesIO
 from datetime import datetime
 import json
 from werkzeug.utils import secure_filename
-from utils.geocoding import get_coordinates, search_insurance_brokers
-from utils.scraper import scrape_broker_website
+from utils.geocoding import get_coordinates, search_insurance_brokers, normalize_location
+from utils.geo import SORT_OPTIONS
+from utils.enrichment import enrich_brokers, RESULTS_PAGE_SIZE
+from utils.result_store import (
+    create_result_set, get_result_set, get_result_page, save_result_page,
+    save_upload_results, get_upload_results, encode_cursor, decode_cursor
+)
 from utils.api_client import forward_to_external_api, prepare_broker_payload
+from utils.api_metrics import begin_scope, end_scope, get_metrics
+from utils.admission import get_admission, get_client_quota, ADMISSION_POOLS
+from utils.search_history import record_search
+from utils.search_pipeline import run_search_once, narrow_search
+from utils.keyword_planner import get_keyword_planner
+from utils.bulk_geocoding import attach_coordinates
+from utils.localities import get_localities
+from utils.jobs import get_job_runner, get_job, JOB_STAGES
+from utils.result_stream import enrich_result_page, enrich_result_slice, stream_result_page
+from utils.search_cache import cached_search, get_search_cache
+from utils.batch_search import parse_locations, run_batch_search, BATCH_SEARCH_MAX_LOCATIONS
+from utils.broker_store import (
+    get_broker_store, parse_query_args, encode_query_cursor, decode_query_cursor,
+    fts_query, FTS_MIN_TOKEN
+)
 
 # Umgebungsvariablen laden
 load_dotenv()
@@ -23,6 +48,11 @@ ALLOWED_EXTENSIONS = {'xls', 'xlsx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Maximale Seitengröße der Such-API (Makler pro Antwort)
+API_SEARCH_MAX_LIMIT = int(os.getenv('API_SEARCH_MAX_LIMIT', '50'))
+# Höchstens so viele Makler pro Export (fehlende Seiten werden vor dem Export angereichert)
+EXPORT_MAX_BROKERS = int(os.getenv('EXPORT_MAX_BROKERS', '500'))
+
 # Upload-Ordner erstellen falls nicht vorhanden
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -32,6 +62,96 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@app.before_request
+def start_api_metrics_scope():
+    """Ordnet Google-API-Aufrufe dieses Requests der Route und einer Request-ID zu"""
+    g.google_api_scope = begin_scope(request.endpoint or request.path)
+
+
+@app.teardown_request
+def finish_api_metrics_scope(error=None):
+    """Loggt die Google-API-Zusammenfassung des Requests (nur wenn Google aufgerufen wurde)"""
+    token = g.pop('google_api_scope', None)
+    if token is None:
+        return
+    get_metrics().log_request_summary(token.var.get()['request_id'])
+    try:
+        end_scope(token)
+    except ValueError:
+        pass
+
+
+def admission_control(pool='search', quota_cost=None, methods=None, page=None):
+    """
+    Zulassungskontrolle für teure Routen.
+    
+    Begrenzt gleichzeitige Requests pro Worker und über alle Worker (mit kurzer
+    Warteschlange) und zieht Suchen vom Google-Kontingent des Clients ab.
+    Antworten mit 4xx (ungültige Eingaben) werden dem Kontingent wieder
+    gutgeschrieben; bei gestreamten Antworten bleibt der Slot bis zum Ende des
+    Streams belegt.
+    
+    Args:
+        pool (str): 'search' für Google-Routen, 'forward' für die externe API
+        quota_cost (callable): Anzahl Suchen des Requests für das Client-Kontingent (ohne: kostenlos)
+        methods (tuple): Nur diese HTTP-Methoden begrenzen (Standard: alle)
+        page (callable): Rendert bei Formular-Requests die Seite für die Fehlermeldung
+    
+    Returns:
+        Decorator; bei Überlast 503, bei erschöpftem Kontingent 429, jeweils mit Retry-After
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if methods and request.method not in methods:
+                return view(*args, **kwargs)
+            
+            client = request.remote_addr or 'unbekannt'
+            cost = quota_cost() if quota_cost else 0
+            if cost:
+                wait = get_client_quota().take(client, cost)
+                if wait:
+                    return admission_rejected(
+                        429, f'Suchkontingent erschöpft. Bitte in {wait} Sekunden erneut versuchen.', wait, page
+                    )
+            
+            admission = get_admission(pool)
+            lease = admission.acquire(request.endpoint)
+            if lease is None:
+                get_client_quota().refund(client, cost)
+                retry_after = admission.retry_after()
+                return admission_rejected(
+                    503, 'Der Server ist gerade ausgelastet. Bitte in Kürze erneut versuchen.', retry_after, page
+                )
+            streaming = False
+            try:
+                response = make_response(view(*args, **kwargs))
+                if cost and 400 <= response.status_code < 500:
+                    # Ungültige Eingaben kosten kein Kontingent
+                    get_client_quota().refund(client, cost)
+                if response.is_streamed:
+                    # Gestreamte Antworten belegen den Slot, bis der Stream beendet ist
+                    response.call_on_close(lambda: admission.release(lease))
+                    streaming = True
+                return response
+            finally:
+                if not streaming:
+                    admission.release(lease)
+        return wrapper
+    return decorator
+
+
+def admission_rejected(status, message, retry_after, page=None):
+    """Abweisung durch die Zulassungskontrolle: JSON für API und Jobs, sonst Seite mit Hinweis."""
+    if page is None or request.path.startswith('/api/') or request.form.get('mode') == 'job':
+        response = make_response(jsonify({'status': 'error', 'message': message, 'retry_after': retry_after}), status)
+    else:
+        flash(message, 'warning')
+        response = make_response(page(), status)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
 def allowed_file(filename):
     """Überprüft ob die Datei-Extension erlaubt ist"""
     return '.' in filename and \
@@ -128,114 +248,598 @@ def index():
     return render_template('index.html')
 
 
+def execute_search(location, radius_km, sort_by, progress=None, stream=False, force_refresh=False):
+    """
+    Geocodiert den Suchort und führt die Suche aus (direkt oder als Hintergrundjob).
+    
+    Mit stream=True endet die Suche nach der Nearby-Suche; die Ergebnisseite
+    reichert die erste Seite dann über den Ergebnis-Stream an. Liegt die Suche
+    im Suchergebnis-Cache, wird sie sofort geliefert (veraltete Einträge werden
+    im Hintergrund aufgefrischt); force_refresh umgeht den Cache.
+
+    Returns:
+        dict: Ergebnis von run_search_once() mit location; bei unbekanntem Ort 'error'
+    """
+    if progress:
+        progress('geocode')
+    
+    # Koordinaten des Standorts ermitteln
+    coordinates = get_coordinates(location)
+    if not coordinates:
+        return {'total': 0, 'error': 'Standort konnte nicht gefunden werden. Bitte überprüfen Sie die Eingabe.'}
+    
+    # GPS-Eingaben unter "PLZ Ort" anzeigen und protokollieren; Mittelpunkt bleibt die GPS-Position
+    location = coordinates.get('label', location)
+    
+    record_search(normalize_location(location), location, coordinates, radius_km, sort_by)
+    
+    snap = coordinates.get('snap')
+    if not snap:
+        return dict(run_cached_search(location, coordinates, radius_km, sort_by, progress, stream, force_refresh),
+                    location=location)
+    
+    # Eingerastete GPS-Position: dieselbe Suche wie für die getippte PLZ, mit um den Abstand
+    # zum Schwerpunkt vergrößertem Radius (enthält den Kreis um die GPS-Position), danach
+    # auf den Kreis um die GPS-Position zuschneiden
+    centre = get_coordinates(location) or {'lat': snap['lat'], 'lng': snap['lng']}
+    snapped = run_cached_search(location, centre, radius_km + math.ceil(snap['distance_km']), sort_by,
+                                progress, True, force_refresh)
+    if not snapped.get('result_id'):
+        return dict(snapped, location=location)
+    search = narrow_search(snapped['result_id'], location, coordinates, radius_km, sort_by, progress,
+                           enrich_first_page=not stream)
+    return dict(search, location=location)
+
+
+def run_cached_search(location, coordinates, radius_km, sort_by, progress=None, stream=False, force_refresh=False):
+    """
+    Liefert eine Suche aus dem Suchergebnis-Cache oder führt sie aus und legt sie dort ab.
+    
+    Returns:
+        dict: Ergebnis von cached_search() bzw. run_search_once()
+    """
+    cached = cached_search(location, coordinates, radius_km, sort_by, force_refresh)
+    if cached:
+        return cached
+    
+    # Suche ausführen; identische gleichzeitige Suchen teilen sich ein Ergebnis
+    search = run_search_once(location, coordinates, radius_km, sort_by, progress,
+                             enrich_first_page=not stream,
+                             max_age=get_search_cache().fresh_seconds if force_refresh else None)
+    if search.get('result_id'):
+        get_search_cache().store(location, radius_km, sort_by, search['result_id'], coordinates)
+    return search
+
+
+def render_search_results(result_id, brokers, params, total, stream=False):
+    """Rendert die erste Ergebnisseite und merkt die Ergebnismenge für den Export vor"""
+    # Nur die ID der serverseitigen Ergebnismenge in der Session (Cookie) für den Export
+    session['last_search_id'] = result_id
+    session.pop('last_search_results', None)
+    session.pop('last_search_params', None)
+    
+    # Alter der Daten für die Anzeige; veraltete Ergebnisse werden im Hintergrund aufgefrischt
+    try:
+        data_age = (datetime.now() - datetime.strptime(params['timestamp'], '%Y-%m-%d %H:%M:%S')).total_seconds()
+    except (KeyError, ValueError):
+        data_age = None
+    
+    return render_template('results.html', 
+                         brokers=brokers, 
+                         location=params['location'], 
+                         radius=params['radius'],
+                         total_count=total,
+                         result_id=result_id,
+                         page_size=RESULTS_PAGE_SIZE,
+                         sort=params.get('sort', 'distance'),
+                         data_timestamp=params.get('timestamp'),
+                         data_age_minutes=int(data_age // 60) if data_age is not None else None,
+                         data_refreshing=(not params.get('batch') and data_age is not None
+                                          and data_age > get_search_cache().fresh_seconds),
+                         batch=params.get('batch'),
+                         locations=params.get('locations', []),
+                         stream_url=url_for('api_result_stream', result_id=result_id) if stream else None)
+
+
 @app.route('/search', methods=['POST'])
+@admission_control(quota_cost=lambda: 1, page=lambda: render_template('index.html'))
 def search_brokers():
     """Suche nach Versicherungsmaklern basierend auf Standort und Radius"""
     try:
         # Formulardaten auslesen
         location = request.form.get('location', '').strip()
         radius_km = int(request.form.get('radius', 10))
+        sort_by = request.form.get('sort', 'distance')
+        if sort_by not in SORT_OPTIONS:
+            sort_by = 'distance'
         
         if not location:
             flash('Bitte geben Sie eine Postleitzahl oder einen Ort ein.', 'error')
-            return render_template('index.html')
+            return render_template('index.html'), 400
         
         if radius_km < 1 or radius_km > 100:
             flash('Der Radius muss zwischen 1 und 100 km liegen.', 'error')
-            return render_template('index.html')
+            return render_template('index.html'), 400
         
         logger.info(f"Suche nach Versicherungsmaklern in {location} im Umkreis von {radius_km}km")
         
-        # Koordinaten des Standorts ermitteln
-        coordinates = get_coordinates(location)
-        if not coordinates:
-            flash('Standort konnte nicht gefunden werden. Bitte überprüfen Sie die Eingabe.', 'error')
+        # "Aktualisieren" auf der Ergebnisseite: Suchergebnis-Cache umgehen
+        force_refresh = request.form.get('refresh') == '1'
+        
+        # Job-Modus: Suche im Hintergrund, Antwort sofort mit Job-ID (Fortschritt über /api/jobs/<id>)
+        if request.form.get('mode') == 'job':
+            # stream=1: Job endet nach der Nearby-Suche, die Ergebnisseite lädt Details per SSE
+            stream = request.form.get('stream') == '1'
+            job_id = get_job_runner().submit(
+                'search_job',
+                {'location': location, 'radius': radius_km, 'sort': sort_by},
+                lambda job: execute_search(location, radius_km, sort_by, job.stage, stream, force_refresh)
+            )
+            if not job_id:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Zu viele laufende Suchen. Bitte in Kürze erneut versuchen.'
+                }), 503
+            return jsonify({
+                'status': 'accepted',
+                'job_id': job_id,
+                'status_url': url_for('api_job_status', job_id=job_id)
+            }), 202
+        
+        search = execute_search(location, radius_km, sort_by, force_refresh=force_refresh)
+        if search.get('error'):
+            flash(search['error'], 'error')
             return render_template('index.html')
-        
-        # Versicherungsmakler in der Nähe suchen
-        brokers = search_insurance_brokers(coordinates, radius_km * 1000)  # Umwandlung km zu m
-        
-        if not brokers:
+        if not search['total']:
             flash('Keine Versicherungsmakler in der angegebenen Region gefunden.', 'info')
             return render_template('index.html')
         
-        # Details für jeden Makler durch Web-Scraping ergänzen
-        enhanced_brokers = []
-        for broker in brokers[:10]:  # Limitierung auf 10 Ergebnisse für Performance
-            try:
-                # Web-Scraping für zusätzliche Details
-                scraped_data = scrape_broker_website(broker.get('website', ''))
-                
-                # Daten zusammenführen
-                enhanced_broker = {
-                    'name': broker.get('name', 'Unbekannt'),
-                    'address': broker.get('formatted_address', 'Unbekannt'),
-                    'phone': broker.get('formatted_phone_number', scraped_data.get('phone', 'Nicht verfügbar')),
-                    'website': broker.get('website', 'Nicht verfügbar'),
-                    'email': scraped_data.get('email', 'Nicht verfügbar'),
-                    'contact_person': scraped_data.get('contact_person', 'Nicht verfügbar'),
-                    'rating': broker.get('rating', 0),
-                    'user_ratings_total': broker.get('user_ratings_total', 0),
-                    'place_id': broker.get('place_id', ''),
-                    'search_location': location,
-                    'search_radius': radius_km,
-                    'found_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
-                enhanced_brokers.append(enhanced_broker)
-                
-            except Exception as e:
-                logger.warning(f"Fehler beim Scraping für {broker.get('name', 'Unbekannt')}: {str(e)}")
-                # Fallback ohne Scraping-Daten
-                enhanced_broker = {
-                    'name': broker.get('name', 'Unbekannt'),
-                    'address': broker.get('formatted_address', 'Unbekannt'),
-                    'phone': broker.get('formatted_phone_number', 'Nicht verfügbar'),
-                    'website': broker.get('website', 'Nicht verfügbar'),
-                    'email': 'Nicht verfügbar',
-                    'contact_person': 'Nicht verfügbar',
-                    'rating': broker.get('rating', 0),
-                    'user_ratings_total': broker.get('user_ratings_total', 0),
-                    'place_id': broker.get('place_id', ''),
-                    'search_location': location,
-                    'search_radius': radius_km,
-                    'found_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                enhanced_brokers.append(enhanced_broker)
-        
-        # Suchergebnisse in Session speichern für Excel-Export
-        session['last_search_results'] = enhanced_brokers
-        session['last_search_params'] = {
-            'location': location,
-            'radius': radius_km,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        logger.info(f"Gefunden: {len(enhanced_brokers)} Versicherungsmakler")
-        
-        return render_template('results.html', 
-                             brokers=enhanced_brokers, 
-                             location=location, 
-                             radius=radius_km)
+        # Aus dem Cache kann eine Suche kommen, deren erste Seite noch per Stream angereichert wird
+        return render_search_results(search['result_id'], search['brokers'], search['params'], search['total'],
+                                     stream=not search['brokers'])
         
     except ValueError:
         flash('Ungültiger Radius. Bitte geben Sie eine Zahl ein.', 'error')
-        return render_template('index.html')
+        return render_template('index.html'), 400
     except Exception as e:
         logger.error(f"Fehler bei der Maklersuche: {str(e)}")
         flash('Ein Fehler ist aufgetreten. Bitte versuchen Sie es später erneut.', 'error')
         return render_template('index.html')
 
 
+def validate_batch_params(locations, radius_km, sort_by):
+    """Prüft die Eingaben einer Sammelsuche und liefert eine Fehlermeldung oder None."""
+    if not locations:
+        return 'Bitte geben Sie mindestens eine Postleitzahl oder einen Ort ein.'
+    if len(locations) > BATCH_SEARCH_MAX_LOCATIONS:
+        return f'Höchstens {BATCH_SEARCH_MAX_LOCATIONS} Orte pro Sammelsuche.'
+    if radius_km < 1 or radius_km > 100:
+        return 'Der Radius muss zwischen 1 und 100 km liegen.'
+    if sort_by not in SORT_OPTIONS:
+        return f"Ungültige Sortierung, erlaubt: {', '.join(SORT_OPTIONS)}"
+    return None
+
+
+def submit_batch_job(locations, radius_km, sort_by):
+    """Startet eine Sammelsuche als Hintergrundjob; Antwort 202 mit Job-ID oder 503."""
+    job_id = get_job_runner().submit(
+        'batch_search',
+        {'locations': locations, 'radius': radius_km, 'sort': sort_by},
+        lambda job: run_batch_search(locations, radius_km, sort_by, job.stage)
+    )
+    if not job_id:
+        return jsonify({
+            'status': 'error',
+            'message': 'Zu viele laufende Suchen. Bitte in Kürze erneut versuchen.'
+        }), 503
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job_id,
+        'status_url': url_for('api_job_status', job_id=job_id)
+    }), 202
+
+
+@app.route('/batch', methods=['GET', 'POST'])
+@admission_control(
+    quota_cost=lambda: min(len(parse_locations(request.form.get('locations', ''))), BATCH_SEARCH_MAX_LOCATIONS),
+    methods=('POST',),
+    page=lambda: render_template('batch.html', max_locations=BATCH_SEARCH_MAX_LOCATIONS)
+)
+def batch_search():
+    """Sammelsuche über mehrere Postleitzahlen/Orte mit einer gemeinsamen Ergebnisliste"""
+    if request.method == 'GET':
+        return render_template('batch.html', max_locations=BATCH_SEARCH_MAX_LOCATIONS)
+    
+    try:
+        locations = parse_locations(request.form.get('locations', ''))
+        radius_km = int(request.form.get('radius', 10))
+        sort_by = request.form.get('sort', 'distance')
+        error = validate_batch_params(locations, radius_km, sort_by)
+        if error:
+            if request.form.get('mode') == 'job':
+                return jsonify({'status': 'error', 'message': error}), 400
+            flash(error, 'error')
+            return render_template('batch.html', max_locations=BATCH_SEARCH_MAX_LOCATIONS), 400
+        
+        logger.info(f"Sammelsuche über {len(locations)} Orte im Umkreis von {radius_km}km")
+        
+        if request.form.get('mode') == 'job':
+            return submit_batch_job(locations, radius_km, sort_by)
+        
+        search = run_batch_search(locations, radius_km, sort_by)
+        if not search['total']:
+            flash('Keine Versicherungsmakler in den angegebenen Regionen gefunden.', 'info')
+            return render_template('batch.html', max_locations=BATCH_SEARCH_MAX_LOCATIONS)
+        # Erste Seite wird auf der Ergebnisseite per Stream angereichert
+        return render_search_results(search['result_id'], [], search['params'], search['total'], stream=True)
+        
+    except ValueError:
+        flash('Ungültiger Radius. Bitte geben Sie eine Zahl ein.', 'error')
+        return render_template('batch.html', max_locations=BATCH_SEARCH_MAX_LOCATIONS), 400
+    except Exception as e:
+        logger.error(f"Fehler bei der Sammelsuche: {str(e)}")
+        flash('Ein Fehler ist aufgetreten. Bitte versuchen Sie es später erneut.', 'error')
+        return render_template('batch.html', max_locations=BATCH_SEARCH_MAX_LOCATIONS)
+
+
+@app.route('/results/<result_id>', methods=['GET'])
+def show_results(result_id):
+    """Ergebnisseite einer abgeschlossenen Suche (Ziel nach einem Suchjob)"""
+    result_set = get_result_set(result_id)
+    if not result_set:
+        flash('Ergebnisse nicht mehr verfügbar. Bitte erneut suchen.', 'warning')
+        return render_template('index.html')
+    # Noch nicht angereicherte erste Seite wird auf der Ergebnisseite per Stream aufgebaut
+    brokers = get_result_page(result_id, 1)
+    return render_search_results(result_id, brokers or [], result_set['params'],
+                                 len(result_set['candidates']), stream=brokers is None)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """Status, Abschnitt und Zwischenergebnisse eines Suchjobs"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({
+            'status': 'error',
+            'message': 'Suchjob unbekannt oder abgelaufen'
+        }), 404
+    
+    result = job['result'] or {}
+    response = {
+        'status': job['status'],
+        'job_id': job['id'],
+        'stage': job['stage'],
+        'stages': JOB_STAGES,
+        'progress': job['progress'],
+        'params': job['params'],
+        'partial': job['partial'] or []
+    }
+    if job['status'] == 'error':
+        response['message'] = job['error']
+    elif job['status'] == 'done':
+        response['total'] = result.get('total', 0)
+        if result.get('batch'):
+            response['batch'] = result['batch']
+        if result.get('error'):
+            response['message'] = result['error']
+        elif result.get('result_id'):
+            response['results_url'] = url_for('show_results', result_id=result['result_id'])
+            # Einstieg für die Such-API (/api/search?cursor=...)
+            response['cursor'] = encode_cursor(result['result_id'], 0)
+        else:
+            response['message'] = 'Keine Versicherungsmakler in der angegebenen Region gefunden.'
+    return jsonify(response)
+
+
+@app.route('/api/results/<result_id>', methods=['GET'])
+@admission_control()
+def api_result_page(result_id):
+    """Liefert eine Ergebnisseite einer Suche; Details und Scraping erfolgen erst beim ersten Abruf"""
+    try:
+        page = max(1, request.args.get('page', 1, type=int))
+        result_set = get_result_set(result_id)
+        brokers = enrich_result_page(result_id, page) if result_set else None
+        if brokers is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Ergebnisse nicht mehr verfügbar. Bitte erneut suchen.'
+            }), 404
+        
+        total = len(result_set['candidates'])
+        offset = (page - 1) * RESULTS_PAGE_SIZE
+        # Neue Makler eines Uploads haben eine eigene Kartenansicht
+        cards = '_upload_broker_cards.html' if result_set['params'].get('source') == 'upload' else '_broker_cards.html'
+        
+        return jsonify({
+            'status': 'success',
+            'page': page,
+            'offset': offset,
+            'total': total,
+            'has_more': offset + len(brokers) < total,
+            'brokers': brokers,
+            'html': render_template(cards, brokers=brokers, offset=offset)
+        })
+        
+    except Exception as e:
+        logger.error(f"Fehler beim Laden der Ergebnisseite: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Ergebnisseite konnte nicht geladen werden'
+        }), 500
+
+
+@app.route('/api/results/<result_id>/stream', methods=['GET'])
+@admission_control()
+def api_result_stream(result_id):
+    """
+    Server-Sent Events für eine Ergebnisseite: jeder Makler erscheint, sobald
+    seine Place Details vorliegen ('broker'), E-Mail und Ansprechpartner folgen
+    nach dem Scraping ('update'), zum Schluss kommt eine Zusammenfassung ('summary').
+    """
+    page = max(1, request.args.get('page', 1, type=int))
+    if not get_result_set(result_id):
+        return jsonify({
+            'status': 'error',
+            'message': 'Ergebnisse nicht mehr verfügbar. Bitte erneut suchen.'
+        }), 404
+    
+    def generate():
+        for event, data in stream_result_page(result_id, page, 'api_result_stream'):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            if 'broker' in data:
+                data['html'] = render_template('_broker_cards.html', brokers=[data['broker']], offset=data['index'])
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Nginx soll die Ereignisse nicht puffern
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/search', methods=['GET'])
+@admission_control(quota_cost=lambda: 0 if request.args.get('cursor') else 1)
+def api_search():
+    """
+    Maklersuche als JSON mit Cursor-Paging.
+    
+    Der erste Aufruf (location, radius, optional sort) legt die serverseitige
+    Ergebnismenge an bzw. nutzt den Suchergebnis-Cache; Folgeseiten werden nur
+    über den Cursor abgerufen und dabei erst angereichert.
+    """
+    try:
+        limit = min(max(1, request.args.get('limit', RESULTS_PAGE_SIZE, type=int)), API_SEARCH_MAX_LIMIT)
+        cursor = request.args.get('cursor', '').strip()
+        
+        if cursor:
+            position = decode_cursor(cursor)
+            if not position:
+                return jsonify({'status': 'error', 'message': 'Ungültiger Cursor'}), 400
+            result_id, offset = position
+        else:
+            location = request.args.get('location', '').strip()
+            try:
+                radius_km = int(request.args.get('radius', '10'))
+            except ValueError:
+                return jsonify({'status': 'error', 'message': 'Ungültiger Radius'}), 400
+            sort_by = request.args.get('sort', 'distance')
+            if not location:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Parameter location (Postleitzahl oder Ort) fehlt'
+                }), 400
+            if radius_km < 1 or radius_km > 100:
+                return jsonify({'status': 'error', 'message': 'Der Radius muss zwischen 1 und 100 km liegen.'}), 400
+            if sort_by not in SORT_OPTIONS:
+                return jsonify({
+                    'status': 'error',
+                    'message': f"Ungültige Sortierung, erlaubt: {', '.join(SORT_OPTIONS)}"
+                }), 400
+            
+            # Ohne Anreicherung der ersten Seite: die angefragte Seite wird unten angereichert
+            search = execute_search(location, radius_km, sort_by, stream=True,
+                                    force_refresh=request.args.get('refresh') == '1')
+            if search.get('error'):
+                return jsonify({'status': 'error', 'message': search['error']}), 404
+            if not search['total']:
+                return jsonify({
+                    'status': 'success',
+                    'location': search['location'],
+                    'total': 0,
+                    'count': 0,
+                    'brokers': [],
+                    'next_cursor': None
+                })
+            result_id, offset = search['result_id'], 0
+        
+        result_set = get_result_set(result_id)
+        brokers = enrich_result_slice(result_id, offset, limit) if result_set else None
+        if brokers is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Ergebnisse abgelaufen. Bitte Suche ohne Cursor neu starten.'
+            }), 410
+        
+        params = result_set['params']
+        total = len(result_set['candidates'])
+        next_offset = offset + len(brokers)
+        return jsonify({
+            'status': 'success',
+            'result_id': result_id,
+            'location': params['location'],
+            'radius': params['radius'],
+            'sort': params.get('sort'),
+            'searched_at': params.get('timestamp'),
+            'total': total,
+            'offset': offset,
+            'count': len(brokers),
+            'brokers': brokers,
+            'next_cursor': encode_cursor(result_id, next_offset) if brokers and next_offset < total else None
+        })
+        
+    except Exception as e:
+        logger.error(f"Fehler in der Such-API: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Suche fehlgeschlagen'
+        }), 500
+
+
+@app.route('/api/search/batch', methods=['POST'])
+@admission_control(quota_cost=lambda: min(
+    len(parse_locations((request.get_json(silent=True) or {}).get('locations'))), BATCH_SEARCH_MAX_LOCATIONS
+))
+def api_batch_search():
+    """
+    Sammelsuche als JSON-API: {"locations": [...], "radius": 10, "sort": "distance"}.
+    
+    Läuft als Hintergrundjob; nach Abschluss liefert /api/jobs/<id> den
+    Cursor für /api/search, über den die gemeinsame Ergebnisliste seitenweise
+    (und erst dann angereichert) abgerufen wird.
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        radius_km = int(payload.get('radius', 10))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Ungültiger Radius'}), 400
+    locations = parse_locations(payload.get('locations'))
+    sort_by = payload.get('sort', 'distance')
+    error = validate_batch_params(locations, radius_km, sort_by)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    return submit_batch_job(locations, radius_km, sort_by)
+
+
+@app.route('/api/locations/suggest', methods=['GET'])
+def api_location_suggest():
+    """Autovervollständigung für PLZ und Ortsnamen aus dem In-Memory-Index (ohne Google)"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(1, request.args.get('limit', 10, type=int)), 20)
+    if len(query) < 2:
+        return jsonify({'status': 'success', 'query': query, 'suggestions': []})
+    return jsonify({
+        'status': 'success',
+        'query': query,
+        'suggestions': get_localities().suggest(query, limit)
+    })
+
+
+@app.route('/api/metrics/google', methods=['GET'])
+def api_google_metrics():
+    """Google-API-Aufrufe, Latenzen und geschätzte Kosten als JSON"""
+    try:
+        days = min(max(1, request.args.get('days', 1, type=int)), 90)
+        snapshot = get_metrics().snapshot(days)
+        snapshot['keywords'] = get_keyword_planner().summary()
+        return jsonify(dict(snapshot, status='success'))
+    except Exception as e:
+        logger.error(f"Fehler beim Lesen der Google-API-Metriken: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Metriken konnten nicht gelesen werden'
+        }), 500
+
+
+@app.route('/api/metrics/admission', methods=['GET'])
+def api_admission_metrics():
+    """Auslastung der Zulassungskontrolle: aktive und wartende Requests, Abweisungen"""
+    try:
+        days = min(max(1, request.args.get('days', 1, type=int)), 90)
+        return jsonify({
+            'status': 'success',
+            'pools': {name: get_admission(name).snapshot() for name in ADMISSION_POOLS},
+            'client_quota': get_client_quota().snapshot(),
+            'rejections': dict(get_metrics().counters(days, 'admission_'),
+                               **get_metrics().counters(days, 'client_quota_')),
+            'worker_pid': os.getpid()
+        })
+    except Exception as e:
+        logger.error(f"Fehler beim Lesen der Zulassungsmetriken: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Metriken konnten nicht gelesen werden'
+        }), 500
+
+
+def _format_stored_broker(broker):
+    """Makler aus dem Bestand für JSON-Antworten (Zeitstempel lesbar)."""
+    broker = dict(broker)
+    for field in ('first_seen', 'last_seen', 'last_details', 'last_scraped'):
+        if broker.get(field):
+            broker[field] = datetime.fromtimestamp(broker[field]).strftime('%Y-%m-%d %H:%M:%S')
+    return broker
+
+
 @app.route('/api/brokers', methods=['GET'])
 def api_get_brokers():
-    """API Endpoint um alle gefundenen Makler als JSON zu erhalten"""
-    # Hier könnte man eine Datenbank abfragen oder Session-Daten verwenden
-    # Für diese Demo geben wir ein Beispiel zurück
+    """
+    Abfrage des Makler-Bestands ohne Google- oder Scraping-Aufrufe.
+    
+    Filter: plz (Präfix), bbox=min_lat,min_lng,max_lat,max_lng oder
+    lat/lng/radius (km), min_rating, has_email, min_quality (0-5).
+    Sortierung: name, rating, last_seen oder distance (mit lat/lng).
+    Paging über cursor (next_cursor der vorigen Antwort).
+    """
+    store = get_broker_store()
+    if not store:
+        return jsonify({'status': 'error', 'message': 'Makler-Bestand ist deaktiviert'}), 503
+    
+    try:
+        filters = parse_query_args(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    sort = request.args.get('sort', 'distance' if filters.get('center') else 'name')
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 200)
+    after = None
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        after = decode_query_cursor(cursor, sort)
+        if after is None:
+            return jsonify({'status': 'error', 'message': 'Ungültiger Cursor'}), 400
+    
+    try:
+        brokers, next_after = store.query(sort=sort, limit=limit, after=after, **filters)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    return jsonify({
+        'status': 'success',
+        'sort': sort,
+        'count': len(brokers),
+        'brokers': [_format_stored_broker(broker) for broker in brokers],
+        'next_cursor': encode_query_cursor(sort, next_after) if next_after else None
+    })
+
+
+@app.route('/api/brokers/search', methods=['GET'])
+def api_search_brokers():
+    """
+    Volltextsuche im Makler-Bestand nach Firmenname, Ansprechpartner, Straße oder Website.
+    
+    Liefert die Treffer nach Relevanz mit markierten Fundstellen (highlights).
+    """
+    store = get_broker_store()
+    if not store:
+        return jsonify({'status': 'error', 'message': 'Makler-Bestand ist deaktiviert'}), 503
+    
+    text = request.args.get('q', '').strip()
+    if not fts_query(text):
+        return jsonify({
+            'status': 'error',
+            'message': f'Suchbegriff mit mindestens {FTS_MIN_TOKEN} Zeichen erforderlich'
+        }), 400
+    limit = min(max(1, request.args.get('limit', 20, type=int)), 100)
+    
+    brokers = store.search(text, limit=limit)
     return jsonify({
         'status': 'success',
-        'message': 'Verwenden Sie das Suchformular, um Makler zu finden.',
-        'brokers': []
+        'query': text,
+        'count': len(brokers),
+        'brokers': [_format_stored_broker(broker) for broker in brokers]
     })
 
 
@@ -397,6 +1001,7 @@ def api_config():
         return jsonify({'error': 'Konfiguration nicht verfügbar'}), 500
 
 @app.route('/api/test-connection', methods=['POST'])
+@admission_control('forward')
 def test_api_connection():
     """Test der aktuellen API-Verbindung"""
     try:
@@ -445,6 +1050,7 @@ def test_api_connection():
 
 
 @app.route('/api/forward', methods=['POST'])
+@admission_control('forward')
 def api_forward():
     """Empfängt einen Broker-Datensatz und leitet ihn an die konfigurierte externe API weiter."""
     try:
@@ -478,13 +1084,41 @@ def api_forward():
         }), 500
 
 
+def load_export_data():
+    """
+    Liest die zu exportierenden Makler aus dem serverseitigen Ergebnis-Store.
+
+    Mit ?source=upload das letzte Upload-Ergebnis (neue und bestehende Makler),
+    sonst die letzte Suche. Noch nicht angezeigte Ergebnisseiten werden vor dem
+    Export angereichert (höchstens EXPORT_MAX_BROKERS Makler).
+
+    Returns:
+        tuple: (Makler, Suchparameter, Upload-Ergebnis oder None); Makler leer, wenn nichts vorliegt
+    """
+    if request.args.get('source') == 'upload':
+        upload = get_upload_results(session.get('upload_result_id'))
+        if not upload:
+            return [], {}, None
+        new_brokers = []
+        if upload.get('result_id'):
+            new_brokers = enrich_result_slice(upload['result_id'], 0, EXPORT_MAX_BROKERS) or []
+        brokers = [dict(b, source='Neu gefunden') for b in new_brokers] + \
+                  [dict(b, source='Excel-Upload') for b in upload['existing_brokers']]
+        return brokers, upload['search_params'], upload
+
+    result_id = session.get('last_search_id')
+    brokers = (enrich_result_slice(result_id, 0, EXPORT_MAX_BROKERS) or []) if result_id else []
+    result_set = get_result_set(result_id) if brokers else None
+    return brokers, (result_set or {}).get('params', {}), None
+
+
 @app.route('/export/excel', methods=['GET'])
+@admission_control()
 def export_excel():
     """Excel-Export der letzten Suchergebnisse"""
     try:
-        # Suchergebnisse aus Session abrufen
-        brokers = session.get('last_search_results', [])
-        search_params = session.get('last_search_params', {})
+        # Suchergebnisse aus dem Ergebnis-Store (Session enthält nur die ID)
+        brokers, search_params, _ = load_export_data()
         
         if not brokers:
             flash('Keine Suchergebnisse zum Export verfügbar. Führen Sie zuerst eine Suche durch.', 'warning')
@@ -503,10 +1137,12 @@ def export_excel():
             'website': 'Website',
             'rating': 'Bewertung',
             'user_ratings_total': 'Anzahl Bewertungen',
+            'distance_km': 'Entfernung (km)',
             'search_location': 'Suchort',
             'search_radius': 'Suchradius (km)',
             'found_at': 'Gefunden am',
-            'place_id': 'Google Place ID'
+            'place_id': 'Google Place ID',
+            'source': 'Quelle'
         }
         
         df = df.rename(columns=column_mapping)
@@ -514,11 +1150,14 @@ def export_excel():
         # Spalten in gewünschter Reihenfolge
         desired_columns = [
             'Name', 'Ansprechpartner', 'Adresse', 'Telefon', 
-            'E-Mail', 'Website', 'Bewertung', 'Anzahl Bewertungen',
+            'E-Mail', 'Website', 'Bewertung', 'Anzahl Bewertungen', 'Entfernung (km)',
             'Suchort', 'Suchradius (km)', 'Gefunden am', 'Google Place ID'
         ]
+        if 'Quelle' in df.columns:
+            desired_columns.append('Quelle')
         
-        df = df[desired_columns]
+        # reindex statt Auswahl: ältere Ergebnisse ohne Entfernung bleiben exportierbar
+        df = df.reindex(columns=desired_columns)
         
         # Excel-Datei im Speicher erstellen
         output = BytesIO()
@@ -560,10 +1199,12 @@ def export_excel():
                 'F': 30,  # Website
                 'G': 10,  # Bewertung
                 'H': 15,  # Anzahl Bewertungen
-                'I': 20,  # Suchort
-                'J': 15,  # Suchradius
-                'K': 20,  # Gefunden am
-                'L': 25   # Place ID
+                'I': 15,  # Entfernung
+                'J': 20,  # Suchort
+                'K': 15,  # Suchradius
+                'L': 20,  # Gefunden am
+                'M': 25,  # Place ID
+                'N': 15   # Quelle (nur Upload-Export)
             }
             
             for col, width in column_widths.items():
@@ -606,12 +1247,12 @@ def export_excel():
 
 
 @app.route('/export/json', methods=['GET'])
+@admission_control()
 def export_json():
     """JSON-Export der letzten Suchergebnisse"""
     try:
-        # Suchergebnisse aus Session abrufen
-        brokers = session.get('last_search_results', [])
-        search_params = session.get('last_search_params', {})
+        # Suchergebnisse aus dem Ergebnis-Store (Session enthält nur die ID)
+        brokers, search_params, upload = load_export_data()
         
         if not brokers:
             return jsonify({
@@ -629,6 +1270,8 @@ def export_json():
             },
             'brokers': brokers
         }
+        if upload:
+            export_data['duplicates'] = upload['duplicates']
         
         # JSON-Response mit Download-Header
         response = make_response(jsonify(export_data))
@@ -652,6 +1295,7 @@ def export_json():
 
 
 @app.route('/upload', methods=['GET', 'POST'])
+@admission_control(quota_cost=lambda: 1, methods=('POST',), page=lambda: render_template('upload.html'))
 def upload_excel():
     """Excel-Upload für Makler-Listen und erweiterte Suche"""
     if request.method == 'GET':
@@ -661,17 +1305,17 @@ def upload_excel():
         # Datei-Upload prüfen
         if 'file' not in request.files:
             flash('Keine Datei ausgewählt!', 'error')
-            return render_template('upload.html')
+            return render_template('upload.html'), 400
         
         file = request.files['file']
         
         if file.filename == '':
             flash('Keine Datei ausgewählt!', 'error')
-            return render_template('upload.html')
+            return render_template('upload.html'), 400
         
         if not allowed_file(file.filename):
             flash('Nur Excel-Dateien (.xls, .xlsx) sind erlaubt!', 'error')
-            return render_template('upload.html')
+            return render_template('upload.html'), 400
         
         # Suchparameter aus Formular
         location = request.form.get('location', '').strip()
@@ -679,7 +1323,7 @@ def upload_excel():
         
         if not location:
             flash('Bitte geben Sie eine Postleitzahl oder einen Ort für die erweiterte Suche ein.', 'error')
-            return render_template('upload.html')
+            return render_template('upload.html'), 400
         
         # Datei sicher speichern
         filename = secure_filename(file.filename)
@@ -696,12 +1340,12 @@ def upload_excel():
         if existing_brokers is None:
             flash('Fehler beim Lesen der Excel-Datei. Bitte überprüfen Sie das Format.', 'error')
             os.remove(filepath)  # Temporäre Datei löschen
-            return render_template('upload.html')
+            return render_template('upload.html'), 400
         
         if not existing_brokers:
             flash('Keine gültigen Makler-Daten in der Excel-Datei gefunden.', 'warning')
             os.remove(filepath)
-            return render_template('upload.html')
+            return render_template('upload.html'), 400
         
         logger.info(f"{len(existing_brokers)} Makler aus Excel-Datei gelesen")
         
@@ -712,6 +1356,13 @@ def upload_excel():
             os.remove(filepath)
             return render_template('upload.html')
         
+        location = coordinates.get('label', location)
+        
+        record_search(normalize_location(location), location, coordinates, radius_km)
+        
+        # Bestehende Makler verorten (Cache, PLZ offline, Rest parallel über Google)
+        attach_coordinates(existing_brokers, coordinates)
+        
         # Neue Makler in der Zone suchen
         logger.info(f"Suche nach zusätzlichen Maklern in {location} im Umkreis von {radius_km}km")
         new_brokers_raw = search_insurance_brokers(coordinates, radius_km * 1000)
@@ -728,6 +1379,16 @@ def upload_excel():
                 'search_location': location,
                 'search_radius': radius_km
             }
+            session['upload_result_id'] = save_upload_results({
+                'existing_brokers': existing_brokers,
+                'result_id': None,
+                'duplicates': [],
+                'search_params': {
+                    'location': location,
+                    'radius': radius_km,
+                    'timestamp': datetime.now().isoformat()
+                }
+            })
             os.remove(filepath)
             return render_template('upload_results.html', results=results)
         
@@ -738,46 +1399,42 @@ def upload_excel():
         
         logger.info(f"{len(unique_new_brokers)} neue einzigartige Makler gefunden, {len(duplicates)} Duplikate")
         
-        # Detaillierte Informationen für neue Makler scrapen
-        enhanced_new_brokers = []
-        for i, broker in enumerate(unique_new_brokers[:10]):  # Limit für Performance
-            try:
-                logger.info(f"Scraping Makler {i+1}/{min(len(unique_new_brokers), 10)}: {broker.get('name', 'Unbekannt')}")
-                enhanced_data = scrape_broker_website(broker.get('website', ''))
-                if enhanced_data:
-                    broker.update(enhanced_data)
-                enhanced_new_brokers.append(broker)
-            except Exception as e:
-                logger.warning(f"Scraping für {broker.get('name', 'Unbekannt')} fehlgeschlagen: {str(e)}")
-                enhanced_new_brokers.append(broker)
-        
-        # Ergebnisse in Session speichern für Export
-        session['upload_results'] = {
+        search_params = {
+            'location': location,
+            'radius': radius_km,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        # Neue Makler als Ergebnismenge: erste Seite sofort anreichern, weitere beim Nachladen oder Export
+        result_id = create_result_set(dict(search_params, source='upload'), unique_new_brokers)
+        enhanced_new_brokers = enrich_brokers(unique_new_brokers[:RESULTS_PAGE_SIZE], location, radius_km)
+        save_result_page(result_id, 1, enhanced_new_brokers)
+        
+        # Ergebnisse serverseitig ablegen, in der Session nur die ID für den Export
+        session['upload_result_id'] = save_upload_results({
             'existing_brokers': existing_brokers,
-            'new_brokers': enhanced_new_brokers,
+            'result_id': result_id,
             'duplicates': duplicates,
-            'search_params': {
-                'location': location,
-                'radius': radius_km,
-                'timestamp': datetime.now().isoformat()
-            }
-        }
+            'search_params': search_params
+        })
+        session.pop('upload_results', None)
         
         # Temporäre Datei löschen
         os.remove(filepath)
         
         results = {
             'existing_count': len(existing_brokers),
-            'new_count': len(enhanced_new_brokers),
+            'new_count': len(unique_new_brokers),
             'duplicate_count': len(duplicates),
             'existing_brokers': existing_brokers,
             'new_brokers': enhanced_new_brokers,
+            'result_id': result_id,
             'duplicates': duplicates,
             'search_location': location,
             'search_radius': radius_km
         }
         
-        flash(f'Upload erfolgreich! {len(existing_brokers)} bestehende, {len(enhanced_new_brokers)} neue Makler gefunden.', 'success')
+        flash(f'Upload erfolgreich! {len(existing_brokers)} bestehende, {len(unique_new_brokers)} neue Makler gefunden.', 'success')
         return render_template('upload_results.html', results=results)
         
     except Exception as e:
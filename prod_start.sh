@@ -21,6 +21,7 @@ error()   { echo -e "${RED}[FEHLER]${NC} $*"; }
 APP_MODULE="wsgi:application"       # Gunicorn-Eintrittspunkt (App unter /scraper)
 PORT="443"                 # HTTPS Standard-Port
 WORKERS="3"
+THREADS="4"
 DOMAIN=""
 CERT_FILE=""
 KEY_FILE=""
@@ -34,6 +35,7 @@ Optionen:
   --domain <name>        Pflicht. Domain, für die Zertifikate existieren (Let's Encrypt).
   --port <nr>            Port (Standard: 443 für HTTPS, 8000 für HTTP-Fallback).
   --workers <anzahl>     Gunicorn Worker (Standard: 3).
+  --threads <anzahl>     Threads pro Worker (Standard: 4), damit günstige Seiten neben Suchen antworten.
   --cert <pfad>          Pfad zur Zertifikatsdatei (fullchain.pem). Überschreibt Auto-Suche.
   --key <pfad>           Pfad zur Key-Datei (privkey.pem). Überschreibt Auto-Suche.
   --http                 HTTP-Modus erzwingen (ohne TLS).
@@ -53,6 +55,7 @@ while [[ $# -gt 0 ]]; do
     --domain) DOMAIN="$2"; shift 2;;
     --port) PORT="$2"; shift 2;;
     --workers) WORKERS="$2"; shift 2;;
+    --threads) THREADS="$2"; shift 2;;
     --cert) CERT_FILE="$2"; shift 2;;
     --key) KEY_FILE="$2"; shift 2;;
     --http) HTTP_ONLY="1"; shift;;
@@ -140,10 +143,11 @@ else
 fi
 
 info "Endpoint: $URL_SCHEME://0.0.0.0:$PORT"
-info "Workers:  $WORKERS"
+info "Workers:  $WORKERS (je $THREADS Threads)"
 
 exec gunicorn \
   --workers "$WORKERS" \
+  --threads "$THREADS" \
   --bind 0.0.0.0:"$PORT" \
   ${HTTPS_ARGS[@]:-} \
   "$APP_MODULE"
@@ -0,0 +1,1009 @@
+#!/usr/bin/env python3
+"""
+Test script für den persistenten Place-Details-Cache den räumlichen Suchindex, den Suchbegriff-Planer
+den Suchergebnis-Cache und den Makler-Bestand
+"""
+
+import os
+import sys
+import json
+import math
+import tempfile
+import threading
+import time
+
+# Add the project directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import googlemaps
+
+import utils.storage
+from utils.cache import TTLCache
+from utils.pagination import PageTokenScheduler
+from utils.tiling import plan_tiles
+from utils.geo import offset_point
+from utils.api_metrics import api_scope, get_metrics, instrument
+from utils.place_cache import PlaceDetailsCache
+from utils.geocoding import get_place_details, PLACE_DETAIL_FIELDS, SEARCH_KEYWORDS
+import utils.geocoding as geocoding
+import utils.place_cache as place_cache
+from utils.geohash import encode
+from utils.spatial_cache import SpatialSearchIndex
+import utils.keyword_planner as keyword_planner
+from utils.search_cache import SearchResultCache
+from utils.result_store import (
+    create_result_set, encode_cursor, decode_cursor, save_result_page, get_result_page, save_upload_results,
+    get_result_set
+)
+import utils.result_stream as result_stream
+import utils.refresher as refresher
+import utils.prewarm as prewarm
+from utils.search_cache import cached_search, get_search_cache
+from utils.search_history import record_search
+from utils.batch_search import parse_locations, merge_candidates
+from utils.admission import AdmissionPool, ClientQuota, get_admission, get_client_quota
+from utils.singleflight import SingleFlight
+import utils.jobs as jobs
+from utils.broker_store import (
+    get_broker_store, BrokerStore, parse_plz, website_domain, encode_query_cursor, decode_query_cursor, fts_query
+)
+
+
+# Eigenes Datenverzeichnis, damit keine echten Caches berührt werden
+utils.storage.DATA_DIR = tempfile.mkdtemp(prefix='makler_test_')
+
+
+class FakeGmaps:
+    """Simuliert den Google Maps Client und zählt Details-Aufrufe"""
+
+    def __init__(self):
+        self.calls = []
+
+    def place(self, place_id, fields, language):
+        self.calls.append(list(fields))
+        result = {'rating': 4.2, 'user_ratings_total': 17}
+        if len(fields) > 2:
+            result.update({'name': 'Makler Test GmbH', 'website': 'https://makler.example'})
+        return {'status': 'OK', 'result': result}
+
+
+class FakeNearbyGmaps:
+    """Simuliert die Nearby-Suche: Kreise mit saturated_radius liefern volle Seiten"""
+
+    def __init__(self, saturated_radius, shared_ids=False):
+        self.saturated_radius = saturated_radius
+        self.shared_ids = shared_ids
+        self.requests = []
+
+    def places_nearby(self, location=None, radius=None, keyword=None, page_token=None, **kwargs):
+        if page_token:
+            lat, lng, radius, keyword, page_no = page_token.split('|')
+            lat, lng, radius, page_no = float(lat), float(lng), float(radius), int(page_no)
+        else:
+            (lat, lng), page_no = location, 1
+        self.requests.append({'radius': radius, 'keyword': keyword, 'page': page_no})
+
+        if radius < self.saturated_radius:
+            prefix = f'{lat:.5f},{lng:.5f}'
+            return {'results': [self._place(f'{prefix}-{i}', lat, lng) for i in range(2)]}
+        prefix = 'voll' if self.shared_ids else f'voll-{keyword}'
+        results = [self._place(f'{prefix}-{page_no}-{i}', lat, lng) for i in range(20)]
+        # Auch die letzte Seite trägt ein Token: Google hätte weitere Ergebnisse
+        return {'results': results, 'next_page_token': f'{lat}|{lng}|{radius}|{keyword}|{page_no + 1}'}
+
+    @staticmethod
+    def _place(place_id, lat, lng):
+        return {'place_id': place_id, 'name': place_id, 'geometry': {'location': {'lat': lat, 'lng': lng}}}
+
+
+def fake_enrich_brokers(candidates, location, radius_km, scrape_max_age=None, on_details=None, on_scraped=None):
+    """Ersetzt Place Details und Scraping durch feste Kontaktdaten"""
+    fake_enrich_brokers.calls.append([c['place_id'] for c in candidates])
+    brokers = []
+    for i, candidate in enumerate(candidates):
+        broker = dict(candidate, address=f"Musterstraße {i}, {location}", phone='030 123456',
+                      email='Nicht verfügbar', website='Nicht verfügbar', contact_person='Nicht verfügbar',
+                      rating=4.5, user_ratings_total=12, distance_km=None)
+        if on_details:
+            on_details(i, broker)
+        broker = dict(broker, email=f"{candidate['place_id']}@makler.example")
+        if on_scraped:
+            on_scraped(i, broker)
+        brokers.append(broker)
+    return brokers
+
+
+fake_enrich_brokers.calls = []
+
+
+def test_ttl_cache():
+    """Teste TTL und Verdrängung nach Größe"""
+    print("\n🗄️  Teste TTL-Cache...")
+
+    cache = TTLCache('test_ttl', ttl_seconds=60, max_entries=3)
+    for i in range(5):
+        cache.set(f'key{i}', {'value': i})
+
+    assert cache.get('key4') == {'value': 4}
+    assert cache.get('key4', max_age=-1) is None
+
+    cache.evict()
+    remaining = [i for i in range(5) if cache.get(f'key{i}') is not None]
+    print(f"✅ Nach Verdrängung verbleiben {len(remaining)} Einträge")
+    assert len(remaining) == 3
+
+
+def test_place_details_cache():
+    """Teste, dass wiederholte Details-Abfragen aus dem Cache kommen"""
+    print("\n📍 Teste Place-Details-Cache...")
+
+    place_cache._place_details_cache = PlaceDetailsCache(
+        static_ttl_seconds=3600, volatile_ttl_seconds=3600, max_entries=100
+    )
+    gmaps = FakeGmaps()
+
+    first = get_place_details(gmaps, 'place_1')
+    second = get_place_details(gmaps, 'place_1')
+
+    assert first['name'] == second['name'] == 'Makler Test GmbH'
+    assert second['place_id'] == 'place_1'
+    assert len(gmaps.calls) == 1
+    print("✅ Zweite Abfrage ohne Google-Aufruf beantwortet")
+
+    # Bewertungen veralten früher: nur rating/user_ratings_total nachladen
+    place_cache._place_details_cache.volatile_ttl_seconds = -1
+    third = get_place_details(gmaps, 'place_1')
+    assert gmaps.calls[-1] == ['rating', 'user_ratings_total']
+    assert third['name'] == 'Makler Test GmbH'
+    print("✅ Bewertungen separat aufgefrischt")
+
+    # Andere Feldliste = anderer Cache-Schlüssel
+    get_place_details(gmaps, 'place_1', fields=PLACE_DETAIL_FIELDS[:3])
+    assert len(gmaps.calls) == 3
+
+
+def test_spatial_index():
+    """Teste Geohash und das Finden umfassender Suchkreise"""
+    print("\n🗺️  Teste räumlichen Suchindex...")
+
+    assert encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+    index = SpatialSearchIndex(ttl_seconds=3600)
+    index.register('berlin-25', 52.52, 13.40, 25000)
+    index.register('hamburg-10', 53.55, 9.99, 10000)
+
+    inside = index.find_overlapping(52.53, 13.45, 10000)
+    assert [(c['cache_key'], c['contains']) for c in inside] == [('berlin-25', True)]
+
+    partial = index.find_overlapping(52.52, 13.80, 10000)
+    assert [(c['cache_key'], c['contains']) for c in partial] == [('berlin-25', False)]
+
+    assert index.find_overlapping(48.14, 11.58, 50000) == []
+    print("✅ Enthaltende und überlappende Suchkreise korrekt gefunden")
+
+
+def test_keyword_planner():
+    """Teste das Auslassen ertragsarmer Suchbegriffe"""
+    print("\n🔑 Teste Suchbegriff-Planer...")
+
+    keyword_planner.KEYWORD_EXPLORE_RATE = 0
+    planner = keyword_planner.KeywordPlanner()
+    keywords = ['Makler', 'Berater', 'Agentur']
+    assert planner.plan(50.0, 8.0, keywords) == (keywords, [])
+
+    for _ in range(keyword_planner.KEYWORD_MIN_SAMPLES):
+        planner.record(50.0, 8.0, 5000, {
+            'Makler': {'a', 'b', 'c'},
+            'Berater': {'b', 'd'},
+            'Agentur': {'a', 'b'}
+        }, {'Makler': 1, 'Berater': 1, 'Agentur': 1})
+
+    assert planner.plan(50.01, 8.01, keywords) == (['Makler', 'Berater'], ['Agentur'])
+    assert planner.summary()['keywords']['Berater']['unique_ids'] == keyword_planner.KEYWORD_MIN_SAMPLES
+    print("✅ Begriff ohne eigene Treffer wird ausgelassen, ertragreiche zuerst")
+
+
+def test_search_result_cache():
+    """Teste frische, veraltete und fehlende Einträge im Suchergebnis-Cache"""
+    print("\n🔁 Teste Suchergebnis-Cache...")
+
+    cache = SearchResultCache(fresh_seconds=3600, stale_seconds=86400, max_entries=10)
+    assert cache.lookup('10117 Berlin', 5, 'distance') is None
+
+    result_id = create_result_set({'location': '10117 Berlin', 'radius': 5}, [{'place_id': 'p1'}])
+    cache.store('10117 Berlin', 5, 'distance', result_id, {'lat': 52.5, 'lng': 13.4})
+    entry = cache.lookup(' 10117  berlin ', 5, 'distance')
+    assert entry['result_id'] == result_id and not entry['stale']
+    assert cache.lookup('10117 Berlin', 10, 'distance') is None
+
+    cache.fresh_seconds = 0
+    assert cache.lookup('10117 Berlin', 5, 'distance')['stale']
+    print("✅ Einträge werden über Ort und Radius gefunden und nach der TTL als veraltet markiert")
+
+
+def test_result_cursor():
+    """Teste Cursor der Such-API"""
+    print("\n📑 Teste Cursor für die Such-API...")
+
+    result_id = create_result_set({'location': '10117 Berlin', 'radius': 5}, [])
+    cursor = encode_cursor(result_id, 20)
+    assert decode_cursor(cursor) == (result_id, 20)
+    assert decode_cursor('kein-cursor') is None
+    assert decode_cursor(encode_cursor('../etc', 0)) is None
+    print("✅ Cursor lassen sich lesen, ungültige werden abgewiesen")
+
+
+def test_broker_store():
+    """Teste Upserts und Herkunft im Makler-Bestand"""
+    print("\n🗃️  Teste Makler-Bestand...")
+
+    assert parse_plz('Musterstraße 1, 10117 Berlin, Deutschland') == ('10117', 'Berlin')
+    assert website_domain('https://www.makler.example/kontakt') == 'makler.example'
+
+    store = BrokerStore()
+    broker = {
+        'place_id': 'p1', 'name': 'Makler Test GmbH', 'address': 'Musterstraße 1, 10117 Berlin',
+        'website': 'https://www.makler.example', 'email': 'info@makler.example',
+        'contact_person': 'Nicht verfügbar', 'phone': 'Nicht verfügbar', 'rating': 4.5
+    }
+    sources = {'name': 'places', 'address': 'places', 'website': 'places', 'rating': 'places',
+               'email': 'scrape', 'contact_person': 'scrape', 'scraped': True}
+    assert store.upsert_many([(broker, sources)]) == 1
+
+    # Fehlgeschlagenes Scraping überschreibt die bekannte E-Mail nicht
+    store.upsert_many([(dict(broker, email='Nicht verfügbar', contact_person='Max Muster'), sources)])
+    stored = store.get('p1')
+    assert stored['email'] == 'info@makler.example' and stored['contact_person'] == 'Max Muster'
+    assert stored['plz'] == '10117' and stored['website_domain'] == 'makler.example'
+    assert stored['provenance']['email']['source'] == 'scrape'
+    assert stored['first_seen'] <= stored['last_seen']
+    print("✅ Vorhandene Werte bleiben erhalten, PLZ und Domain werden abgeleitet")
+
+
+def test_broker_query():
+    """Teste Filter und Keyset-Paging von BrokerStore.query()"""
+    print("\n🔎 Teste Abfragen auf den Makler-Bestand...")
+
+    store = BrokerStore('brokers_query.sqlite3')
+    entries = []
+    for i in range(30):
+        entries.append(({
+            'place_id': f'q{i:02d}', 'name': f'Makler {i:02d}',
+            'address': f'Straße {i}, {10100 + i} Berlin' if i < 20 else f'Weg {i}, 80331 München',
+            'email': f'info{i}@makler.example' if i % 3 == 0 else 'Nicht verfügbar',
+            'rating': 3 + (i % 5) * 0.5, 'lat': 52.5 + i * 0.001, 'lng': 13.4
+        }, {'name': 'places', 'address': 'places', 'email': 'scrape', 'rating': 'places',
+            'lat': 'places', 'lng': 'places'}))
+    store.upsert_many(entries)
+
+    brokers, _ = store.query(plz_prefix='101', has_email=True, limit=100)
+    assert {b['place_id'] for b in brokers} == {f'q{i:02d}' for i in range(20) if i % 3 == 0}
+
+    # Seitenweise nach Bewertung: jede ID genau einmal, absteigend sortiert
+    seen, after = [], None
+    while True:
+        page, after = store.query(sort='rating', limit=7, after=after)
+        seen += page
+        if not after:
+            break
+    assert len({b['place_id'] for b in seen}) == len(seen) == 30
+    assert [b['rating'] for b in seen] == sorted((b['rating'] for b in seen), reverse=True)
+
+    nearby, _ = store.query(center=(52.5, 13.4), radius_km=1, sort='distance')
+    assert nearby[0]['place_id'] == 'q00' and all(b['distance_km'] <= 1 for b in nearby)
+
+    # Makler in der Ecke des umschließenden Quadrats liegt außerhalb des Radius, bei jeder Sortierung
+    corner_lng = 13.4 + 0.9 / (111.32 * math.cos(math.radians(52.5)))
+    store.upsert_many([({'place_id': 'q-ecke', 'name': 'Makler Ecke', 'rating': 5.0,
+                         'lat': 52.5 + 0.9 / 111.32, 'lng': corner_lng},
+                        {'name': 'places', 'rating': 'places', 'lat': 'places', 'lng': 'places'})])
+    for sort in ('distance', 'rating', 'name', 'last_seen'):
+        in_radius, _ = store.query(center=(52.5, 13.4), radius_km=1, sort=sort, limit=100)
+        assert 'q-ecke' not in {b['place_id'] for b in in_radius}, sort
+        assert {b['place_id'] for b in in_radius} == {b['place_id'] for b in nearby}, sort
+    # bbox und Umkreis zusammen: Schnittmenge
+    both, _ = store.query(bbox=(52.5045, 13.0, 53.0, 14.0), center=(52.5, 13.4), radius_km=1, sort='rating')
+    assert {b['place_id'] for b in both} == {f'q{i:02d}' for i in range(5, 9)}
+
+    cursor = encode_query_cursor('rating', [4.0, 'q03'])
+    assert decode_query_cursor(cursor, 'rating') == [4.0, 'q03']
+    assert decode_query_cursor(cursor, 'name') is None
+    print("✅ Filter, Sortierung und Cursor funktionieren")
+
+
+def test_broker_query_performance():
+    """Benchmark: Filterkombinationen von BrokerStore.query() auf 100.000 Maklern"""
+    print("\n⚡ Teste Abfragezeiten bei 100.000 Maklern...")
+
+    store = BrokerStore('brokers_benchmark.sqlite3')
+    for start in range(0, 100000, 5000):
+        store.upsert_many([({
+            'place_id': f'b{i:06d}', 'name': f'Makler {i * 7919 % 100000:05d}',
+            'address': f'Straße {i % 200}, {10000 + i % 89999:05d} Ort',
+            'email': f'info{i}@makler.example' if i % 4 == 0 else 'Nicht verfügbar',
+            'phone': '030 123456' if i % 2 == 0 else 'Nicht verfügbar',
+            'rating': (i % 41) / 8.0, 'lat': 47.5 + (i % 997) * 0.0075, 'lng': 6.0 + (i % 991) * 0.0091
+        }, {'name': 'places', 'address': 'places', 'email': 'scrape', 'phone': 'places',
+            'rating': 'places', 'lat': 'places', 'lng': 'places'}) for i in range(start, start + 5000)])
+
+    combinations = [
+        {'plz_prefix': '10', 'has_email': True},
+        {'plz_prefix': '8', 'min_rating': 4.0, 'sort': 'rating'},
+        {'bbox': (50.0, 8.0, 51.0, 9.5), 'sort': 'last_seen'},
+        {'center': (52.5, 13.4), 'radius_km': 25, 'sort': 'distance'},
+        {'center': (48.1, 11.6), 'radius_km': 50, 'min_quality': 3},
+        {'has_email': False, 'min_rating': 2.5},
+        {'min_quality': 4, 'sort': 'rating'},
+        {'sort': 'name'},
+    ]
+    durations = []
+    for filters in combinations:
+        after = None
+        for _ in range(5):
+            begin = time.perf_counter()
+            page, after = store.query(limit=50, after=after, **filters)
+            durations.append(time.perf_counter() - begin)
+            if not after:
+                break
+
+    durations.sort()
+    p95 = durations[int(len(durations) * 0.95) - 1] * 1000
+    print(f"✅ {len(durations)} Abfragen, p95 {p95:.1f} ms")
+    assert p95 < 30
+
+
+def test_broker_search():
+    """Teste die Volltextsuche im Makler-Bestand"""
+    print("\n📝 Teste Volltextsuche...")
+
+    store = BrokerStore('brokers_search.sqlite3')
+    sources = {'name': 'places', 'address': 'places', 'website': 'places', 'contact_person': 'scrape'}
+    store.upsert_many([
+        ({'place_id': 's1', 'name': 'Allianz Generalvertretung', 'address': 'Hauptstraße 5, 10117 Berlin',
+          'website': 'https://www.allianz-berlin.example', 'contact_person': 'Jörg Müller'}, sources),
+        ({'place_id': 's2', 'name': 'Müller & Partner Versicherungsmakler', 'address': 'Gartenweg 1, 80331 München',
+          'website': 'Nicht verfügbar', 'contact_person': 'Nicht verfügbar'}, sources)
+    ])
+
+    assert fts_query('  a "OR" ') == '"or"*' and fts_query('x') is None
+    hits = store.search('mull')
+    assert [b['place_id'] for b in hits] == ['s2', 's1']  # Treffer im Namen wiegen stärker
+    assert hits[0]['highlights']['name'] == '<mark>Müller</mark> &amp; Partner Versicherungsmakler'
+
+    # Umbenennung per Upsert hält den Index aktuell
+    store.upsert_many([({'place_id': 's1', 'name': 'Ergo Agentur Berlin'}, {'name': 'places'})])
+    assert not store.search('allianz generalvertretung')
+    assert [b['place_id'] for b in store.search('ergo berl')] == ['s1']
+    print("✅ Präfixsuche, Gewichtung, Markierung und Index-Aktualisierung funktionieren")
+
+
+def test_refresh_plan():
+    """Teste Auswahl und Priorisierung veralteter Makler"""
+    print("\n♻️  Teste Auffrischungsplan...")
+
+    store = get_broker_store()
+    sources = {'name': 'places', 'website': 'places', 'rating': 'places', 'lat': 'places', 'lng': 'places',
+               'email': 'scrape', 'scraped': True}
+    store.upsert_many([
+        ({'place_id': f'r{i}', 'name': f'Makler {i}', 'website': 'https://makler.example', 'rating': rating,
+          'lat': lat, 'lng': 13.4, 'email': 'info@makler.example'}, sources)
+        for i, (rating, lat) in enumerate([(5.0, 48.1), (3.0, 52.5), (4.0, 52.5), (4.5, 48.1)])
+    ])
+    now = time.time()
+    later = now + refresher.REFRESH_SCRAPE_TTL_HOURS * 3600 + 60
+    assert refresher.due_fields(store.get('r0'), now) == {'details': False, 'rating': False, 'scrape': False}
+    assert refresher.due_fields(store.get('r0'), later) == {'details': False, 'rating': True, 'scrape': True}
+
+    # Gesuchtes Gebiet (Berlin) vor höherer Bewertung, darin nach Bewertung
+    area = {'lat': 52.5, 'lng': 13.4, 'radius_km': 10, 'searches': 3, 'last_searched_at': now}
+    plan = refresher.plan_refresh(now=later, areas=[area])
+    order = [item['broker']['place_id'] for item in plan if item['broker']['place_id'].startswith('r')]
+    assert order == ['r2', 'r1', 'r0', 'r3']
+    print("✅ Fällige Felder und Priorität nach Suchgebiet und Bewertung stimmen")
+
+
+def test_refresh_broker():
+    """Teste, dass nur echte Abrufe Herkunft und Zeitstempel setzen"""
+    print("\n♻️  Teste Auffrischung einzelner Makler...")
+
+    store = get_broker_store()
+    store.upsert_many([
+        ({'place_id': place_id, 'name': 'Makler Alt', 'website': 'https://makler.example', 'rating': 3.0,
+          'email': 'alt@makler.example'},
+         {'name': 'places', 'website': 'places', 'rating': 'places', 'email': 'scrape', 'scraped': True})
+        for place_id in ('rf-scrape', 'rf-cached', 'rf-api')
+    ])
+    before = {place_id: store.get(place_id) for place_id in ('rf-scrape', 'rf-cached', 'rf-api')}
+
+    # Fehlgeschlagenes Scraping: alte Kontaktdaten und last_scraped bleiben
+    original_scrape = refresher.scrape_contacts
+    refresher.scrape_contacts = lambda url, max_age=None: None
+    try:
+        record, sources = refresher.refresh_broker(None, before['rf-scrape'],
+                                                   {'details': False, 'rating': False, 'scrape': True})
+    finally:
+        refresher.scrape_contacts = original_scrape
+    assert 'scraped' not in sources and 'email' not in sources
+    store.upsert_many([(record, sources)], touch_seen=False)
+    after = store.get('rf-scrape')
+    assert after['last_scraped'] == before['rf-scrape']['last_scraped']
+    assert after['email'] == 'alt@makler.example'
+
+    # Details aus dem Place-Details-Cache zählen nicht als Abruf, nur Google-Antworten
+    gmaps = FakeGmaps()
+    cached = {'place_id': 'rf-cached', 'name': 'Makler Cache', 'rating': 4.0, 'user_ratings_total': 3}
+    place_cache.get_place_details_cache().store('rf-cached', PLACE_DETAIL_FIELDS, cached)
+    due = {'details': True, 'rating': True, 'scrape': False}
+    results = [refresher.refresh_broker(gmaps, before[place_id], due) for place_id in ('rf-cached', 'rf-api')]
+    assert len(gmaps.calls) == 1
+    assert results[0][1] == {} and results[1][1]['name'] == 'places'
+    store.upsert_many(results, touch_seen=False)
+    assert store.get('rf-cached')['last_details'] == before['rf-cached']['last_details']
+    assert store.get('rf-cached')['name'] == 'Makler Alt'
+    assert store.get('rf-api')['last_details'] > before['rf-api']['last_details']
+    print("✅ Cache-Treffer und fehlgeschlagenes Scraping lassen Herkunft und Zeitstempel unverändert")
+
+
+def test_batch_merge():
+    """Teste Eingabe und Zusammenführung der Sammelsuche"""
+    print("\n🗺️  Teste Sammelsuche...")
+
+    assert parse_locations('10115\n10117; 10115 ,\n\nPotsdam') == ['10115', '10117', 'Potsdam']
+    assert parse_locations([' 10115', '10115']) == ['10115']
+
+    areas = [
+        {'location': '10115', 'candidates': [{'place_id': 'a', 'distance_km': 3.0}, {'place_id': 'b', 'distance_km': 1.0}]},
+        {'location': '10117', 'candidates': [{'place_id': 'a', 'distance_km': 0.5}, {'place_id': 'c', 'distance_km': 2.0}]}
+    ]
+    merged = {c['place_id']: c for c in merge_candidates(areas)}
+    assert sorted(merged) == ['a', 'b', 'c']
+    assert merged['a']['distance_km'] == 0.5 and merged['a']['search_location'] == '10117'
+    assert merged['a']['search_locations'] == ['10115', '10117']
+    print("✅ Orte werden eindeutig gelesen, Makler nur einmal mit nächstem Suchort übernommen")
+
+
+def test_admission_control():
+    """Teste Slots pro Worker und global, Warteschlange und Client-Kontingent"""
+    print("\n🚦 Teste Zulassungskontrolle...")
+
+    # Zwei Pools auf derselben Datei simulieren zwei Gunicorn-Worker
+    worker_a = AdmissionPool('test', global_limit=1, worker_limit=2, queue_max=1, queue_timeout=0.3)
+    worker_b = AdmissionPool('test', global_limit=1, worker_limit=2, queue_max=1, queue_timeout=0.3)
+    lease = worker_a.acquire('search')
+    assert lease
+    assert worker_b.acquire('search') is None
+    assert worker_b.stats['rejected_timeout'] == 1
+
+    # Wartender Request bekommt den Slot, sobald er frei wird; ein weiterer findet die Warteschlange voll
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(worker_b.acquire('search')))
+    waiter.start()
+    time.sleep(0.1)
+    assert worker_a.acquire('search') is None
+    assert worker_a.stats['rejected_queue_full'] == 1
+    worker_a.release(lease)
+    waiter.join()
+    assert results[0]
+    assert worker_b.snapshot()['global']['active'] == 1
+    worker_b.release(results[0])
+    assert worker_b.snapshot()['global'] == {'limit': 1, 'active': 0, 'waiting': 0}
+    assert 1 <= worker_a.retry_after() <= 60
+    print("✅ Globales Limit über Worker, begrenzte Warteschlange und Freigabe funktionieren")
+
+    quota = ClientQuota(per_minute=6, burst=3)
+    assert quota.take('1.2.3.4', 2) == 0
+    assert quota.take('1.2.3.4', 2) > 0
+    quota.refund('1.2.3.4', 1)
+    assert quota.take('1.2.3.4', 2) == 0
+    assert quota.take('5.6.7.8', 10) == 0, "Sammelsuche darf einen vollen Bucket ins Minus ziehen"
+    assert quota.take('5.6.7.8', 1) >= 70
+    assert quota.snapshot()['limited_clients'] == 2
+    print("✅ Client-Kontingent drosselt und nennt die Wartezeit")
+
+    # Abgewiesene Eingaben (4xx) verbrauchen kein Kontingent
+    import app as webapp
+    client = webapp.app.test_client()
+    for _ in range(get_client_quota().burst + 2):
+        response = client.get('/api/search', environ_base={'REMOTE_ADDR': '10.0.0.9'})
+        assert response.status_code == 400
+    for radius in ('abc', '5.5'):
+        response = client.get(f'/api/search?location=10115&radius={radius}', environ_base={'REMOTE_ADDR': '10.0.0.9'})
+        assert response.status_code == 400 and response.get_json()['message'] == 'Ungültiger Radius'
+    print("✅ Ungültige Anfragen werden dem Kontingent gutgeschrieben")
+
+
+def test_page_token_scheduler():
+    """Teste Token-Wiederholung bei INVALID_REQUEST und das Seitenlimit"""
+    print("\n📄 Teste Seitenplaner...")
+
+    calls = []
+
+    def fetch_page(query, token):
+        calls.append((query['keyword'], token))
+        if token and calls.count((query['keyword'], token)) == 1:
+            # Erster Versuch mit frischem Token: Google meldet das Token als noch nicht aktiv
+            raise googlemaps.exceptions.ApiError('INVALID_REQUEST')
+        page_no = int(token[-1]) + 1 if token else 1
+        results = [{'place_id': f"{query['keyword']}-{page_no}-{i}"} for i in range(20)]
+        return {'results': results, 'next_page_token': f"{query['keyword']}-token-{page_no}"}
+
+    pages = []
+    done = {}
+    scheduler = PageTokenScheduler(fetch_page, max_workers=2, token_delay=0.01, retry_interval=0.01,
+                                   max_pages=3)
+    scheduler.run([{'keyword': 'a'}, {'keyword': 'b'}],
+                  on_page=lambda query, results, page_no: pages.append((query['keyword'], page_no)),
+                  on_done=lambda query, stats: done.update({query['keyword']: dict(stats)}))
+
+    assert sorted(pages) == [('a', 1), ('a', 2), ('a', 3), ('b', 1), ('b', 2), ('b', 3)]
+    assert scheduler.token_retries == 4, "Jedes neue Token wird einmal wiederholt"
+    assert len(calls) == 10
+    assert done['a']['pages'] == 3 and done['a']['results'] == 60
+    assert done['a']['truncated'] and not done['a']['stopped_early']
+    print("✅ Tokens werden wiederholt, die Paginierung endet beim Seitenlimit")
+
+
+def test_saturated_tile_subdivision():
+    """Teste, dass gesättigte Teilkreise verfeinert abgefragt werden"""
+    print("\n🧩 Teste Unterteilung gesättigter Teilkreise...")
+
+    os.environ['PLACES_TOKEN_DELAY'] = '0'
+    os.environ['PLACES_TOKEN_RETRY_INTERVAL'] = '0'
+    fake = FakeNearbyGmaps(saturated_radius=4000)
+    original_client = geocoding.get_maps_client
+    geocoding.get_maps_client = lambda: fake
+    try:
+        candidates = geocoding.search_insurance_brokers({'lat': 51.2, 'lng': 6.8}, 4000)
+    finally:
+        geocoding.get_maps_client = original_client
+
+    first_level = [r for r in fake.requests if r['radius'] == 4000]
+    children = [r for r in fake.requests if r['radius'] < 4000]
+    assert len(first_level) == 3 * len(SEARCH_KEYWORDS), "Jeder Begriff blättert bis zum Seitenlimit"
+    assert len(children) == 7 * len(SEARCH_KEYWORDS), "Gesättigter Kreis wird in sieben Teilkreise zerlegt"
+    assert {r['radius'] for r in children} == {4000 / 2 * 1.1}
+    assert len(candidates) == 60 * len(SEARCH_KEYWORDS) + 7 * 2
+
+    # Alle Begriffe liefern dieselben place_ids: außer dem ersten brechen alle früh ab
+    # und werden nicht unterteilt, weil der erste Begriff ihr Gebiet schon abdeckt
+    fake = FakeNearbyGmaps(saturated_radius=4000, shared_ids=True)
+    geocoding.get_maps_client = lambda: fake
+    try:
+        geocoding.search_insurance_brokers({'lat': 51.3, 'lng': 6.6}, 4000)
+    finally:
+        geocoding.get_maps_client = original_client
+    first_level = [r for r in fake.requests if r['radius'] == 4000]
+    children = [r for r in fake.requests if r['radius'] < 4000]
+    assert len(first_level) < 3 * len(SEARCH_KEYWORDS), "Begriffe ohne neue place_ids blättern nicht weiter"
+    full_keywords = {r['keyword'] for r in first_level if r['page'] == 3}
+    assert len(full_keywords) == 1
+    assert {r['keyword'] for r in children} == full_keywords, "Früh abgebrochene Suchen werden nicht unterteilt"
+    assert len(children) == 7
+    print("✅ Gesättigter Teilkreis wird unterteilt, die Treffer der Teilkreise ergänzt")
+
+
+def test_upload_paging_and_export():
+    """Teste Nachladen neuer Upload-Makler und den Export aller Seiten"""
+    print("\n📤 Teste Upload-Seiten und Export...")
+
+    import app as webapp
+
+    original_enrich = result_stream.enrich_brokers
+    result_stream.enrich_brokers = fake_enrich_brokers
+    try:
+        fake_enrich_brokers.calls = []
+        candidates = [{'place_id': f'upload-{i}', 'name': f'Neuer Makler {i}'} for i in range(25)]
+        params = {'location': 'Köln', 'radius': 10, 'timestamp': '2024-01-01T00:00:00', 'source': 'upload'}
+        result_id = create_result_set(params, candidates)
+        save_result_page(result_id, 1, fake_enrich_brokers(candidates[:10], 'Köln', 10))
+        upload_id = save_upload_results({
+            'existing_brokers': [{'name': 'Bestandsmakler', 'address': 'Domplatz 1, Köln'}],
+            'result_id': result_id,
+            'duplicates': [],
+            'search_params': params
+        })
+
+        client = webapp.app.test_client()
+        with client.session_transaction() as session:
+            session['upload_result_id'] = upload_id
+
+        page = client.get(f'/api/results/{result_id}?page=2').get_json()
+        assert page['status'] == 'success' and page['offset'] == 10 and page['has_more']
+        assert [b['name'] for b in page['brokers']] == [f'Neuer Makler {i}' for i in range(10, 20)]
+        assert 'Neuer Makler 10' in page['html'] and 'upload-10@makler.example' in page['html']
+
+        export = client.get('/export/json?source=upload')
+        assert export.status_code == 200
+        brokers = json.loads(export.data)['brokers']
+        assert [b['name'] for b in brokers if b['source'] == 'Neu gefunden'] == [c['name'] for c in candidates]
+        assert all(b['email'].endswith('@makler.example') for b in brokers if b['source'] == 'Neu gefunden')
+        assert [b['name'] for b in brokers if b['source'] == 'Excel-Upload'] == ['Bestandsmakler']
+        assert len(get_result_page(result_id, 3)) == 5
+        assert fake_enrich_brokers.calls[1:] == [[f'upload-{i}' for i in range(10, 20)],
+                                                 [f'upload-{i}' for i in range(20, 25)]], \
+            "Seite 1 und 2 werden beim Export nicht erneut angereichert"
+    finally:
+        result_stream.enrich_brokers = original_enrich
+
+    print("✅ Weitere Upload-Seiten werden nachgeladen, der Export reichert fehlende Seiten an")
+
+
+def test_api_call_metrics():
+    """Teste die Zählung von Google-Aufrufen und Kosten pro Route und Request"""
+    print("\n💰 Teste Google-API-Metriken...")
+
+    class FakeClient:
+        def geocode(self, address, **kwargs):
+            return [{'geometry': {'location': {'lat': 50.0, 'lng': 8.0}}}]
+
+        def place(self, place_id, **kwargs):
+            return {'status': 'OK', 'result': {}}
+
+        def places_nearby(self, page_token=None, **kwargs):
+            raise googlemaps.exceptions.ApiError('INVALID_REQUEST')
+
+    metrics = get_metrics()
+    with api_scope('metrics_test_search') as scope:
+        client = instrument(FakeClient())
+        client.geocode('Köln')
+        client.place('p1')
+        client.place('p2')
+        try:
+            client.places_nearby(page_token='unreif')
+        except googlemaps.exceptions.ApiError:
+            pass
+    with api_scope('metrics_test_export'):
+        instrument(FakeClient()).place('p3')
+
+    summary = metrics.request_summary(scope['request_id'])
+    assert summary['route'] == 'metrics_test_search'
+    assert summary['calls'] == {'geocode': 1, 'place': 2, 'places_nearby': 1}
+    assert summary['billable'] == {'geocode': 1, 'place': 2}
+    assert summary['errors'] == 1
+    assert summary['estimated_cost_usd'] == round((5.0 + 2 * 17.0) / 1000, 4)
+
+    routes = metrics.snapshot()['routes']
+    assert routes['metrics_test_search']['calls'] == {'geocode': 1, 'place': 2, 'places_nearby': 1}
+    assert routes['metrics_test_search']['billable_calls']['places_nearby'] == 0, \
+        "Unreife Page-Tokens kosten nichts"
+    assert routes['metrics_test_export']['calls'] == {'place': 1}
+    assert routes['metrics_test_export']['estimated_cost_usd'] == round(17.0 / 1000, 4)
+    print("✅ Aufrufe, Fehler und Kosten werden pro Route und Request getrennt gezählt")
+
+
+def test_prewarm_fills_search_cache():
+    """Teste, dass das Vorwärmen die nächste Suche zum Cache-Treffer macht"""
+    print("\n🔥 Teste Vorwärmen...")
+
+    coordinates = {'lat': 49.4875, 'lng': 8.4660, 'label': '68159 Mannheim'}
+    for _ in range(3):
+        record_search('68159 mannheim', '68159 Mannheim', coordinates, 7, 'rating')
+
+    geocoded = []
+    candidates = [{'place_id': f'warm-{i}', 'name': f'Makler {i}'} for i in range(12)]
+    patched = {
+        'get_coordinates': lambda location, max_age=None: geocoded.append(max_age) or coordinates,
+        'search_insurance_brokers': lambda coords, radius_m, sort_by, max_age=None: candidates,
+        'enrich_brokers': fake_enrich_brokers
+    }
+    originals = {name: getattr(prewarm, name) for name in patched}
+    for name, replacement in patched.items():
+        setattr(prewarm, name, replacement)
+    try:
+        assert cached_search('68159 Mannheim', coordinates, 7, 'rating') is None
+        report = prewarm.prewarm(limit=5, budget=1000)
+    finally:
+        for name, original in originals.items():
+            setattr(prewarm, name, original)
+
+    assert report['warmed'] == 1
+    assert geocoded and geocoded[0] == prewarm.get_geocode_cache().ttl_seconds * prewarm.PREWARM_REFRESH_FRACTION
+    cached = cached_search('68159 Mannheim', coordinates, 7, 'rating')
+    assert cached and not cached['cache_stale']
+    assert cached['total'] == 12 and len(cached['brokers']) == 10
+    assert cached['brokers'][0]['email'] == 'warm-0@makler.example'
+    print("✅ Vorgewärmtes Gebiet liefert bei der nächsten Suche einen Cache-Treffer")
+
+
+def test_gps_search_uses_typed_cache():
+    """Teste, dass eingerastete GPS-Suchen den Suchergebnis-Cache der getippten PLZ nutzen"""
+    print("\n📍 Teste GPS-Suche über den Cache der PLZ...")
+
+    import app as webapp
+
+    gps = geocoding.get_coordinates('52.5206, 13.4098')
+    typed = geocoding.get_coordinates('10178 Berlin')
+    snapped_radius = 3 + math.ceil(gps['snap']['distance_km'])
+
+    def place(place_id, distance_m, bearing):
+        lat, lng = offset_point(gps['lat'], gps['lng'], distance_m, bearing)
+        return {'place_id': place_id, 'name': place_id, 'geometry': {'location': {'lat': lat, 'lng': lng}}}
+
+    candidates = [place('gps-nah', 1000, 0), place('gps-rand', 2800, 90), place('gps-fern', 3600, 180)]
+    result_id = create_result_set({'location': '10178 Berlin', 'radius': snapped_radius, 'sort': 'distance'},
+                                  candidates)
+    get_search_cache().store('10178 Berlin', snapped_radius, 'distance', result_id, typed)
+
+    calls = []
+    original_client = geocoding.get_maps_client
+    geocoding.get_maps_client = lambda: calls.append(1)
+    try:
+        search = webapp.execute_search('52.5206, 13.4098', 3, 'distance', stream=True)
+    finally:
+        geocoding.get_maps_client = original_client
+    assert not calls, "Treffer im Suchergebnis-Cache ruft Google nicht auf"
+    assert search['location'] == '10178 Berlin' and search['result_id'] != result_id
+    narrowed = get_result_set(search['result_id'])
+    assert [c['place_id'] for c in narrowed['candidates']] == ['gps-nah', 'gps-rand']
+    assert narrowed['candidates'][0]['distance_km'] == 1.0 and narrowed['params']['radius'] == 3
+
+    # Ohne Cache-Eintrag landet die GPS-Suche unter dem Schlüssel der getippten PLZ
+    os.environ['PLACES_TOKEN_DELAY'] = '0'
+    geocoding.get_maps_client = lambda: FakeNearbyGmaps(saturated_radius=10 ** 6)
+    try:
+        webapp.execute_search('52.5206, 13.4098', 2, 'distance', stream=True)
+    finally:
+        geocoding.get_maps_client = original_client
+    assert cached_search('10178 Berlin', typed, 2 + math.ceil(gps['snap']['distance_km']), 'distance')
+    print("✅ GPS-Suche nutzt die Ergebnisliste der PLZ und filtert um die GPS-Position")
+
+
+def test_single_flight():
+    """Teste das Zusammenfassen identischer gleichzeitiger Aufrufe"""
+    print("\n🛫 Teste Single-Flight...")
+
+    calls = []
+
+    def slow_search():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return {'result_id': 'abc', 'total': 3}
+
+    def run_pair(flight_a, flight_b, key):
+        results = []
+        threads = [threading.Thread(target=lambda f=f: results.append(f.do(key, slow_search)))
+                   for f in (flight_a, flight_b)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        return results
+
+    # Zwei Threads desselben Workers
+    flight = SingleFlight(timeout=5)
+    assert run_pair(flight, flight, 'search|köln') == [{'result_id': 'abc', 'total': 3}] * 2
+    assert len(calls) == 1
+    assert flight.stats == {'leader': 1, 'shared_local': 1, 'shared_worker': 0}
+
+    # Zwei Worker (eigene Instanzen) teilen sich das Ergebnis über Lock-Datei und Store
+    calls.clear()
+    worker_a, worker_b = SingleFlight(timeout=5), SingleFlight(timeout=5)
+    assert run_pair(worker_a, worker_b, 'search|bonn') == [{'result_id': 'abc', 'total': 3}] * 2
+    assert len(calls) == 1
+    assert worker_b.stats['shared_worker'] == 1
+
+    lock_dir = os.path.dirname(worker_a._lock_path('search|bonn'))
+    assert os.listdir(lock_dir) == [], "Lock-Dateien werden nach dem Lauf gelöscht"
+    print("✅ Identische Aufrufe rechnen einmal, Lock-Dateien bleiben nicht liegen")
+
+
+def test_partial_spatial_reuse():
+    """Teste, dass eine teilweise überlappende frühere Suche Teilkreise einspart"""
+    print("\n🧭 Teste teilweise Wiederverwendung früherer Suchkreise...")
+
+    center = (50.0, 10.0)
+    tiles = plan_tiles(center[0], center[1], 80000)
+    lat, lng = offset_point(center[0], center[1], 70000, 90)
+    earlier = [{'place_id': 'frueher-1', 'name': 'Makler Ost'}]
+
+    index = SpatialSearchIndex(ttl_seconds=3600, db_file='spatial_partial_test.sqlite3')
+    index.register('osten-90', lat, lng, 90000)
+    overlapping = index.find_overlapping(center[0], center[1], 80000)
+    assert [(c['cache_key'], c['contains']) for c in overlapping] == [('osten-90', False)]
+    assert index.find_overlapping(center[0], center[1], 80000, max_age=0) == [], \
+        "max_age=0 darf keine früheren Suchen liefern"
+
+    remaining, seeded = geocoding._plan_uncovered_tiles(center, 80000, tiles, [(overlapping[0], earlier)])
+    assert 0 < len(remaining) < len(tiles), "Abgedeckte Teilkreise fallen weg"
+    assert seeded == earlier
+    assert all(t in tiles for t in remaining)
+    print(f"✅ {len(tiles) - len(remaining)} von {len(tiles)} Teilkreisen durch die frühere Suche eingespart")
+
+
+def test_result_set_paging():
+    """Teste serverseitige Ergebnismengen: Seiten, Ausschnitte und Ablauf"""
+    print("\n📚 Teste Ergebnismengen und Seiten...")
+
+    import app as webapp
+
+    original_enrich = result_stream.enrich_brokers
+    result_stream.enrich_brokers = fake_enrich_brokers
+    try:
+        fake_enrich_brokers.calls = []
+        candidates = [{'place_id': f'seite-{i}', 'name': f'Makler {i}'} for i in range(23)]
+        result_id = create_result_set({'location': '04109 Leipzig', 'radius': 5, 'sort': 'distance'}, candidates)
+        assert get_result_set(result_id)['candidates'] == candidates
+        assert get_result_page(result_id, 1) is None, "Seiten werden erst beim Abruf angereichert"
+
+        # Ausschnitt über die Seitengrenze lädt genau die betroffenen Seiten
+        brokers = result_stream.enrich_result_slice(result_id, 8, 5)
+        assert [b['place_id'] for b in brokers] == [f'seite-{i}' for i in range(8, 13)]
+        assert len(fake_enrich_brokers.calls) == 2
+        assert result_stream.enrich_result_page(result_id, 2) == get_result_page(result_id, 2)
+        assert len(fake_enrich_brokers.calls) == 2, "Gespeicherte Seiten werden nicht erneut angereichert"
+
+        client = webapp.app.test_client()
+        last = client.get(f'/api/results/{result_id}?page=3').get_json()
+        assert (last['offset'], last['total'], last['has_more']) == (20, 23, False)
+        assert [b['name'] for b in last['brokers']] == ['Makler 20', 'Makler 21', 'Makler 22']
+        assert client.get(f'/api/results/{"0" * 32}?page=1').status_code == 404
+        assert result_stream.enrich_result_slice('0' * 32, 0, 10) is None
+
+        # Die Session hält nur die ID, die Makler bleiben serverseitig
+        assert client.get(f'/results/{result_id}').status_code == 200
+        with client.session_transaction() as session:
+            assert dict(session) == {'last_search_id': result_id}
+    finally:
+        result_stream.enrich_brokers = original_enrich
+
+    print("✅ Seiten werden einmal angereichert, Ausschnitte und Ablauf korrekt behandelt")
+
+
+def test_job_states():
+    """Teste Zustandswechsel der Suchjobs, Lebenszeichen und Zeitüberschreitung"""
+    print("\n⚙️  Teste Suchjobs...")
+
+    timeout, interval = jobs.SEARCH_JOB_TIMEOUT, jobs.JOB_HEARTBEAT_INTERVAL
+    jobs.SEARCH_JOB_TIMEOUT, jobs.JOB_HEARTBEAT_INTERVAL = 0.3, 0.05
+    store = jobs.JobStore('jobs_test.sqlite3')
+    runner = jobs.JobRunner(store, workers=1, queue_max=5)
+    release = threading.Event()
+    ran = []
+
+    def long_search(job):
+        # Arbeitet länger als SEARCH_JOB_TIMEOUT, meldet aber Lebenszeichen wie der Seitenplaner
+        job.stage('nearby')
+        while not release.wait(0.02):
+            jobs.job_heartbeat()()
+        return {'total': 3}
+
+    def quick_search(job):
+        ran.append(job.job_id)
+        return {'total': 1}
+
+    try:
+        first = runner.submit('search', {'location': 'Kiel'}, long_search)
+        queued = runner.submit('search', {'location': 'Lübeck'}, quick_search)
+        cancelled = runner.submit('search', {'location': 'Flensburg'}, quick_search)
+        store.update(cancelled, status='error', error='abgebrochen')
+
+        time.sleep(0.6)
+        assert store.get(first)['status'] == 'running', "Lebenszeichen verhindern die Zeitüberschreitung"
+        assert store.get(queued)['status'] == 'queued', "Wartende Jobs laufen nicht ab"
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while store.get(queued)['status'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert store.get(first)['result'] == {'total': 3}
+        assert store.get(queued)['status'] == 'done'
+        assert ran == [queued], "Als Fehler markierte Jobs werden nicht mehr ausgeführt"
+        assert store.get(cancelled)['error'] == 'abgebrochen'
+
+        # Laufender Job ohne Lebenszeichen: Fehler, dauerhaft gespeichert
+        stalled = store.create('search', {'location': 'Rostock'})
+        assert store.claim(stalled) and not store.claim(stalled)
+        time.sleep(0.4)
+        assert store.get(stalled)['status'] == 'error'
+        store.touch(stalled)
+        assert store.get(stalled)['status'] == 'error'
+    finally:
+        release.set()
+        jobs.SEARCH_JOB_TIMEOUT, jobs.JOB_HEARTBEAT_INTERVAL = timeout, interval
+
+    print("✅ Warteschlange, Lebenszeichen, Überspringen und Zeitüberschreitung korrekt")
+
+
+def parse_sse(body):
+    """Zerlegt einen Server-Sent-Events-Strom in (Ereignis, Daten)-Paare"""
+    events = []
+    for block in body.split('\n\n'):
+        if not block or block.startswith(':'):
+            continue
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_result_stream_events():
+    """Teste Format und Reihenfolge der Server-Sent Events einer Ergebnisseite"""
+    print("\n📡 Teste Ergebnis-Stream...")
+
+    import app as webapp
+
+    original_enrich = result_stream.enrich_brokers
+    result_stream.enrich_brokers = fake_enrich_brokers
+    try:
+        candidates = [{'place_id': f'stream-{i}', 'name': f'Makler {i}'} for i in range(12)]
+        result_id = create_result_set({'location': '01067 Dresden', 'radius': 5, 'sort': 'rating'}, candidates)
+        client = webapp.app.test_client()
+
+        with client.get(f'/api/results/{result_id}/stream?page=1') as response:
+            assert response.mimetype == 'text/event-stream'
+            assert response.headers['Cache-Control'] == 'no-cache'
+            events = parse_sse(response.get_data(as_text=True))
+
+        kinds = [event for event, _ in events]
+        assert kinds.count('broker') == 10 and kinds.count('update') == 10
+        assert kinds[-1] == 'summary'
+        first_broker = next(data for event, data in events if event == 'broker')
+        assert first_broker['index'] == 0 and first_broker['broker']['name'] == 'Makler 0'
+        assert 'data-broker-id="0"' in first_broker['html']
+        update = next(data for event, data in events if event == 'update')
+        assert update['email'] == f"{candidates[update['index']]['place_id']}@makler.example"
+        assert set(update) >= {'index', 'email', 'contact_person', 'phone', 'broker', 'html'}
+        summary = events[-1][1]
+        assert {k: summary[k] for k in ('page', 'offset', 'total', 'count', 'has_more', 'with_email')} == \
+            {'page': 1, 'offset': 0, 'total': 12, 'count': 10, 'has_more': True, 'with_email': 10}
+
+        # Gespeicherte Seite: alle Makler auf einmal, keine Updates
+        with client.get(f'/api/results/{result_id}/stream?page=1') as response:
+            events = parse_sse(response.get_data(as_text=True))
+        assert [event for event, _ in events] == ['broker'] * 10 + ['summary']
+        assert [data['index'] for event, data in events[:-1]] == list(range(10))
+
+        with client.get(f'/api/results/{result_id}/stream?page=2') as response:
+            events = parse_sse(response.get_data(as_text=True))
+        assert events[-1][1]['offset'] == 10 and events[-1][1]['has_more'] is False
+        assert client.get(f'/api/results/{"0" * 32}/stream').status_code == 404
+
+        # Der Slot der Zulassungskontrolle bleibt belegt, bis der Stream beendet ist
+        pool = get_admission()
+        with client.get(f'/api/results/{result_id}/stream?page=2') as response:
+            assert pool.snapshot()['worker']['active'] == 1
+            parse_sse(response.get_data(as_text=True))
+        assert pool.snapshot()['worker']['active'] == 0
+    finally:
+        result_stream.enrich_brokers = original_enrich
+
+    print("✅ broker-, update- und summary-Ereignisse im erwarteten Format")
+
+
+def main():
+    """Hauptfunktion für Tests"""
+    print("🚀 Starte Tests für den Place-Details-Cache")
+    print("=" * 50)
+
+    test_ttl_cache()
+    test_page_token_scheduler()
+    test_saturated_tile_subdivision()
+    test_api_call_metrics()
+    test_single_flight()
+    test_job_states()
+    test_partial_spatial_reuse()
+    test_place_details_cache()
+    test_spatial_index()
+    test_keyword_planner()
+    test_search_result_cache()
+    test_result_cursor()
+    test_result_set_paging()
+    test_result_stream_events()
+    test_broker_store()
+    test_broker_query()
+    test_broker_query_performance()
+    test_broker_search()
+    test_refresh_plan()
+    test_refresh_broker()
+    test_batch_merge()
+    test_admission_control()
+    test_upload_paging_and_export()
+    test_prewarm_fills_search_cache()
+    test_gps_search_uses_typed_cache()
+
+    print("\n" + "=" * 50)
+    print("🎉 Alle Tests erfolgreich!")
+
+
+if __name__ == "__main__":
+    main()
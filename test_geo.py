@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Test script für Entfernungsberechnung, Sortierung, Kachelung und Offline-Geocodierung
+"""
+
+import os
+import sys
+import time
+import random
+
+# Add the project directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.geo import haversine_m, offset_point, annotate_and_filter, sort_brokers
+from utils.tiling import plan_tiles, subdivide_tile
+from utils.boundary import locate_in_germany
+from utils.localities import get_localities
+from utils.bulk_geocoding import parse_plz_only
+from utils.geocoding import get_coordinates
+
+# Suchzentrum: Berlin Mitte
+CENTER = (52.5200, 13.4050)
+
+
+def random_point(lat, lng, radius_m):
+    """Zufälliger Punkt, gleichverteilt im Kreis"""
+    distance = radius_m * random.random() ** 0.5
+    return offset_point(lat, lng, distance, random.random() * 360)
+
+
+def test_distance_filter():
+    """Teste distance_km und exakte Radius-Filterung"""
+    print("\n📏 Teste Entfernungsfilter...")
+
+    brokers = [
+        {'name': 'Nah', 'geometry': {'location': {'lat': 52.5210, 'lng': 13.4060}}, 'rating': 3.0},
+        {'name': 'Mittel', 'lat': 52.55, 'lng': 13.40, 'rating': 4.9},
+        {'name': 'Außerhalb', 'lat': 53.55, 'lng': 10.00, 'rating': 5.0},
+        {'name': 'Ohne Koordinaten', 'rating': 4.0},
+    ]
+    result = annotate_and_filter(brokers, CENTER[0], CENTER[1], radius_km=10)
+    names = [b['name'] for b in result]
+
+    assert 'Außerhalb' not in names
+    assert result[0]['distance_km'] < 0.2
+    assert abs(result[1]['distance_km'] - haversine_m(*CENTER, 52.55, 13.40) / 1000) < 0.01
+    assert result[2]['distance_km'] is None
+    print(f"✅ {len(result)} von {len(brokers)} Maklern im Radius")
+
+    by_distance = [b['name'] for b in sort_brokers(result, 'distance', 10)]
+    by_rating = [b['name'] for b in sort_brokers(result, 'rating', 10)]
+    assert by_distance == ['Nah', 'Mittel', 'Ohne Koordinaten']
+    assert by_rating[0] == 'Mittel'
+    print("✅ Sortierung nach Entfernung und Bewertung korrekt")
+
+
+def test_distance_performance():
+    """Teste Laufzeit für Sweep-Größen"""
+    print("\n⚡ Teste Performance mit 50.000 Kandidaten...")
+
+    brokers = []
+    for _ in range(50000):
+        lat, lng = random_point(CENTER[0], CENTER[1], 60000)
+        brokers.append({'lat': lat, 'lng': lng, 'rating': random.random() * 5,
+                        'user_ratings_total': random.randint(0, 200)})
+
+    start = time.perf_counter()
+    result = sort_brokers(annotate_and_filter(brokers, CENTER[0], CENTER[1], 50), 'score', 50)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ {len(result)} Makler in {elapsed * 1000:.0f} ms annotiert und sortiert")
+    assert all(b['distance_km'] <= 50 for b in result)
+    assert elapsed < 2.0
+
+
+def test_tiling_coverage():
+    """Teste, dass Teilkreise den Suchkreis lückenlos überdecken"""
+    print("\n🧩 Teste Kachelung...")
+
+    radius_m = 100000
+    tiles = plan_tiles(CENTER[0], CENTER[1], radius_m)
+    saturated = {'lat': CENTER[0], 'lng': CENTER[1], 'radius': 20000}
+    children = subdivide_tile(saturated, CENTER[0], CENTER[1], radius_m)
+
+    for area, circles in ((('Suchkreis', CENTER, radius_m), tiles),
+                          (('Teilkreis', CENTER, saturated['radius']), children)):
+        name, (lat, lng), radius = area
+        for _ in range(2000):
+            p_lat, p_lng = random_point(lat, lng, radius)
+            assert any(haversine_m(p_lat, p_lng, c['lat'], c['lng']) <= c['radius'] for c in circles), name
+        print(f"✅ {name} von {len(circles)} Kreisen überdeckt")
+
+    assert all(t['radius'] <= 50000 for t in tiles)
+
+
+def test_germany_boundary():
+    """Teste die Offline-Prüfung gegen das Grenzpolygon"""
+    print("\n🇩🇪 Teste Grenzpolygon...")
+
+    inside = {'Berlin': (52.52, 13.40), 'Westerland': (54.91, 8.31), 'Passau': (48.57, 13.45),
+              'Konstanz': (47.66, 9.17), 'Aachen': (50.78, 6.08), 'Ahlbeck': (53.94, 14.19)}
+    outside = {'Wien': (48.21, 16.37), 'Straßburg': (48.58, 7.75), 'Salzburg': (47.80, 13.04),
+               'Enschede': (52.22, 6.89), 'Kopenhagen': (55.68, 12.57), 'Basel': (47.56, 7.59)}
+
+    for name, (lat, lng) in inside.items():
+        assert locate_in_germany(lat, lng) in (True, None), name
+    for name, (lat, lng) in outside.items():
+        assert locate_in_germany(lat, lng) in (False, None), name
+    assert locate_in_germany(52.52, 13.40) is True
+    assert locate_in_germany(48.86, 2.35) is False
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        for lat, lng in list(inside.values()) + list(outside.values()):
+            locate_in_germany(lat, lng)
+    elapsed_us = (time.perf_counter() - start) / 12000 * 1e6
+    print(f"✅ Grenzprüfung korrekt, {elapsed_us:.1f} µs pro Punkt")
+    assert elapsed_us < 1000
+
+
+def test_offline_plz():
+    """Teste die Auflösung reiner Postleitzahlen ohne Google"""
+    print("\n📮 Teste PLZ-Auflösung...")
+
+    assert parse_plz_only('10117') == {'plz': '10117', 'ort': None}
+    assert parse_plz_only('1067.0') == {'plz': '01067', 'ort': None}
+    assert parse_plz_only('D-80331 München') == {'plz': '80331', 'ort': 'München'}
+    assert parse_plz_only('Hauptstraße 5, 10117 Berlin') is None
+
+    localities = get_localities()
+    dresden = localities.plz_centroid('01067')
+    assert dresden and haversine_m(dresden['lat'], dresden['lng'], 51.05, 13.74) < 5000
+    assert localities.plz_centroid('80331', 'Muenchen') is not None
+    assert localities.plz_centroid('80331', 'Berlin') is None
+    print(f"✅ {len(localities)} PLZ-Einträge geladen, reine PLZ werden offline aufgelöst")
+
+
+def test_location_suggest():
+    """Teste die Präfixsuche der Autovervollständigung"""
+    print("\n🔎 Teste Ortsvorschläge...")
+
+    localities = get_localities()
+    assert [p['label'] for p in localities.suggest('101')] == ['10115 Berlin', '10117 Berlin', '10178 Berlin']
+    assert localities.suggest('804 Mün')[0]['label'] == '80469 München'
+    labels = [p['ort'] for p in localities.suggest('mü', limit=3)]
+    assert len(set(labels)) == 3, labels
+    assert localities.suggest('Xyz') == []
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        localities.suggest('Ber')
+    elapsed_ms = (time.perf_counter() - start)
+    print(f"✅ Vorschläge korrekt, {elapsed_ms:.3f} ms pro Anfrage")
+    assert elapsed_ms < 5
+
+
+def test_nearest_plz():
+    """Teste die Umkehr-Geocodierung über das PLZ-Raster"""
+    print("\n📍 Teste nächsten PLZ-Schwerpunkt...")
+
+    localities = get_localities()
+    places = localities.suggest('0', limit=1000) + [p for d in '123456789' for p in localities.suggest(d, limit=1000)]
+    for _ in range(500):
+        lat, lng = random.uniform(47.3, 55.0), random.uniform(5.9, 15.0)
+        expected = min(places, key=lambda p: haversine_m(lat, lng, p['lat'], p['lng']))
+        assert localities.nearest(lat, lng)['label'] == expected['label']
+
+    assert localities.nearest(52.5206, 13.4098, max_km=5)['label'] == '10178 Berlin'
+    assert localities.nearest(52.0, 10.0, max_km=5) is None
+
+    # GPS-Position bleibt Mittelpunkt, der Schwerpunkt dient Beschriftung und Suchergebnis-Cache
+    gps = get_coordinates('52.5206, 13.4098')
+    assert (gps['lat'], gps['lng'], gps['label']) == (52.5206, 13.4098, '10178 Berlin')
+    snap = gps['snap']
+    assert {k: snap[k] for k in ('lat', 'lng')} == get_coordinates('10178 Berlin'), \
+        "Schwerpunkt entspricht der getippten PLZ"
+    assert abs(haversine_m(snap['lat'], snap['lng'], gps['lat'], gps['lng']) / 1000 - snap['distance_km']) < 0.01
+    assert 'snap' not in get_coordinates('52.0, 10.0')
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        localities.nearest(52.5206, 13.4098, max_km=5)
+    elapsed_us = (time.perf_counter() - start) * 1000
+    print(f"✅ Nächster Schwerpunkt korrekt, {elapsed_us:.1f} µs pro Abfrage")
+    assert elapsed_us < 1000
+
+
+def main():
+    """Hauptfunktion für Tests"""
+    print("🚀 Starte Tests für Geo-Funktionen")
+    print("=" * 50)
+
+    test_distance_filter()
+    test_distance_performance()
+    test_tiling_coverage()
+    test_germany_boundary()
+    test_offline_plz()
+    test_location_suggest()
+    test_nearest_plz()
+
+    print("\n" + "=" * 50)
+    print("🎉 Alle Tests erfolgreich!")
+
+
+if __name__ == "__main__":
+    main()
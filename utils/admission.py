@@ -0,0 +1,439 @@
+import os
+import math
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from utils.api_metrics import get_metrics
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Gleichzeitig laufende teure Requests pro Gunicorn-Worker (0 = unbegrenzt)
+ADMISSION_WORKER_LIMIT = int(os.getenv('ADMISSION_WORKER_LIMIT', '2'))
+
+# Gleichzeitig laufende teure Requests über alle Worker (0 = unbegrenzt)
+ADMISSION_GLOBAL_LIMIT = int(os.getenv('ADMISSION_GLOBAL_LIMIT', '4'))
+ADMISSION_FORWARD_LIMIT = int(os.getenv('ADMISSION_FORWARD_LIMIT', '4'))
+
+# Wartende Requests (pro Worker und über alle Worker) und maximale Wartezeit in Sekunden
+ADMISSION_QUEUE_MAX = int(os.getenv('ADMISSION_QUEUE_MAX', '4'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '3'))
+
+# Retry-After bei Überlast, solange keine Laufzeiten bekannt sind (Sekunden)
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '5'))
+
+# Slots abgestürzter Worker verfallen spätestens nach dieser Zeit (Sekunden)
+ADMISSION_SLOT_TTL = float(os.getenv('ADMISSION_SLOT_TTL', '300'))
+
+# Google-Kontingent pro Client: Suchen pro Minute und Burst (0 = unbegrenzt)
+CLIENT_SEARCHES_PER_MINUTE = float(os.getenv('CLIENT_SEARCHES_PER_MINUTE', '6'))
+CLIENT_SEARCH_BURST = int(os.getenv('CLIENT_SEARCH_BURST', '10'))
+
+# Pools mit ihrem globalen Limit: Google-Suchen und Weiterleitungen an die externe API
+ADMISSION_POOLS = {
+    'search': ADMISSION_GLOBAL_LIMIT,
+    'forward': ADMISSION_FORWARD_LIMIT
+}
+
+_POLL_INTERVAL = 0.1
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def _ensure_schema(db_path: str):
+    with _schema_lock:
+        if db_path in _initialized:
+            return
+        conn = get_connection(db_path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS admission_leases ('
+            ' id TEXT PRIMARY KEY,'
+            ' pool TEXT NOT NULL,'
+            ' route TEXT,'
+            ' pid INTEGER NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' started_at REAL NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_admission_leases_pool ON admission_leases (pool, state)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS client_quota ('
+            ' client TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        _initialized.add(db_path)
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class AdmissionPool:
+    """
+    Zulassungskontrolle für eine Gruppe teurer Routen.
+
+    Pro Worker begrenzt ein Zähler unter einer Condition die gleichzeitig
+    laufenden Requests; über alle Gunicorn-Worker hinweg werden Slots als
+    Leases in SQLite vergeben. Wer keinen Slot bekommt, wartet in einer kurzen,
+    begrenzten Warteschlange und wird danach abgewiesen, damit Worker-Threads
+    für günstige Routen (statische Seiten, /api/config) frei bleiben.
+    """
+
+    def __init__(self, name: str, global_limit: int = ADMISSION_GLOBAL_LIMIT,
+                 worker_limit: int = ADMISSION_WORKER_LIMIT, queue_max: int = ADMISSION_QUEUE_MAX,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, db_file: str = 'admission.sqlite3'):
+        self.name = name
+        self.global_limit = global_limit
+        self.worker_limit = worker_limit
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.db_path = data_path(db_file)
+        _ensure_schema(self.db_path)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._avg_seconds = None
+        self._started: Dict[str, float] = {}
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0,
+                      'max_waiting': 0}
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def acquire(self, route: Optional[str] = None) -> Optional[str]:
+        """
+        Belegt einen Slot, wartet dafür höchstens queue_timeout Sekunden.
+
+        Args:
+            route (str): Route des Requests (nur für die Statistik)
+
+        Returns:
+            str: Lease-ID für release(), oder None bei Überlast
+        """
+        lease = uuid.uuid4().hex
+        deadline = time.monotonic() + self.queue_timeout
+        queued = False
+        with self._cond:
+            if self.worker_limit > 0 and self._active >= self.worker_limit:
+                if self._waiting >= self.queue_max:
+                    return self._reject('rejected_queue_full', queued)
+                queued = self._enqueue()
+                while self._active >= self.worker_limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return self._reject('rejected_timeout', queued)
+                    self._cond.wait(remaining)
+            self._active += 1
+
+        reason, queued = self._acquire_global(lease, route, deadline, queued)
+        with self._cond:
+            if reason:
+                self._active -= 1
+                self._cond.notify()
+                return self._reject(reason, queued)
+            if queued:
+                self._waiting -= 1
+            self.stats['admitted'] += 1
+            self._started[lease] = time.monotonic()
+        return lease
+
+    def _enqueue(self) -> bool:
+        self._waiting += 1
+        self.stats['queued'] += 1
+        self.stats['max_waiting'] = max(self.stats['max_waiting'], self._waiting)
+        return True
+
+    def _reject(self, reason: str, queued: bool) -> None:
+        # Aufruf nur unter self._cond
+        if queued:
+            self._waiting -= 1
+        self.stats[reason] += 1
+        get_metrics().increment(f'admission_{self.name}_{reason}')
+        logger.warning(
+            f"Zulassung {self.name} abgelehnt ({reason}): {self._active} aktiv, {self._waiting} wartend"
+        )
+        return None
+
+    def _acquire_global(self, lease: str, route: Optional[str], deadline: float, queued: bool):
+        """
+        Belegt den globalen Slot.
+
+        Returns:
+            tuple: (Ablehnungsgrund oder None, ob der Request in der Warteschlange steht)
+        """
+        if self.global_limit <= 0:
+            return None, queued
+        waiting = False
+        try:
+            while True:
+                state = self._try_global(lease, route, waiting)
+                if state == 'active':
+                    return None, queued
+                if state == 'queue_full':
+                    return 'rejected_queue_full', queued
+                if not waiting and not queued:
+                    with self._cond:
+                        self._enqueue()
+                    queued = True
+                waiting = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._conn().execute('DELETE FROM admission_leases WHERE id = ?', (lease,))
+                    return 'rejected_timeout', queued
+                time.sleep(min(_POLL_INTERVAL, remaining))
+        except sqlite3.Error as e:
+            # Ohne gemeinsamen Store gilt nur das Limit pro Worker
+            logger.warning(f"Globale Zulassung {self.name} nicht verfügbar: {e}")
+            return None, queued
+
+    def _try_global(self, lease: str, route: Optional[str], waiting: bool) -> str:
+        """Ein Versuch in einer Schreibtransaktion: 'active', 'waiting' oder 'queue_full'."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM admission_leases WHERE expires_at < ?', (now,))
+            active = self._count(conn, 'active')
+            if active >= self.global_limit:
+                active -= self._reap_dead_workers(conn)
+            if active < self.global_limit:
+                conn.execute(
+                    'INSERT OR REPLACE INTO admission_leases (id, pool, route, pid, state, started_at, expires_at) '
+                    "VALUES (?, ?, ?, ?, 'active', ?, ?)",
+                    (lease, self.name, route, os.getpid(), now, now + ADMISSION_SLOT_TTL)
+                )
+                state = 'active'
+            elif waiting:
+                state = 'waiting'
+            elif self._count(conn, 'waiting') >= self.queue_max:
+                state = 'queue_full'
+            else:
+                # Wartende verfallen kurz nach ihrer Wartezeit, auch wenn der Worker abstürzt
+                conn.execute(
+                    'INSERT INTO admission_leases (id, pool, route, pid, state, started_at, expires_at) '
+                    "VALUES (?, ?, ?, ?, 'waiting', ?, ?)",
+                    (lease, self.name, route, os.getpid(), now, now + self.queue_timeout + 5)
+                )
+                state = 'waiting'
+            conn.execute('COMMIT')
+            return state
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _count(self, conn, state: str) -> int:
+        return conn.execute(
+            'SELECT COUNT(*) FROM admission_leases WHERE pool = ? AND state = ?', (self.name, state)
+        ).fetchone()[0]
+
+    def _reap_dead_workers(self, conn) -> int:
+        """Gibt aktive Slots beendeter Worker frei; liefert die Anzahl freigegebener Slots."""
+        pids = [row[0] for row in conn.execute(
+            "SELECT DISTINCT pid FROM admission_leases WHERE pool = ? AND state = 'active' AND pid != ?",
+            (self.name, os.getpid())
+        ).fetchall()]
+        freed = 0
+        for pid in pids:
+            if not _pid_alive(pid):
+                freed += conn.execute(
+                    "DELETE FROM admission_leases WHERE pid = ? AND state = 'active' AND pool = ?",
+                    (pid, self.name)
+                ).rowcount
+        if freed:
+            logger.info(f"Zulassung {self.name}: {freed} Slots beendeter Worker freigegeben")
+        return freed
+
+    def release(self, lease: str):
+        """Gibt den Slot einer Lease frei und weckt einen wartenden Request."""
+        if self.global_limit > 0:
+            try:
+                self._conn().execute('DELETE FROM admission_leases WHERE id = ?', (lease,))
+            except sqlite3.Error as e:
+                logger.warning(f"Slot {lease} konnte nicht freigegeben werden: {e}")
+        with self._cond:
+            started = self._started.pop(lease, None)
+            if started is not None:
+                duration = time.monotonic() - started
+                self._avg_seconds = duration if self._avg_seconds is None else \
+                    0.8 * self._avg_seconds + 0.2 * duration
+            self._active -= 1
+            self._cond.notify()
+
+    def retry_after(self) -> int:
+        """Empfohlene Wartezeit in Sekunden aus mittlerer Laufzeit und Warteschlange."""
+        with self._cond:
+            if self._avg_seconds is None:
+                return ADMISSION_RETRY_AFTER
+            slots = max(1, self.worker_limit if self.worker_limit > 0 else self.global_limit)
+            return max(1, min(60, math.ceil(self._avg_seconds * (self._waiting + 1) / slots)))
+
+    def snapshot(self) -> Dict:
+        """
+        Auslastung dieses Workers und aller Worker.
+
+        Returns:
+            dict: Limits, aktive und wartende Requests, Zähler des Workers
+        """
+        with self._cond:
+            worker = dict(self.stats, active=self._active, waiting=self._waiting,
+                          limit=self.worker_limit, queue_max=self.queue_max,
+                          avg_seconds=round(self._avg_seconds, 3) if self._avg_seconds is not None else None)
+        overall = {'limit': self.global_limit, 'active': None, 'waiting': None}
+        if self.global_limit > 0:
+            try:
+                rows = self._conn().execute(
+                    'SELECT state, COUNT(*) AS n FROM admission_leases '
+                    'WHERE pool = ? AND expires_at >= ? GROUP BY state',
+                    (self.name, time.time())
+                ).fetchall()
+                counts = {row['state']: row['n'] for row in rows}
+                overall.update(active=counts.get('active', 0), waiting=counts.get('waiting', 0))
+            except sqlite3.Error as e:
+                logger.warning(f"Globale Auslastung {self.name} nicht lesbar: {e}")
+        return {'worker': worker, 'global': overall, 'queue_timeout': self.queue_timeout}
+
+
+class ClientQuota:
+    """
+    Token-Bucket pro Client (IP-Adresse) für Google-intensive Routen, gemeinsam
+    für alle Worker in SQLite. Eine Sammelsuche kostet so viele Tokens wie sie
+    Orte hat und darf den Bucket ins Minus ziehen; danach wartet der Client,
+    bis das Guthaben wieder reicht.
+    """
+
+    def __init__(self, per_minute: float = CLIENT_SEARCHES_PER_MINUTE, burst: int = CLIENT_SEARCH_BURST,
+                 db_file: str = 'admission.sqlite3'):
+        self.per_minute = per_minute
+        self.burst = max(1, burst)
+        self.db_path = data_path(db_file)
+        _ensure_schema(self.db_path)
+        self._writes = 0
+        self.stats = {'allowed': 0, 'rejected': 0}
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def take(self, client: str, cost: float = 1) -> int:
+        """
+        Zieht cost Tokens vom Guthaben des Clients ab.
+
+        Args:
+            client (str): Client-Schlüssel (IP-Adresse)
+            cost (float): Anzahl Suchen des Requests
+
+        Returns:
+            int: 0 wenn erlaubt, sonst Sekunden bis genug Guthaben vorhanden ist
+        """
+        if self.per_minute <= 0 or cost <= 0:
+            return 0
+        rate = self.per_minute / 60.0
+        needed = min(cost, self.burst)
+        conn = self._conn()
+        try:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT tokens, updated_at FROM client_quota WHERE client = ?',
+                                   (client,)).fetchone()
+                tokens = self.burst if row is None else \
+                    min(self.burst, row['tokens'] + (now - row['updated_at']) * rate)
+                allowed = tokens >= needed
+                if allowed:
+                    tokens -= cost
+                conn.execute(
+                    'INSERT INTO client_quota (client, tokens, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT (client) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                    (client, tokens, now)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Client-Kontingent nicht verfügbar: {e}")
+            return 0
+
+        self._writes += 1
+        if self._writes % 500 == 0:
+            self.prune()
+        if allowed:
+            self.stats['allowed'] += 1
+            return 0
+        self.stats['rejected'] += 1
+        get_metrics().increment('client_quota_rejected')
+        logger.warning(f"Suchkontingent für {client} erschöpft ({tokens:.1f} von {needed} Tokens)")
+        return max(1, math.ceil((needed - tokens) / rate))
+
+    def refund(self, client: str, cost: float = 1):
+        """Schreibt Tokens eines abgewiesenen Requests wieder gut."""
+        if self.per_minute <= 0 or cost <= 0:
+            return
+        try:
+            self._conn().execute(
+                'UPDATE client_quota SET tokens = MIN(?, tokens + ?) WHERE client = ?',
+                (self.burst, cost, client)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Kontingent für {client} konnte nicht erstattet werden: {e}")
+
+    def prune(self):
+        """Entfernt Clients, deren Bucket längst wieder voll ist."""
+        if self.per_minute <= 0:
+            return
+        refill_seconds = self.burst * 60.0 / self.per_minute
+        try:
+            self._conn().execute('DELETE FROM client_quota WHERE updated_at < ?',
+                                 (time.time() - refill_seconds - 3600,))
+        except sqlite3.Error as e:
+            logger.warning(f"Client-Kontingente konnten nicht bereinigt werden: {e}")
+
+    def snapshot(self) -> Dict:
+        """Konfiguration, Zähler dieses Workers und aktuell gedrosselte Clients."""
+        limited = None
+        if self.per_minute > 0:
+            try:
+                # Clients, deren Guthaben auch nach dem Auffüllen seit dem letzten Request unter 1 liegt
+                limited = self._conn().execute(
+                    'SELECT COUNT(*) FROM client_quota WHERE tokens + (? - updated_at) * ? < 1',
+                    (time.time(), self.per_minute / 60.0)
+                ).fetchone()[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Client-Kontingente nicht lesbar: {e}")
+        return dict(self.stats, per_minute=self.per_minute, burst=self.burst, limited_clients=limited)
+
+
+_pools: Dict[str, AdmissionPool] = {}
+_pools_lock = threading.Lock()
+_quota = None
+
+
+def get_admission(pool: str = 'search') -> AdmissionPool:
+    """Gibt den Zulassungs-Pool (Singleton pro Worker) zurück."""
+    with _pools_lock:
+        if pool not in _pools:
+            _pools[pool] = AdmissionPool(pool, global_limit=ADMISSION_POOLS.get(pool, ADMISSION_GLOBAL_LIMIT))
+        return _pools[pool]
+
+
+def get_client_quota() -> ClientQuota:
+    """Gibt das Client-Kontingent (Singleton) zurück."""
+    global _quota
+    if _quota is None:
+        _quota = ClientQuota()
+    return _quota
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+import googlemaps
+
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Google-Endpunkte, die gezählt werden (Methodennamen des googlemaps.Client)
+INSTRUMENTED_ENDPOINTS = ('geocode', 'reverse_geocode', 'places_nearby', 'place')
+
+# Preise in USD pro 1000 Aufrufe (Google Maps Platform Listenpreise, per GOOGLE_API_PRICES überschreibbar)
+DEFAULT_PRICES_PER_1000 = {
+    'geocode': 5.0,
+    'reverse_geocode': 5.0,
+    'places_nearby': 32.0,
+    'place': 17.0
+}
+
+# Status, für die Google abrechnet (INVALID_REQUEST bei unreifen Page-Tokens u.ä. zählen nicht)
+BILLABLE_STATUSES = ('OK', 'ZERO_RESULTS')
+
+# Obergrenzen der Latenz-Buckets in Millisekunden
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+
+_scope: contextvars.ContextVar = contextvars.ContextVar('google_api_scope', default=None)
+
+
+def load_price_table() -> Dict[str, float]:
+    """Liest die Preistabelle; GOOGLE_API_PRICES ist ein JSON-Objekt {endpoint: USD pro 1000}."""
+    prices = dict(DEFAULT_PRICES_PER_1000)
+    raw = os.getenv('GOOGLE_API_PRICES')
+    if raw:
+        try:
+            prices.update({k: float(v) for k, v in json.loads(raw).items()})
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"GOOGLE_API_PRICES ungültig, verwende Standardpreise: {e}")
+    return prices
+
+
+def _bucket_label(elapsed_ms: float) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if elapsed_ms <= bound:
+            return f"le_{bound}"
+    return 'gt_5000'
+
+
+class ApiMetrics:
+    """
+    Zählt Google-API-Aufrufe pro Endpunkt, Route und Request.
+
+    Aggregate (Anzahl, Status, Latenz-Buckets, Dauer) werden pro Tag in SQLite
+    geschrieben, damit der JSON-Endpunkt die Summe aller Gunicorn-Worker zeigt.
+    Request-Zusammenfassungen bleiben im Speicher des jeweiligen Workers.
+    """
+
+    def __init__(self, max_requests: int = 500):
+        self.prices = load_price_table()
+        self.db_path = data_path('metrics.sqlite3')
+        self._lock = threading.Lock()
+        self._requests: OrderedDict = OrderedDict()
+        self._max_requests = max_requests
+        self._ensure_schema()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_schema(self):
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS google_api_calls ('
+            ' day TEXT NOT NULL,'
+            ' route TEXT NOT NULL,'
+            ' endpoint TEXT NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' bucket TEXT NOT NULL,'
+            ' calls INTEGER NOT NULL DEFAULT 0,'
+            ' total_ms REAL NOT NULL DEFAULT 0,'
+            ' PRIMARY KEY (day, route, endpoint, status, bucket))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS google_api_counters ('
+            ' day TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' value INTEGER NOT NULL DEFAULT 0,'
+            ' PRIMARY KEY (day, name))'
+        )
+
+    def record(self, endpoint: str, status: str, elapsed_ms: float, scope: Optional[Dict]):
+        """Verbucht einen Google-Aufruf."""
+        scope = scope or {}
+        route = scope.get('route') or 'unbekannt'
+        try:
+            self._conn().execute(
+                'INSERT INTO google_api_calls (day, route, endpoint, status, bucket, calls, total_ms) '
+                'VALUES (?, ?, ?, ?, ?, 1, ?) '
+                'ON CONFLICT (day, route, endpoint, status, bucket) '
+                'DO UPDATE SET calls = calls + 1, total_ms = total_ms + excluded.total_ms',
+                (datetime.now().strftime('%Y-%m-%d'), route, endpoint, status,
+                 _bucket_label(elapsed_ms), elapsed_ms)
+            )
+        except Exception as e:
+            logger.warning(f"Google-API-Metrik konnte nicht gespeichert werden: {e}")
+
+        request_id = scope.get('request_id')
+        if not request_id:
+            return
+        with self._lock:
+            summary = self._requests.get(request_id)
+            if summary is None:
+                summary = self._requests[request_id] = {
+                    'request_id': request_id,
+                    'route': route,
+                    'started_at': datetime.now().isoformat(),
+                    'calls': {},
+                    'billable': {},
+                    'errors': 0,
+                    'total_ms': 0.0
+                }
+                while len(self._requests) > self._max_requests:
+                    self._requests.popitem(last=False)
+            summary['calls'][endpoint] = summary['calls'].get(endpoint, 0) + 1
+            summary['total_ms'] += elapsed_ms
+            if status in BILLABLE_STATUSES:
+                summary['billable'][endpoint] = summary['billable'].get(endpoint, 0) + 1
+            else:
+                summary['errors'] += 1
+
+    def increment(self, name: str, value: int = 1):
+        """Erhöht einen benannten Tageszähler (z.B. eingesparte Aufrufe)."""
+        if not value:
+            return
+        try:
+            self._conn().execute(
+                'INSERT INTO google_api_counters (day, name, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (day, name) DO UPDATE SET value = value + excluded.value',
+                (datetime.now().strftime('%Y-%m-%d'), name, value)
+            )
+        except Exception as e:
+            logger.warning(f"Zähler {name} konnte nicht gespeichert werden: {e}")
+
+    def counters(self, days: int = 1, prefix: str = '') -> Dict[str, int]:
+        """
+        Summen der benannten Zähler der letzten Tage über alle Worker.
+
+        Args:
+            days (int): Anzahl Tage einschließlich heute
+            prefix (str): Nur Zähler mit diesem Namensanfang
+
+        Returns:
+            dict: Zählername -> Summe
+        """
+        since = datetime.fromtimestamp(time.time() - (days - 1) * 86400).strftime('%Y-%m-%d')
+        rows = self._conn().execute(
+            'SELECT name, SUM(value) AS value FROM google_api_counters '
+            'WHERE day >= ? AND substr(name, 1, ?) = ? GROUP BY name',
+            (since, len(prefix), prefix)
+        ).fetchall()
+        return {row['name']: row['value'] for row in rows}
+
+    def estimate_cost(self, calls_by_endpoint: Dict[str, int]) -> float:
+        """Geschätzte Kosten in USD für eine Menge von Aufrufen."""
+        return round(sum(
+            count * self.prices.get(endpoint, 0.0) / 1000
+            for endpoint, count in calls_by_endpoint.items()
+        ), 4)
+
+    def request_summary(self, request_id: str) -> Optional[Dict]:
+        """Zusammenfassung der Google-Aufrufe eines Requests inkl. Kostenschätzung."""
+        with self._lock:
+            summary = self._requests.get(request_id)
+            if summary is None:
+                return None
+            summary = dict(summary, calls=dict(summary['calls']), billable=dict(summary['billable']))
+        summary['estimated_cost_usd'] = self.estimate_cost(summary['billable'])
+        summary['total_ms'] = round(summary['total_ms'], 1)
+        return summary
+
+    def log_request_summary(self, request_id: str):
+        """Schreibt die Zusammenfassung eines Requests ins Log, falls Google aufgerufen wurde."""
+        summary = self.request_summary(request_id)
+        if not summary:
+            return
+        calls = ', '.join(f"{count}x {endpoint}" for endpoint, count in sorted(summary['calls'].items()))
+        logger.info(
+            f"Google API ({summary['route']}, {request_id[:8]}): {calls} – "
+            f"{summary['total_ms']:.0f} ms, {summary['errors']} Fehler, "
+            f"geschätzt {summary['estimated_cost_usd']:.4f} USD"
+        )
+
+    def snapshot(self, days: int = 1) -> Dict:
+        """
+        Aggregierte Metriken der letzten Tage über alle Worker.
+
+        Returns:
+            dict: Aufrufe, Status, Latenz-Buckets und Kosten pro Endpunkt und Route
+        """
+        since = datetime.fromtimestamp(time.time() - (days - 1) * 86400).strftime('%Y-%m-%d')
+        rows = self._conn().execute(
+            'SELECT route, endpoint, status, bucket, SUM(calls) AS calls, SUM(total_ms) AS total_ms '
+            'FROM google_api_calls WHERE day >= ? GROUP BY route, endpoint, status, bucket',
+            (since,)
+        ).fetchall()
+
+        endpoints: Dict[str, Dict] = {}
+        routes: Dict[str, Dict] = {}
+        for row in rows:
+            billable = row['calls'] if row['status'] in BILLABLE_STATUSES else 0
+            ep = endpoints.setdefault(row['endpoint'], {
+                'calls': 0, 'billable_calls': 0, 'total_ms': 0.0, 'statuses': {},
+                'latency_ms': {label: 0 for label in [f"le_{b}" for b in LATENCY_BUCKETS_MS] + ['gt_5000']}
+            })
+            ep['calls'] += row['calls']
+            ep['billable_calls'] += billable
+            ep['total_ms'] += row['total_ms']
+            ep['statuses'][row['status']] = ep['statuses'].get(row['status'], 0) + row['calls']
+            ep['latency_ms'][row['bucket']] += row['calls']
+
+            route = routes.setdefault(row['route'], {'calls': {}, 'billable_calls': {}})
+            route['calls'][row['endpoint']] = route['calls'].get(row['endpoint'], 0) + row['calls']
+            route['billable_calls'][row['endpoint']] = route['billable_calls'].get(row['endpoint'], 0) + billable
+
+        for name, ep in endpoints.items():
+            ep['avg_ms'] = round(ep['total_ms'] / ep['calls'], 1) if ep['calls'] else 0.0
+            ep['total_ms'] = round(ep['total_ms'], 1)
+            ep['estimated_cost_usd'] = self.estimate_cost({name: ep['billable_calls']})
+        for route in routes.values():
+            route['estimated_cost_usd'] = self.estimate_cost(route['billable_calls'])
+
+        counters = self.counters(days)
+
+        with self._lock:
+            recent = list(self._requests.keys())[-20:]
+        return {
+            'since': since,
+            'endpoints': endpoints,
+            'routes': routes,
+            'counters': counters,
+            'total_estimated_cost_usd': self.estimate_cost(
+                {name: ep['billable_calls'] for name, ep in endpoints.items()}
+            ),
+            'price_table_usd_per_1000': self.prices,
+            'recent_requests': [s for s in (self.request_summary(r) for r in reversed(recent)) if s],
+            'worker_pid': os.getpid()
+        }
+
+
+class InstrumentedClient:
+    """
+    Hülle um googlemaps.Client, die Aufrufe der INSTRUMENTED_ENDPOINTS misst.
+
+    Der Scope (Route, Request-ID) wird beim Erzeugen festgehalten, damit auch
+    Aufrufe aus Worker-Threads dem auslösenden Request zugeordnet werden.
+    """
+
+    def __init__(self, client: googlemaps.Client, metrics: 'ApiMetrics', scope: Optional[Dict] = None):
+        self._client = client
+        self._metrics = metrics
+        self._scope = scope
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in INSTRUMENTED_ENDPOINTS or not callable(attr):
+            return attr
+
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            status = 'OK'
+            try:
+                result = attr(*args, **kwargs)
+                if isinstance(result, dict):
+                    status = result.get('status', 'OK')
+                elif not result:
+                    status = 'ZERO_RESULTS'
+                return result
+            except googlemaps.exceptions.ApiError as e:
+                status = e.status
+                raise
+            except Exception as e:
+                status = type(e).__name__
+                raise
+            finally:
+                self._metrics.record(name, status, (time.perf_counter() - start) * 1000, self._scope)
+
+        return instrumented
+
+
+_metrics: Optional[ApiMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> ApiMetrics:
+    """Liefert die prozessweite Metrik-Instanz."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = ApiMetrics()
+        return _metrics
+
+
+def current_scope() -> Optional[Dict]:
+    """Aktueller Scope (Route, Request-ID) des laufenden Requests oder Jobs."""
+    return _scope.get()
+
+
+def instrument(client: googlemaps.Client) -> InstrumentedClient:
+    """Hüllt einen Client für den aktuellen Scope ein."""
+    return InstrumentedClient(client, get_metrics(), current_scope())
+
+
+def begin_scope(route: str, request_id: Optional[str] = None):
+    """Setzt den Scope für den aktuellen Kontext und gibt ein Reset-Token zurück."""
+    return _scope.set({'route': route, 'request_id': request_id or uuid.uuid4().hex})
+
+
+def end_scope(token):
+    """Stellt den vorherigen Scope wieder her."""
+    _scope.reset(token)
+
+
+@contextmanager
+def api_scope(route: str, request_id: Optional[str] = None):
+    """Kontextmanager für Hintergrundaufgaben, die Google-Aufrufe auslösen."""
+    token = begin_scope(route, request_id)
+    try:
+        yield _scope.get()
+    finally:
+        get_metrics().log_request_summary(_scope.get()['request_id'])
+        end_scope(token)
@@ -0,0 +1,156 @@
+import os
+import re
+import logging
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from utils.geo import sort_brokers
+from utils.geocoding import get_coordinates, search_insurance_brokers, normalize_location
+from utils.result_store import create_result_set
+from utils.search_history import record_search
+
+logger = logging.getLogger(__name__)
+
+# Maximale Anzahl Suchorte pro Sammelsuche und parallel bearbeitete Orte
+BATCH_SEARCH_MAX_LOCATIONS = int(os.getenv('BATCH_SEARCH_MAX_LOCATIONS', '50'))
+BATCH_SEARCH_WORKERS = int(os.getenv('BATCH_SEARCH_WORKERS', '4'))
+
+_LOCATION_SEPARATORS = re.compile(r'[\n;,]+')
+
+
+def parse_locations(value) -> List[str]:
+    """
+    Liest die Suchorte einer Sammelsuche.
+
+    Args:
+        value: Liste von Orten oder Text mit einem Ort pro Zeile
+            (auch durch Komma oder Semikolon getrennt)
+
+    Returns:
+        list: Orte in Eingabereihenfolge, ohne Duplikate (nach normalize_location)
+    """
+    if isinstance(value, str):
+        value = _LOCATION_SEPARATORS.split(value)
+    locations = {}
+    for location in value or []:
+        location = str(location).strip()
+        if location:
+            locations.setdefault(normalize_location(location), location)
+    return list(locations.values())
+
+
+def merge_candidates(areas: List[Dict]) -> List[Dict]:
+    """
+    Führt die Kandidaten mehrerer Suchgebiete zusammen, jede place_id nur einmal.
+
+    Ein Makler aus überlappenden Gebieten behält die Entfernung zum nächsten
+    Suchort; search_location und search_locations nennen diesen bzw. alle
+    Orte, in denen er gefunden wurde.
+
+    Args:
+        areas (list): Dicts mit location und candidates
+
+    Returns:
+        list: Eindeutige Kandidaten (noch unsortiert)
+    """
+    merged = {}
+    for area in areas:
+        for candidate in area['candidates']:
+            place_id = candidate.get('place_id')
+            if not place_id:
+                continue
+            known = merged.get(place_id)
+            if known is None:
+                merged[place_id] = dict(candidate, search_location=area['location'],
+                                        search_locations=[area['location']])
+                continue
+            known['search_locations'].append(area['location'])
+            distance = candidate.get('distance_km')
+            if distance is not None and (known.get('distance_km') is None or distance < known['distance_km']):
+                known['distance_km'] = distance
+                known['search_location'] = area['location']
+    return list(merged.values())
+
+
+def run_batch_search(locations: List[str], radius_km: int, sort_by: str,
+                     progress: Optional[Callable] = None) -> Dict:
+    """
+    Sammelsuche über mehrere Orte mit einer gemeinsamen Ergebnismenge.
+
+    Geocoding und Nearby-Suche laufen für bis zu BATCH_SEARCH_WORKERS Orte
+    gleichzeitig. Die Kandidaten werden vor Place Details und Scraping über
+    alle Gebiete nach place_id zusammengeführt, sodass jeder Makler aus
+    überlappenden Gebieten nur einmal angereichert wird; das geschieht wie
+    bei der Einzelsuche seitenweise beim Anzeigen, Blättern oder über die API.
+
+    Args:
+        locations (list): Suchorte (PLZ, Ort oder Adresse)
+        radius_km (int): Suchradius pro Ort in km
+        sort_by (str): Sortierung der zusammengeführten Liste
+        progress (callable): Optional progress(stage, partial, **werte) für Suchjobs
+
+    Returns:
+        dict: result_id, total und params (mit batch-Statistik); ohne Treffer
+        nur total = 0 und batch
+    """
+    report = progress or (lambda stage, partial=None, **values: None)
+    report('geocode', areas=len(locations), areas_done=0)
+
+    def search_area(location):
+        coordinates = get_coordinates(location)
+        if not coordinates:
+            return {'location': location, 'error': 'Standort nicht gefunden', 'candidates': []}
+        label = coordinates.get('label', location)
+        record_search(normalize_location(label), label, coordinates, radius_km, sort_by)
+        candidates = search_insurance_brokers(coordinates, radius_km * 1000, sort_by)
+        return {'location': label, 'candidates': candidates}
+
+    areas = []
+    workers = max(1, min(BATCH_SEARCH_WORKERS, len(locations)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-search') as executor:
+        # Kontext kopieren, damit die Google-Aufrufe dem Request bzw. Job zugeordnet bleiben
+        futures = {
+            executor.submit(contextvars.copy_context().run, search_area, location): location
+            for location in locations
+        }
+        for future in as_completed(futures):
+            try:
+                areas.append(future.result())
+            except Exception as e:
+                logger.error(f"Sammelsuche für {futures[future]} fehlgeschlagen: {e}")
+                areas.append({'location': futures[future], 'error': 'Suche fehlgeschlagen', 'candidates': []})
+            report('nearby', areas_done=len(areas))
+
+    # Eingabereihenfolge für Statistik und Zuordnung bei gleicher Entfernung
+    order = {location: i for i, location in enumerate(locations)}
+    areas.sort(key=lambda area: order.get(area['location'], len(order)))
+    candidates = sort_brokers(merge_candidates(areas), sort_by, radius_km)
+
+    raw_total = sum(len(area['candidates']) for area in areas)
+    batch = {
+        'areas': [{'location': area['location'], 'found': len(area['candidates']), 'error': area.get('error')}
+                  for area in areas],
+        'failed': sum(1 for area in areas if area.get('error')),
+        'raw_candidates': raw_total,
+        'duplicates_removed': raw_total - len(candidates)
+    }
+    logger.info(
+        f"Sammelsuche über {len(locations)} Orte: {raw_total} Treffer, "
+        f"{len(candidates)} eindeutige Makler, {batch['failed']} Orte fehlgeschlagen"
+    )
+    if not candidates:
+        return {'total': 0, 'batch': batch}
+
+    searched = [area['location'] for area in areas if not area.get('error')]
+    search_params = {
+        'location': ', '.join(searched[:3]) + (f' (+{len(searched) - 3} weitere)' if len(searched) > 3 else ''),
+        'locations': searched,
+        'radius': radius_km,
+        'sort': sort_by,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'batch': batch
+    }
+    result_id = create_result_set(search_params, candidates)
+    return {'result_id': result_id, 'total': len(candidates), 'params': search_params, 'batch': batch}
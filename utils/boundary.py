@@ -0,0 +1,125 @@
+import os
+import json
+import math
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY_FILE = os.path.join(os.path.dirname(__file__), 'data', 'germany_boundary.json')
+
+# Punkte näher als dieser Abstand an einer Landgrenze gelten als unsicher,
+# weil das vereinfachte Polygon dort um einige Kilometer abweichen kann
+BORDER_MARGIN_KM = float(os.getenv('GERMANY_BORDER_MARGIN_KM', '10'))
+
+_KM_PER_DEG_LAT = 110.574
+_KM_PER_DEG_LNG_EQUATOR = 111.320
+
+
+class _PreparedBoundary:
+    """Vorberechnete Kanten und Boxen für schnelle Punkt-in-Polygon-Tests."""
+
+    def __init__(self, data: Dict, margin_km: float):
+        self.bbox = tuple(data['bbox'])
+        self.inner_bbox = tuple(data.get('inner_bbox') or ())
+        self.margin_km = margin_km
+        # Gitterfaktor für die Abstandsrechnung (mittlere Breite Deutschlands)
+        self.km_per_deg_lng = _KM_PER_DEG_LNG_EQUATOR * math.cos(math.radians(51.0))
+
+        margin_lat = margin_km / _KM_PER_DEG_LAT
+        margin_lng = margin_km / self.km_per_deg_lng
+        self.outer_bbox = (self.bbox[0] - margin_lng, self.bbox[1] - margin_lat,
+                           self.bbox[2] + margin_lng, self.bbox[3] + margin_lat)
+
+        self.rings: List[List[Tuple[float, float, float, float]]] = []
+        self.border_edges: List[Tuple[float, float, float, float, Tuple[float, float, float, float]]] = []
+        for polygon in data['polygons']:
+            ring = polygon['ring']
+            edges = []
+            for i, (lng1, lat1, kind) in enumerate(ring):
+                lng2, lat2 = ring[(i + 1) % len(ring)][:2]
+                edges.append((lng1, lat1, lng2, lat2))
+                if kind == 'b':
+                    box = (min(lng1, lng2) - margin_lng, min(lat1, lat2) - margin_lat,
+                           max(lng1, lng2) + margin_lng, max(lat1, lat2) + margin_lat)
+                    self.border_edges.append((lng1, lat1, lng2, lat2, box))
+            self.rings.append(edges)
+
+    def contains(self, lat: float, lng: float) -> bool:
+        """Ray Casting über alle Ringe (Even-Odd-Regel)."""
+        inside = False
+        for edges in self.rings:
+            for lng1, lat1, lng2, lat2 in edges:
+                if (lat1 > lat) != (lat2 > lat):
+                    cross = lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1)
+                    if lng < cross:
+                        inside = not inside
+        return inside
+
+    def near_border(self, lat: float, lng: float) -> bool:
+        """True, wenn der Punkt innerhalb von margin_km an einer Landgrenzkante liegt."""
+        kx, ky = self.km_per_deg_lng, _KM_PER_DEG_LAT
+        for lng1, lat1, lng2, lat2, box in self.border_edges:
+            if not (box[0] <= lng <= box[2] and box[1] <= lat <= box[3]):
+                continue
+            # Abstand Punkt-Strecke in einer lokalen Projektion (km)
+            ax, ay = (lng1 - lng) * kx, (lat1 - lat) * ky
+            bx, by = (lng2 - lng) * kx, (lat2 - lat) * ky
+            dx, dy = bx - ax, by - ay
+            length_sq = dx * dx + dy * dy
+            t = 0.0 if length_sq == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length_sq))
+            px, py = ax + t * dx, ay + t * dy
+            if px * px + py * py <= self.margin_km * self.margin_km:
+                return True
+        return False
+
+
+@lru_cache(maxsize=1)
+def _load_boundary() -> Optional[_PreparedBoundary]:
+    try:
+        with open(BOUNDARY_FILE, encoding='utf-8') as f:
+            return _PreparedBoundary(json.load(f), BORDER_MARGIN_KM)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Grenzpolygon konnte nicht geladen werden: {e}")
+        return None
+
+
+def locate_in_germany(lat: float, lng: float) -> Optional[bool]:
+    """
+    Prüft offline, ob ein Punkt in Deutschland liegt.
+
+    Args:
+        lat (float): Breitengrad
+        lng (float): Längengrad
+
+    Returns:
+        bool: True/False bei eindeutiger Lage, None in der Nähe einer Landgrenze
+        (oder wenn das Polygon fehlt) – dann entscheidet die Google API
+    """
+    boundary = _load_boundary()
+    if boundary is None:
+        return None
+
+    inner = boundary.inner_bbox
+    if inner and inner[0] <= lng <= inner[2] and inner[1] <= lat <= inner[3]:
+        return True
+
+    outer = boundary.outer_bbox
+    if not (outer[0] <= lng <= outer[2] and outer[1] <= lat <= outer[3]):
+        return False
+
+    if boundary.near_border(lat, lng):
+        return None
+    return boundary.contains(lat, lng)
+
+
+def is_in_germany(lat: float, lng: float) -> bool:
+    """Punkt-in-Polygon-Test ohne Unsicherheitszone (für Fallbacks ohne API)."""
+    boundary = _load_boundary()
+    if boundary is None:
+        return False
+    bbox = boundary.bbox
+    if not (bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+        return False
+    return boundary.contains(lat, lng)
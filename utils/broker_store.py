@@ -0,0 +1,689 @@
+import os
+import re
+import html
+import json
+import base64
+import sqlite3
+import math
+import time
+import string
+import logging
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from utils.geo import haversine_m
+from utils.place_cache import VOLATILE_FIELDS
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+BROKER_STORE_ENABLED = os.getenv('BROKER_STORE_ENABLED', 'true').lower() == 'true'
+
+# Gespeicherte Place Details / Kontaktdaten bis zu diesem Alter statt eines neuen Abrufs verwenden (Stunden)
+BROKER_DETAILS_MAX_AGE_HOURS = float(os.getenv('BROKER_DETAILS_MAX_AGE_HOURS', '24'))
+BROKER_SCRAPE_MAX_AGE_HOURS = float(os.getenv('BROKER_SCRAPE_MAX_AGE_HOURS', '168'))
+
+_NOT_AVAILABLE = 'Nicht verfügbar'
+
+# Felder eines Maklers und ihre Herkunft ('places' = Place Details, 'scrape' = Website)
+PLACES_FIELDS = ('name', 'address', 'website', 'rating', 'user_ratings_total', 'lat', 'lng')
+SCRAPE_FIELDS = ('email', 'contact_person')
+STORED_FIELDS = PLACES_FIELDS + ('phone',) + SCRAPE_FIELDS
+
+_PLZ_PATTERN = re.compile(r'\b(\d{5})\s+([^,\d][^,]*)')
+
+# Sortierungen der Bestandsabfrage: Spalte, Richtung, Index (Sortierspalte + place_id)
+_SORT_INDEXES = {
+    'name': ('name COLLATE NOCASE', 'ASC', 'idx_brokers_name_id'),
+    'rating': ('rating', 'DESC', 'idx_brokers_rating'),
+    'last_seen': ('last_seen', 'DESC', 'idx_brokers_last_seen')
+}
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# Bis zu so vielen Treffern gelten Filter als selektiv (Schlüssel holen und in Python sortieren)
+_SELECTIVITY_PROBE = 2000
+
+# Volltextindex: Spalten und ihre Gewichte für bm25
+FTS_FIELDS = ('name', 'contact_person', 'address', 'website')
+FTS_WEIGHTS = {'name': 10.0, 'contact_person': 5.0, 'address': 2.0, 'website': 1.0}
+# Kürzere Wortanfänge trifft jedes zweite Wort; sie liegen auch nicht im Präfix-Index
+FTS_MIN_TOKEN = 2
+FTS_MAX_TOKENS = 8
+# Wortzeichen wie bei unicode61: Buchstaben und Ziffern, '_' trennt
+_FTS_TOKEN = re.compile(r'[^\W_]+')
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def parse_plz(address: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Postleitzahl und Ort aus einer Google-Adresse ("Straße 1, 10117 Berlin, Deutschland").
+
+    Returns:
+        tuple: (plz, ort), jeweils None wenn nicht erkennbar
+    """
+    matches = _PLZ_PATTERN.findall(address or '')
+    if not matches:
+        return None, None
+    plz, ort = matches[-1]
+    return plz, ort.strip()
+
+
+def website_domain(url: str) -> Optional[str]:
+    """Domain einer Website ohne "www." (für Duplikatprüfung und Suche)."""
+    if not url or url == _NOT_AVAILABLE:
+        return None
+    netloc = urlparse(url if '://' in url else f'http://{url}').netloc.lower().split(':')[0]
+    return netloc[4:] if netloc.startswith('www.') else netloc or None
+
+
+def _available(value) -> bool:
+    return value not in (None, '', _NOT_AVAILABLE)
+
+
+def _fold(text: str) -> str:
+    """Kleinschreibung ohne Akzente, wie der Tokenizer unicode61 remove_diacritics."""
+    return ''.join(c for c in unicodedata.normalize('NFKD', text.lower()) if not unicodedata.combining(c))
+
+
+def _fts_tokens(text: str) -> List[str]:
+    tokens = [t for t in _FTS_TOKEN.findall(_fold(text or '')) if len(t) >= FTS_MIN_TOKEN]
+    return list(dict.fromkeys(tokens))[:FTS_MAX_TOKENS]
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Übersetzt eine Benutzereingabe in eine FTS5-Abfrage.
+
+    Wörter werden als Präfix gesucht und UND-verknüpft; FTS5-Syntax aus der
+    Eingabe (Anführungszeichen, OR, NEAR, Spaltenfilter) wird nicht ausgewertet.
+
+    Returns:
+        str: MATCH-Ausdruck oder None, wenn kein Wort lang genug ist
+    """
+    tokens = _fts_tokens(text)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def highlight_terms(value: Optional[str], prefixes: Tuple[str, ...]) -> Optional[str]:
+    """
+    Markiert Wörter, die mit einem der Suchbegriffe beginnen, mit <mark>.
+
+    Returns:
+        str: HTML-escapeter Text mit Markierungen oder None ohne Treffer
+    """
+    if not value or not prefixes:
+        return None
+    parts, last = [], 0
+    for match in _FTS_TOKEN.finditer(value):
+        if _fold(match.group()).startswith(prefixes):
+            parts.append(html.escape(value[last:match.start()]))
+            parts.append(f'<mark>{html.escape(match.group())}</mark>')
+            last = match.end()
+    if not parts:
+        return None
+    parts.append(html.escape(value[last:]))
+    return ''.join(parts)
+
+
+def data_quality(broker: Dict) -> int:
+    """
+    Vollständigkeit der Kontaktdaten von 0 bis 5 (E-Mail zählt doppelt).
+
+    Telefon, Website und Ansprechpartner je 1 Punkt, E-Mail 2 Punkte.
+    """
+    return (
+        _available(broker.get('phone')) + _available(broker.get('website'))
+        + 2 * _available(broker.get('email')) + _available(broker.get('contact_person'))
+    )
+
+
+def _distance_sq(center: Tuple[float, float]) -> Tuple[str, List[float]]:
+    """
+    SQL-Ausdruck für das Quadrat der Entfernung zu center in Grad Breite
+    (äquirektangulär, für kleine Entfernungen monoton zur echten Entfernung).
+
+    Returns:
+        tuple: (SQL-Ausdruck, Parameter)
+    """
+    scale = math.cos(math.radians(center[0]))
+    return ('((lat - ?) * (lat - ?) + (lng - ?) * (lng - ?) * ?)',
+            [center[0], center[0], center[1], center[1], scale * scale])
+
+
+class BrokerStore:
+    """
+    Dauerhafte Ablage aller angereicherten Makler, Schlüssel ist die place_id.
+
+    Felder werden nur überschrieben, wenn der neue Wert vorhanden ist; ein
+    fehlgeschlagenes Scraping löscht also keine früher gefundene E-Mail. Pro
+    Feld wird festgehalten, woher und von wann der Wert stammt.
+    """
+
+    def __init__(self, db_file: str = 'brokers.sqlite3'):
+        self.db_path = data_path(db_file)
+        self._ensure_schema()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_schema(self):
+        with _schema_lock:
+            if self.db_path in _initialized:
+                return
+            conn = self._conn()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS brokers ('
+                ' place_id TEXT PRIMARY KEY,'
+                ' name TEXT,'
+                ' address TEXT,'
+                ' plz TEXT,'
+                ' ort TEXT,'
+                ' phone TEXT,'
+                ' website TEXT,'
+                ' website_domain TEXT,'
+                ' email TEXT,'
+                ' contact_person TEXT,'
+                ' rating REAL,'
+                ' user_ratings_total INTEGER,'
+                ' lat REAL,'
+                ' lng REAL,'
+                ' provenance TEXT NOT NULL,'
+                ' first_seen REAL NOT NULL,'
+                ' last_seen REAL NOT NULL,'
+                ' last_details REAL,'
+                ' last_scraped REAL,'
+                ' quality INTEGER NOT NULL DEFAULT 0)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_plz ON brokers (plz)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_domain ON brokers (website_domain)')
+            # Sortierung mit Keyset-Paging (Sortierspalte + place_id) und räumliche Vorauswahl
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_name_id ON brokers (name COLLATE NOCASE, place_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_rating ON brokers (rating, place_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_last_seen ON brokers (last_seen, place_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_lat ON brokers (lat, lng)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_brokers_quality ON brokers (quality, email)')
+            self._ensure_fts(conn)
+            _initialized.add(self.db_path)
+
+    @staticmethod
+    def _ensure_fts(conn):
+        """
+        Volltextindex über Name, Ansprechpartner, Adresse und Website.
+
+        Der Index speichert nur Tokens (content='brokers'); Trigger halten ihn bei
+        jedem Upsert aktuell. Präfix-Indizes für 2 und 3 Zeichen machen
+        Teilwortsuchen ("allia" findet "Allianz") ebenso schnell wie ganze Wörter.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'brokers_fts'"
+        ).fetchone()
+        columns = ', '.join(FTS_FIELDS)
+        new_columns = ', '.join('new.' + field for field in FTS_FIELDS)
+        old_columns = ', '.join('old.' + field for field in FTS_FIELDS)
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS brokers_fts USING fts5({columns}, "
+            f"content='brokers', content_rowid='rowid', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS brokers_fts_insert AFTER INSERT ON brokers BEGIN "
+            f"INSERT INTO brokers_fts (rowid, {columns}) VALUES (new.rowid, {new_columns}); END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS brokers_fts_delete AFTER DELETE ON brokers BEGIN "
+            f"INSERT INTO brokers_fts (brokers_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_columns}); END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS brokers_fts_update AFTER UPDATE OF {columns} ON brokers BEGIN "
+            f"INSERT INTO brokers_fts (brokers_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_columns}); "
+            f"INSERT INTO brokers_fts (rowid, {columns}) VALUES (new.rowid, {new_columns}); END"
+        )
+        if not exists:
+            # Bestand aus der Zeit vor dem Volltextindex nachträglich indizieren
+            conn.execute("INSERT INTO brokers_fts (brokers_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _row_to_broker(row) -> Dict:
+        broker = dict(row)
+        broker.pop('d2', None)
+        broker['provenance'] = json.loads(broker['provenance'])
+        for field in ('phone', 'website', 'email', 'contact_person'):
+            if broker[field] is None:
+                broker[field] = _NOT_AVAILABLE
+        return broker
+
+    def get_many(self, place_ids: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Liest gespeicherte Makler.
+
+        Returns:
+            dict: place_id -> Makler (mit provenance, first_seen, last_seen, last_details, last_scraped)
+        """
+        place_ids = [p for p in dict.fromkeys(place_ids) if p]
+        if not place_ids:
+            return {}
+        brokers = {}
+        conn = self._conn()
+        # SQLite erlaubt standardmäßig höchstens 999 Platzhalter pro Abfrage
+        for start in range(0, len(place_ids), 500):
+            chunk = place_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT * FROM brokers WHERE place_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            brokers.update((row['place_id'], self._row_to_broker(row)) for row in rows)
+        return brokers
+
+    def get(self, place_id: str) -> Optional[Dict]:
+        return self.get_many([place_id]).get(place_id)
+
+    def upsert_many(self, entries: List[Tuple[Dict, Dict]], touch_seen: bool = True) -> int:
+        """
+        Speichert die Makler einer Suche oder Ergebnisseite in einer Transaktion.
+
+        Args:
+            entries (list): (Makler-Datensatz, Herkunft) mit Herkunft als
+                {feld: 'places' | 'scrape' | 'excel'} für die gelieferten Felder;
+                der Schlüssel 'scraped' = True vermerkt ein durchgeführtes Scraping
+            touch_seen (bool): last_seen setzen (False für Auffrischungen ohne Suche)
+
+        Returns:
+            int: Anzahl gespeicherter Makler
+        """
+        entries = [(broker, sources) for broker, sources in entries if broker.get('place_id')]
+        if not entries:
+            return 0
+
+        now = time.time()
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            existing = self.get_many(broker['place_id'] for broker, _ in entries)
+            rows = []
+            for broker, sources in entries:
+                stored = existing.get(broker['place_id']) or {}
+                provenance = dict(stored.get('provenance') or {})
+                merged = {}
+                for field in STORED_FIELDS:
+                    value = broker.get(field)
+                    if _available(value) and field in sources:
+                        merged[field] = value
+                        provenance[field] = {'source': sources[field], 'at': now}
+                    else:
+                        merged[field] = stored.get(field) if _available(stored.get(field)) else None
+
+                merged['rating'] = merged['rating'] or 0
+                merged['user_ratings_total'] = merged['user_ratings_total'] or 0
+                plz, ort = parse_plz(merged['address'])
+                # Nachgeladene Bewertungen allein zählen nicht als Details-Abruf
+                has_details = any(sources.get(f) == 'places' for f in PLACES_FIELDS if f not in VOLATILE_FIELDS)
+                row = dict(
+                    merged,
+                    place_id=broker['place_id'],
+                    plz=plz,
+                    ort=ort,
+                    website_domain=website_domain(merged['website']),
+                    quality=data_quality(merged),
+                    provenance=json.dumps(provenance),
+                    first_seen=stored.get('first_seen', now),
+                    last_seen=now if touch_seen or not stored else stored['last_seen'],
+                    last_details=now if has_details else stored.get('last_details'),
+                    last_scraped=now if sources.get('scraped') else stored.get('last_scraped')
+                )
+                existing[broker['place_id']] = dict(row, provenance=provenance)
+                rows.append(row)
+
+            # ON CONFLICT statt INSERT OR REPLACE: hält die rowid stabil und löst die
+            # Update-Trigger des Volltextindex aus (REPLACE feuert keine Delete-Trigger)
+            columns = list(rows[0])
+            conn.executemany(
+                f"INSERT INTO brokers ({', '.join(columns)}) "
+                f"VALUES ({', '.join(':' + c for c in columns)}) "
+                f"ON CONFLICT (place_id) DO UPDATE SET "
+                f"{', '.join(f'{c} = excluded.{c}' for c in columns if c != 'place_id')}",
+                rows
+            )
+            conn.execute('COMMIT')
+            return len(rows)
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            logger.warning(f"Makler konnten nicht gespeichert werden: {e}")
+            return 0
+
+    def query(self, plz_prefix: Optional[str] = None, bbox: Optional[Tuple[float, float, float, float]] = None,
+              center: Optional[Tuple[float, float]] = None, radius_km: Optional[float] = None,
+              min_rating: Optional[float] = None, has_email: Optional[bool] = None,
+              min_quality: Optional[int] = None, sort: str = 'name', limit: int = 50,
+              after: Optional[List] = None) -> Tuple[List[Dict], Optional[List]]:
+        """
+        Filtert den Bestand mit Keyset-Paging.
+
+        Args:
+            plz_prefix (str): Anfang der Postleitzahl ("10", "101")
+            bbox (tuple): (min_lat, min_lng, max_lat, max_lng); mit Umkreis gelten beide
+            center (tuple): (lat, lng) für Umkreissuche und Sortierung 'distance'
+            radius_km (float): Umkreis um center
+            min_rating (float): Mindestbewertung
+            has_email (bool): Nur Makler mit (True) bzw. ohne (False) E-Mail
+            min_quality (int): Mindestvollständigkeit siehe data_quality()
+            sort (str): 'name', 'rating', 'last_seen' oder 'distance' (nur mit center)
+            limit (int): Maximale Anzahl Makler
+            after (list): Sortierschlüssel des letzten Maklers der Vorseite (next_after)
+
+        Returns:
+            tuple: (Makler, next_after oder None auf der letzten Seite)
+        """
+        where, args = [], []
+        if plz_prefix:
+            # Bereichsabfrage statt LIKE, damit der PLZ-Index greift
+            where.append('plz >= ? AND plz < ?')
+            args += [plz_prefix, plz_prefix + '\uffff']
+        if center and radius_km:
+            # Umschließendes Quadrat für den Index (mit einer übergebenen bbox geschnitten),
+            # danach der genaue Kreis
+            lat_delta = radius_km / 111.32
+            lng_delta = radius_km / (111.32 * max(math.cos(math.radians(center[0])), 0.01))
+            where.append('lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?')
+            args += [center[0] - lat_delta, center[0] + lat_delta, center[1] - lng_delta, center[1] + lng_delta]
+            d2, d2_args = _distance_sq(center)
+            where.append(f'{d2} <= ?')
+            args += d2_args + [lat_delta ** 2]
+        if bbox:
+            where.append('lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?')
+            args += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        if min_rating is not None:
+            where.append('rating >= ?')
+            args.append(min_rating)
+        if has_email is not None:
+            where.append('email IS NOT NULL' if has_email else 'email IS NULL')
+        if min_quality is not None:
+            where.append('quality >= ?')
+            args.append(min_quality)
+
+        if sort == 'distance':
+            if not center:
+                raise ValueError("Sortierung 'distance' braucht einen Mittelpunkt")
+            return self._query_by_distance(where, args, center, limit, after)
+
+        if sort not in _SORT_INDEXES:
+            raise ValueError(f"Unbekannte Sortierung: {sort}")
+        column, direction, index = _SORT_INDEXES[sort]
+        compare = '>' if direction == 'ASC' else '<'
+
+        # Ohne Histogramme kennt SQLite die Selektivität der Filter nicht; deshalb den
+        # Zugriffsweg selbst wählen: Liefern die Filter wenige Treffer, deren Schlüssel
+        # holen und in Python sortieren, sonst in Sortierreihenfolge über den Sortierindex
+        if where:
+            keys = self._conn().execute(
+                f"SELECT {column} AS sort_key, place_id FROM brokers WHERE {' AND '.join(where)} LIMIT ?",
+                args + [_SELECTIVITY_PROBE]
+            ).fetchall()
+            if len(keys) < _SELECTIVITY_PROBE:
+                return self._page_from_keys(keys, sort, direction, limit, after)
+
+        if after:
+            where.append(f'({column}, place_id) {compare} (?, ?)')
+            args += [after[0], after[1]]
+        sql = f'SELECT * FROM brokers INDEXED BY {index}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        rows = self._conn().execute(
+            f'{sql} ORDER BY {column} {direction}, place_id {direction} LIMIT ?', args + [limit + 1]
+        ).fetchall()
+
+        brokers = [self._row_to_broker(row) for row in rows[:limit]]
+        next_after = None
+        if len(rows) > limit:
+            last = brokers[-1]
+            next_after = [last[sort], last['place_id']]
+        return brokers, next_after
+
+    def _page_from_keys(self, keys: List, sort: str, direction: str, limit: int,
+                        after: Optional[List]) -> Tuple[List[Dict], Optional[List]]:
+        """Keyset-Seite aus (Sortierschlüssel, place_id)-Paaren weniger Treffer."""
+        descending = direction == 'DESC'
+
+        def sort_key(row):
+            value = row['sort_key']
+            if sort == 'name':
+                # Wie COLLATE NOCASE: nur A-Z falten, damit beide Zugriffswege gleich sortieren
+                value = (value or '').translate(_ASCII_LOWER)
+            return value if value is not None else 0, row['place_id']
+
+        ranked = sorted((sort_key(row) for row in keys), reverse=descending)
+        if after:
+            bound = sort_key({'sort_key': after[0], 'place_id': after[1]})
+            ranked = [k for k in ranked if (k < bound if descending else k > bound)]
+        page = ranked[:limit]
+        stored = self.get_many(place_id for _, place_id in page)
+        brokers = [stored[place_id] for _, place_id in page if place_id in stored]
+        next_after = None
+        if len(ranked) > limit and brokers:
+            next_after = [brokers[-1][sort], brokers[-1]['place_id']]
+        return brokers, next_after
+
+    def _query_by_distance(self, where: List[str], args: List, center: Tuple[float, float], limit: int,
+                           after: Optional[List]) -> Tuple[List[Dict], Optional[List]]:
+        """
+        Umkreissuche: Filter inkl. Radius aus query(), Reihenfolge nach der
+        äquirektangulären Näherung (in SQL berechnet), Entfernung per Haversine.
+        """
+        lat0, lng0 = center
+        d2, d2_args = _distance_sq(center)
+
+        where = list(where) + ['lat IS NOT NULL']
+        args = list(args)
+        if after:
+            where.append(f'({d2}, place_id) > (?, ?)')
+            args += d2_args + [after[0], after[1]]
+
+        rows = self._conn().execute(
+            f"SELECT *, {d2} AS d2 FROM brokers WHERE {' AND '.join(where)} "
+            f"ORDER BY d2, place_id LIMIT {int(limit) + 1}",
+            d2_args + args
+        ).fetchall()
+
+        brokers = []
+        for row in rows[:limit]:
+            broker = self._row_to_broker(row)
+            broker['distance_km'] = round(haversine_m(lat0, lng0, broker['lat'], broker['lng']) / 1000, 2)
+            brokers.append(broker)
+        next_after = [rows[limit - 1]['d2'], rows[limit - 1]['place_id']] if len(rows) > limit else None
+        return brokers, next_after
+
+    def search(self, text: str, limit: int = 20) -> List[Dict]:
+        """
+        Volltextsuche nach Firmenname, Ansprechpartner, Straße oder Website.
+
+        Jedes Wort der Eingabe muss (als Wortanfang) vorkommen; Treffer im Namen
+        wiegen am stärksten (bm25).
+
+        Args:
+            text (str): Suchbegriff(e), z.B. "allianz müller"
+            limit (int): Maximale Anzahl Treffer
+
+        Returns:
+            list: Makler nach Relevanz mit score und highlights
+            ({feld: HTML mit <mark>} für die Felder mit Treffern)
+        """
+        match = fts_query(text)
+        if not match:
+            return []
+        weights = ', '.join(str(FTS_WEIGHTS[field]) for field in FTS_FIELDS)
+        try:
+            # Nur bm25 im Index auswerten; highlight() kostet pro Treffer und
+            # würde bei häufigen Wörtern für alle statt für die ausgelieferten laufen
+            rows = self._conn().execute(
+                f"SELECT b.*, hits.score FROM ("
+                f" SELECT rowid, bm25(brokers_fts, {weights}) AS score"
+                f" FROM brokers_fts WHERE brokers_fts MATCH ? ORDER BY score LIMIT ?"
+                f") AS hits JOIN brokers AS b ON b.rowid = hits.rowid ORDER BY hits.score",
+                (match, int(limit))
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Volltextsuche nach '{text}' fehlgeschlagen: {e}")
+            return []
+
+        prefixes = tuple(_fts_tokens(text))
+        brokers = []
+        for row in rows:
+            row = dict(row)
+            score = row.pop('score')
+            broker = self._row_to_broker(row)
+            broker['score'] = round(-score, 4)
+            marked = {field: highlight_terms(row[field], prefixes) for field in FTS_FIELDS}
+            broker['highlights'] = {field: value for field, value in marked.items() if value}
+            brokers.append(broker)
+        return brokers
+
+    def stale_brokers(self, details_before: float, rating_before: float, scrape_before: float,
+                      bbox: Optional[Tuple[float, float, float, float]] = None,
+                      limit: int = 500) -> List[Dict]:
+        """
+        Makler mit mindestens einem veralteten Feld, die bestbewerteten zuerst.
+
+        Args:
+            details_before (float): Place Details vor diesem Zeitpunkt gelten als veraltet
+            rating_before (float): Bewertungen vor diesem Zeitpunkt gelten als veraltet
+            scrape_before (float): Kontaktdaten von Websites vor diesem Zeitpunkt gelten als veraltet
+            bbox (tuple): Optional nur Makler in (min_lat, min_lng, max_lat, max_lng)
+            limit (int): Maximale Anzahl Makler
+
+        Returns:
+            list: Makler (wie get_many) absteigend nach Bewertung
+        """
+        where = [
+            "(COALESCE(last_details, 0) < ?"
+            " OR COALESCE(json_extract(provenance, '$.rating.at'), last_details, 0) < ?"
+            " OR (website IS NOT NULL AND COALESCE(last_scraped, 0) < ?))"
+        ]
+        args = [details_before, rating_before, scrape_before]
+        if bbox:
+            where.append('lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?')
+            args += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        rows = self._conn().execute(
+            f"SELECT * FROM brokers WHERE {' AND '.join(where)} ORDER BY rating DESC, place_id LIMIT ?",
+            args + [int(limit)]
+        ).fetchall()
+        return [self._row_to_broker(row) for row in rows]
+
+    def count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM brokers').fetchone()[0]
+
+
+def parse_query_args(args) -> Dict:
+    """
+    Liest die Filter von /api/brokers aus den Query-Parametern.
+
+    Args:
+        args: Query-Parameter (z.B. request.args)
+
+    Returns:
+        dict: Schlüsselwortargumente für BrokerStore.query() ohne sort/limit/after
+
+    Raises:
+        ValueError: bei ungültigen Parametern
+    """
+    filters = {}
+    plz = (args.get('plz') or '').strip()
+    if plz:
+        if not re.fullmatch(r'\d{1,5}', plz):
+            raise ValueError('plz muss aus 1 bis 5 Ziffern bestehen')
+        filters['plz_prefix'] = plz
+
+    def number(name, cast=float):
+        value = (args.get(name) or '').strip()
+        if not value:
+            return None
+        try:
+            result = cast(value)
+        except ValueError:
+            raise ValueError(f'{name} ist keine gültige Zahl')
+        if not math.isfinite(result):
+            raise ValueError(f'{name} ist keine gültige Zahl')
+        return result
+
+    bbox = (args.get('bbox') or '').strip()
+    if bbox:
+        try:
+            parts = tuple(float(part) for part in bbox.split(','))
+        except ValueError:
+            parts = ()
+        if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+            raise ValueError('bbox erwartet min_lat,min_lng,max_lat,max_lng')
+        filters['bbox'] = parts
+
+    lat, lng, radius = number('lat'), number('lng'), number('radius')
+    if (lat is None) != (lng is None):
+        raise ValueError('lat und lng nur gemeinsam angeben')
+    if lat is not None:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError('lat/lng außerhalb des gültigen Bereichs')
+        filters['center'] = (lat, lng)
+    if radius is not None:
+        if lat is None:
+            raise ValueError('radius braucht lat und lng')
+        if not 0 < radius <= 500:
+            raise ValueError('radius muss zwischen 0 und 500 km liegen')
+        filters['radius_km'] = radius
+
+    min_rating = number('min_rating')
+    if min_rating is not None:
+        filters['min_rating'] = min_rating
+    min_quality = number('min_quality', int)
+    if min_quality is not None:
+        if not 0 <= min_quality <= 5:
+            raise ValueError('min_quality muss zwischen 0 und 5 liegen')
+        filters['min_quality'] = min_quality
+
+    has_email = (args.get('has_email') or '').strip().lower()
+    if has_email:
+        if has_email not in ('1', '0', 'true', 'false'):
+            raise ValueError('has_email erwartet true oder false')
+        filters['has_email'] = has_email in ('1', 'true')
+    return filters
+
+
+def encode_query_cursor(sort: str, after: List) -> str:
+    """Cursor für /api/brokers: Sortierung und Schlüssel des letzten Maklers."""
+    raw = json.dumps([sort, after], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_query_cursor(cursor: str, sort: str) -> Optional[List]:
+    """
+    Liest einen Cursor aus encode_query_cursor().
+
+    Returns:
+        list: after für BrokerStore.query() oder None, wenn der Cursor ungültig
+        ist oder zu einer anderen Sortierung gehört
+    """
+    try:
+        cursor_sort, after = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if cursor_sort != sort or not isinstance(after, list) or len(after) != 2 \
+            or not isinstance(after[1], str) or isinstance(after[0], (list, dict)):
+        return None
+    return after
+
+
+_broker_store: Optional[BrokerStore] = None
+_broker_store_lock = threading.Lock()
+
+
+def get_broker_store() -> Optional[BrokerStore]:
+    """Liefert den prozessweiten Makler-Bestand oder None, wenn er deaktiviert ist."""
+    global _broker_store
+    if not BROKER_STORE_ENABLED:
+        return None
+    with _broker_store_lock:
+        if _broker_store is None:
+            _broker_store = BrokerStore()
+        return _broker_store
@@ -0,0 +1,147 @@
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from utils.geo import annotate_and_filter
+from utils.geocoding import get_geocode_cache, get_maps_client, normalize_location, geocode_uncached
+from utils.localities import get_localities
+
+logger = logging.getLogger(__name__)
+
+# Parallele Geocoding-Aufrufe und Obergrenze pro Sekunde (Google erlaubt 50 QPS)
+BULK_GEOCODE_WORKERS = int(os.getenv('BULK_GEOCODE_WORKERS', '8'))
+BULK_GEOCODE_QPS = float(os.getenv('BULK_GEOCODE_QPS', '40'))
+
+# Nur PLZ, optional mit Ort ("10117", "D-10117 Berlin"); 4 Ziffern oder "1067.0"
+# entstehen, wenn Excel die Spalte als Zahl speichert und die führende Null verliert
+_PLZ_ONLY_PATTERN = re.compile(r"^(?:D-?\s*)?(\d{4,5})(?:\.0)?(?:\s+([^\d,]+))?$", re.IGNORECASE)
+
+
+class RateLimiter:
+    """Verteilt Aufrufe mehrerer Threads gleichmäßig auf höchstens rate pro Sekunde."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def parse_plz_only(address: str) -> Optional[Dict]:
+    """
+    Erkennt Adressen ohne Straße, die sich über den PLZ-Schwerpunkt auflösen lassen.
+
+    Returns:
+        dict: plz (5-stellig) und ort (oder None) bzw. None bei vollständigen Adressen
+    """
+    match = _PLZ_ONLY_PATTERN.match((address or '').strip())
+    if not match:
+        return None
+    return {'plz': match.group(1).zfill(5), 'ort': (match.group(2) or '').strip() or None}
+
+
+def geocode_addresses(addresses: Iterable[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Geocodiert viele Adressen auf einmal.
+
+    Jede Adresse wird nur einmal aufgelöst: zuerst aus dem Geocoding-Cache, dann
+    reine Postleitzahlen offline über die PLZ-Schwerpunkte, der Rest parallel
+    über Google mit BULK_GEOCODE_QPS Aufrufen pro Sekunde.
+
+    Args:
+        addresses (iterable): Adressen wie im Upload angegeben
+
+    Returns:
+        dict: Normalisierte Adresse -> {'lat', 'lng', 'source'} oder None
+    """
+    pending = {}
+    for address in addresses:
+        key = normalize_location(address)
+        if key and key not in pending:
+            pending[key] = address
+
+    results: Dict[str, Optional[Dict]] = {}
+    counts = {'cache': 0, 'plz': 0, 'google': 0, 'failed': 0}
+    cache = get_geocode_cache()
+    localities = get_localities()
+
+    remaining = {}
+    for key, address in pending.items():
+        cached = cache.get(key)
+        if cached:
+            results[key] = dict(cached, source='cache')
+            counts['cache'] += 1
+            continue
+        plz_only = parse_plz_only(address)
+        centroid = plz_only and localities.plz_centroid(plz_only['plz'], plz_only['ort'])
+        if centroid:
+            results[key] = dict(centroid, source='plz')
+            counts['plz'] += 1
+            continue
+        remaining[key] = address
+
+    if remaining:
+        gmaps = get_maps_client()
+        limiter = RateLimiter(BULK_GEOCODE_QPS)
+
+        def geocode(item):
+            key, address = item
+            if not gmaps:
+                return key, None
+            limiter.wait()
+            try:
+                return key, geocode_uncached(address, key, gmaps)
+            except Exception as e:
+                logger.warning(f"Geocodierung von {address} fehlgeschlagen: {e}")
+                return key, None
+
+        workers = max(1, min(len(remaining), BULK_GEOCODE_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for key, location in executor.map(geocode, remaining.items()):
+                results[key] = dict(location, source='google') if location else None
+                counts['google' if location else 'failed'] += 1
+
+    logger.info(
+        f"{len(pending)} Adressen geocodiert: {counts['cache']} aus dem Cache, "
+        f"{counts['plz']} offline über die PLZ, {counts['google']} über Google, "
+        f"{counts['failed']} nicht gefunden"
+    )
+    return results
+
+
+def attach_coordinates(brokers: List[Dict], center: Optional[Dict] = None) -> List[Dict]:
+    """
+    Ergänzt lat, lng und geocode_source für Makler mit Adresse (z.B. aus dem Excel-Upload).
+
+    Args:
+        brokers (list): Makler-Datensätze mit 'address'
+        center (dict): Optionaler Suchmittelpunkt; dann wird auch distance_km gesetzt
+
+    Returns:
+        list: Dieselben Datensätze, in-place ergänzt
+    """
+    if not brokers:
+        return brokers
+
+    results = geocode_addresses(b['address'] for b in brokers if b.get('address'))
+    for broker in brokers:
+        location = results.get(normalize_location(broker.get('address', '')))
+        if location:
+            broker['lat'] = location['lat']
+            broker['lng'] = location['lng']
+            broker['geocode_source'] = location['source']
+
+    if center:
+        annotate_and_filter(brokers, center['lat'], center['lng'])
+    return brokers
@@ -0,0 +1,148 @@
+import json
+import time
+import logging
+import threading
+from typing import Any, Optional, Tuple
+
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+class TTLCache:
+    """
+    Persistenter Schlüssel/Wert-Cache auf SQLite-Basis mit TTL und Größenbegrenzung.
+
+    Mehrere Caches teilen sich eine Datei und werden über einen Namespace getrennt.
+    Werte werden als JSON gespeichert, damit alle Gunicorn-Worker sie lesen können.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: float, max_entries: int = 10000,
+                 db_file: str = 'cache.sqlite3'):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.db_path = data_path(db_file)
+        self._writes = 0
+        self._ensure_schema()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_schema(self):
+        with _schema_lock:
+            if self.db_path in _initialized:
+                return
+            conn = self._conn()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                ' namespace TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' value TEXT NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL,'
+                ' PRIMARY KEY (namespace, key))'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_cache_accessed '
+                'ON cache_entries (namespace, accessed_at)'
+            )
+            _initialized.add(self.db_path)
+
+    def get_with_age(self, key: str, max_age: Optional[float] = None) -> Tuple[Optional[Any], Optional[float]]:
+        """
+        Liest einen Eintrag samt Alter in Sekunden.
+
+        Args:
+            key (str): Cache-Schlüssel
+            max_age (float): Optional abweichende maximale Lebensdauer
+
+        Returns:
+            tuple: (Wert, Alter) oder (None, None) wenn nicht vorhanden/abgelaufen
+        """
+        max_age = self.ttl_seconds if max_age is None else max_age
+        try:
+            row = self._conn().execute(
+                'SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None, None
+
+            now = time.time()
+            age = now - row['created_at']
+            if age > max_age:
+                return None, None
+
+            self._conn().execute(
+                'UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                (now, self.namespace, key)
+            )
+            return json.loads(row['value']), age
+        except Exception as e:
+            logger.warning(f"Cache-Lesefehler ({self.namespace}): {e}")
+            return None, None
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[Any]:
+        """Liest einen Eintrag oder None, wenn er fehlt oder abgelaufen ist."""
+        value, _ = self.get_with_age(key, max_age)
+        return value
+
+    def set(self, key: str, value: Any, created_at: Optional[float] = None):
+        """Speichert einen Eintrag und räumt den Namespace gelegentlich auf."""
+        now = time.time()
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, key, json.dumps(value, ensure_ascii=False),
+                 created_at if created_at is not None else now, now)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self.evict()
+        except Exception as e:
+            logger.warning(f"Cache-Schreibfehler ({self.namespace}): {e}")
+
+    def delete(self, key: str):
+        """Entfernt einen Eintrag."""
+        try:
+            self._conn().execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            )
+        except Exception as e:
+            logger.warning(f"Cache-Löschfehler ({self.namespace}): {e}")
+
+    def evict(self) -> int:
+        """
+        Entfernt abgelaufene Einträge und die am längsten nicht genutzten,
+        sobald der Namespace mehr als max_entries Einträge enthält.
+
+        Returns:
+            int: Anzahl entfernter Einträge
+        """
+        conn = self._conn()
+        removed = conn.execute(
+            'DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?',
+            (self.namespace, time.time() - self.ttl_seconds)
+        ).rowcount
+
+        count = conn.execute(
+            'SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (self.namespace,)
+        ).fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            removed += conn.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key IN ('
+                ' SELECT key FROM cache_entries WHERE namespace = ?'
+                ' ORDER BY accessed_at ASC LIMIT ?)',
+                (self.namespace, self.namespace, overflow)
+            ).rowcount
+
+        if removed:
+            logger.info(f"Cache {self.namespace}: {removed} Einträge entfernt")
+        return removed
@@ -0,0 +1,167 @@
+import os
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from utils.broker_store import (
+    get_broker_store, PLACES_FIELDS, BROKER_DETAILS_MAX_AGE_HOURS, BROKER_SCRAPE_MAX_AGE_HOURS
+)
+from utils.geo import broker_location
+from utils.geocoding import get_maps_client, get_candidate_details
+from utils.jobs import job_heartbeat
+from utils.scraper import scrape_broker_website
+
+logger = logging.getLogger(__name__)
+
+# Anzahl Makler pro Ergebnisseite, die sofort angereichert werden
+RESULTS_PAGE_SIZE = int(os.getenv('RESULTS_PAGE_SIZE', '10'))
+
+_NOT_AVAILABLE = 'Nicht verfügbar'
+
+
+def build_broker_record(broker: Dict, scraped: Optional[Dict], location: str, radius_km: int) -> Dict:
+    """
+    Führt Place Details und Scraping-Daten zu einem Makler-Datensatz zusammen.
+
+    Args:
+        broker (dict): Kandidat bzw. Place Details
+        scraped (dict): Ergebnis von scrape_broker_website() oder None
+        location (str): Suchort
+        radius_km (int): Suchradius in km
+
+    Returns:
+        dict: Makler-Datensatz für Anzeige, Export und API
+    """
+    scraped = scraped or {}
+    coords = broker_location(broker)
+    return {
+        'name': broker.get('name', 'Unbekannt'),
+        'address': broker.get('formatted_address', broker.get('vicinity', 'Unbekannt')),
+        'phone': broker.get('formatted_phone_number', scraped.get('phone', _NOT_AVAILABLE)),
+        'website': broker.get('website', _NOT_AVAILABLE),
+        'email': scraped.get('email', _NOT_AVAILABLE),
+        'contact_person': scraped.get('contact_person', _NOT_AVAILABLE),
+        'rating': broker.get('rating', 0),
+        'user_ratings_total': broker.get('user_ratings_total', 0),
+        'place_id': broker.get('place_id', ''),
+        'distance_km': broker.get('distance_km'),
+        'lat': coords[0] if coords else None,
+        'lng': coords[1] if coords else None,
+        'search_location': location,
+        'search_radius': radius_km,
+        'found_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def details_from_store(known: Dict, candidate: Dict) -> Dict:
+    """
+    Baut aus einem gespeicherten Makler einen Datensatz im Format der Place Details.
+
+    Die Entfernung stammt aus der Nearby-Suche, weil sie sich auf den
+    aktuellen Suchort bezieht.
+    """
+    details = {
+        'place_id': known['place_id'],
+        'name': known['name'] or candidate.get('name', 'Unbekannt'),
+        'formatted_address': known['address'] or candidate.get('vicinity', 'Unbekannt'),
+        'rating': known['rating'] or 0,
+        'user_ratings_total': known['user_ratings_total'] or 0,
+        'lat': known['lat'],
+        'lng': known['lng']
+    }
+    if known['website'] != _NOT_AVAILABLE:
+        details['website'] = known['website']
+    if (known['provenance'].get('phone') or {}).get('source') == 'places':
+        details['formatted_phone_number'] = known['phone']
+    if 'distance_km' in candidate:
+        details['distance_km'] = candidate['distance_km']
+    return details
+
+
+def enrich_brokers(candidates: List[Dict], location: str, radius_km: int,
+                   scrape_max_age: Optional[float] = None,
+                   on_details: Optional[Callable[[int, Dict], None]] = None,
+                   on_scraped: Optional[Callable[[int, Dict], None]] = None) -> List[Dict]:
+    """
+    Lädt Place Details und scrapt Websites für eine Liste von Kandidaten.
+
+    Jeder Kandidat wird in einem eigenen Task angereichert (erst Details, dann
+    Scraping); die Reihenfolge der Kandidaten bleibt erhalten. Ausreichend
+    aktuelle Daten aus dem Makler-Bestand ersetzen die Abrufe, neue Daten
+    werden am Ende gesammelt dort gespeichert.
+
+    Args:
+        candidates (list): Kandidaten aus search_insurance_brokers()
+        location (str): Suchort
+        radius_km (int): Suchradius in km
+        scrape_max_age (float): Gescrapte Kontaktdaten älter als scrape_max_age Sekunden neu laden
+        on_details (callable): Optional on_details(index, datensatz), sobald die Place Details
+            eines Kandidaten vorliegen (noch ohne Scraping-Daten)
+        on_scraped (callable): Optional on_scraped(index, datensatz) mit dem fertigen Datensatz
+
+    Returns:
+        list: Makler-Datensätze
+    """
+    if not candidates:
+        return []
+
+    gmaps = get_maps_client()
+    store = get_broker_store()
+    stored = store.get_many(c.get('place_id') for c in candidates) if store else {}
+    now = time.time()
+    scrape_reuse_age = BROKER_SCRAPE_MAX_AGE_HOURS * 3600
+    if scrape_max_age is not None:
+        scrape_reuse_age = min(scrape_reuse_age, scrape_max_age)
+    heartbeat = job_heartbeat()
+
+    def enrich(indexed):
+        index, candidate = indexed
+        known = stored.get(candidate.get('place_id'))
+        # Herkunft der neu abgerufenen Felder für den Bestand (leer = nur last_seen aktualisieren)
+        sources = {}
+
+        if known and now - (known['last_details'] or 0) <= BROKER_DETAILS_MAX_AGE_HOURS * 3600:
+            # Place Details aus dem Makler-Bestand, kein Google-Aufruf
+            details = details_from_store(known, candidate)
+        else:
+            details = get_candidate_details(gmaps, candidate)
+            source = 'nearby' if 'vicinity' in details else 'places'
+            sources.update({field: source for field in PLACES_FIELDS})
+            if details.get('formatted_phone_number'):
+                sources['phone'] = source
+        # Kandidaten einer Sammelsuche bringen ihren eigenen (nächsten) Suchort mit
+        search_location = candidate.get('search_location', location)
+        heartbeat()
+        if on_details:
+            on_details(index, build_broker_record(details, None, search_location, radius_km))
+
+        website = details.get('website', '')
+        if known and website == known['website'] and now - (known['last_scraped'] or 0) <= scrape_reuse_age:
+            # Kontaktdaten aus dem Bestand statt erneutem Scraping
+            scraped = {field: known[field] for field in ('email', 'contact_person', 'phone')}
+        else:
+            try:
+                # Web-Scraping für zusätzliche Details
+                scraped = scrape_broker_website(website, max_age=scrape_max_age)
+                if website:
+                    sources.update({'email': 'scrape', 'contact_person': 'scrape', 'scraped': True})
+                    sources.setdefault('phone', 'scrape')
+            except Exception as e:
+                logger.warning(f"Fehler beim Scraping für {details.get('name', 'Unbekannt')}: {str(e)}")
+                scraped = None
+        record = build_broker_record(details, scraped, search_location, radius_km)
+        heartbeat()
+        if on_scraped:
+            on_scraped(index, record)
+        return record, sources
+
+    workers = min(len(candidates), int(os.getenv('ENRICH_WORKERS', '8')))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(enrich, enumerate(candidates)))
+
+    # Alle Makler dieser Seite in einer Transaktion in den Bestand übernehmen
+    if store:
+        store.upsert_many(results)
+    return [record for record, _ in results]
@@ -0,0 +1,149 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Mittlerer Erdradius in Metern
+EARTH_RADIUS_M = 6371008.8
+
+# Unterstützte Sortierungen für Suchergebnisse
+SORT_OPTIONS = ('distance', 'rating', 'score')
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Großkreisentfernung zwischen zwei Punkten in Metern."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def offset_point(lat: float, lng: float, distance_m: float, bearing_deg: float) -> Tuple[float, float]:
+    """Verschiebt einen Punkt um distance_m Meter in Richtung bearing_deg (0 = Nord)."""
+    delta = distance_m / EARTH_RADIUS_M
+    theta = math.radians(bearing_deg)
+    phi1 = math.radians(lat)
+    lmb1 = math.radians(lng)
+
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) +
+                     math.cos(phi1) * math.sin(delta) * math.cos(theta))
+    lmb2 = lmb1 + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1),
+                             math.cos(delta) - math.sin(phi1) * math.sin(phi2))
+    return math.degrees(phi2), (math.degrees(lmb2) + 540) % 360 - 180
+
+
+def haversine_km_many(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """
+    Entfernungen von einem Punkt zu vielen Punkten in einer NumPy-Operation.
+
+    Args:
+        lat (float): Breitengrad des Bezugspunkts
+        lng (float): Längengrad des Bezugspunkts
+        lats (np.ndarray): Breitengrade der Zielpunkte
+        lngs (np.ndarray): Längengrade der Zielpunkte
+
+    Returns:
+        np.ndarray: Entfernungen in Kilometern
+    """
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * (EARTH_RADIUS_M / 1000) * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def broker_location(broker: Dict) -> Optional[Tuple[float, float]]:
+    """Liest Koordinaten aus einem Makler-Datensatz (lat/lng oder Google-geometry)."""
+    if broker.get('lat') is not None and broker.get('lng') is not None:
+        return float(broker['lat']), float(broker['lng'])
+    location = (broker.get('geometry') or {}).get('location') or {}
+    if location.get('lat') is not None and location.get('lng') is not None:
+        return float(location['lat']), float(location['lng'])
+    return None
+
+
+def annotate_and_filter(brokers: List[Dict], lat: float, lng: float,
+                        radius_km: Optional[float] = None) -> List[Dict]:
+    """
+    Ergänzt 'distance_km' für alle Makler und entfernt Einträge außerhalb des Radius.
+
+    Makler ohne Koordinaten bleiben erhalten (distance_km = None), da sich ihre
+    Lage nicht prüfen lässt.
+
+    Returns:
+        list: Gefilterte Makler mit distance_km
+    """
+    if not brokers:
+        return []
+
+    coords = np.full((len(brokers), 2), np.nan)
+    for i, broker in enumerate(brokers):
+        location = broker_location(broker)
+        if location:
+            coords[i] = location
+
+    distances = haversine_km_many(lat, lng, coords[:, 0], coords[:, 1])
+    known = ~np.isnan(distances)
+    if radius_km is None:
+        keep = np.ones(len(brokers), dtype=bool)
+    else:
+        keep = ~known | (distances <= radius_km)
+
+    result = []
+    for i in np.flatnonzero(keep):
+        broker = brokers[i]
+        broker['distance_km'] = round(float(distances[i]), 2) if known[i] else None
+        result.append(broker)
+    return result
+
+
+def rank_scores(brokers: List[Dict], radius_km: float, prior_votes: float = 10.0,
+                prior_rating: float = 3.5) -> np.ndarray:
+    """
+    Kombinierter Score aus Bewertung (bayessch geglättet nach Anzahl) und Nähe.
+
+    Returns:
+        np.ndarray: Scores zwischen 0 und 1, höher ist besser
+    """
+    ratings = np.array([float(b.get('rating') or 0) for b in brokers])
+    votes = np.array([float(b.get('user_ratings_total') or 0) for b in brokers])
+    distances = np.array([
+        b['distance_km'] if b.get('distance_km') is not None else radius_km
+        for b in brokers
+    ], dtype=float)
+
+    smoothed = (votes * ratings + prior_votes * prior_rating) / (votes + prior_votes)
+    proximity = 1.0 - np.clip(distances / max(radius_km, 1e-6), 0.0, 1.0)
+    return 0.7 * (smoothed / 5.0) + 0.3 * proximity
+
+
+def sort_brokers(brokers: List[Dict], sort_by: str = 'rating', radius_km: float = 10.0) -> List[Dict]:
+    """
+    Sortiert Makler nach Entfernung, Bewertung oder kombiniertem Score.
+
+    Args:
+        brokers (list): Makler mit distance_km
+        sort_by (str): 'distance', 'rating' oder 'score'
+        radius_km (float): Suchradius für die Normierung der Nähe
+
+    Returns:
+        list: Sortierte Makler
+    """
+    if not brokers:
+        return brokers
+
+    if sort_by == 'distance':
+        keys = np.array([
+            b['distance_km'] if b.get('distance_km') is not None else np.inf
+            for b in brokers
+        ])
+        order = np.argsort(keys, kind='stable')
+    elif sort_by == 'score':
+        order = np.argsort(-rank_scores(brokers, radius_km), kind='stable')
+    else:
+        ratings = np.array([float(b.get('rating') or 0) for b in brokers])
+        order = np.argsort(-ratings, kind='stable')
+
+    return [brokers[i] for i in order]
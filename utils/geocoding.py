@@ -4,8 +4,107 @@ import googlemaps
 import logging
 from typing import Optional, List, Dict, Tuple
 
+from utils.pagination import PageTokenScheduler
+from utils.geo import annotate_and_filter, sort_brokers
+from utils.tiling import plan_tiles, subdivide_tile, is_saturated, MAX_TILE_RADIUS_M, MIN_TILE_RADIUS_M
+from utils.place_cache import get_place_details_cache, VOLATILE_FIELDS
+from utils.api_metrics import get_metrics, instrument
+from utils.boundary import locate_in_germany, is_in_germany
+from utils.cache import TTLCache
+from utils.singleflight import single_flight
+from utils.spatial_cache import SpatialSearchIndex, circle_contains
+from utils.keyword_planner import get_keyword_planner
+from utils.localities import get_localities
+
 logger = logging.getLogger(__name__)
 
+# Felder, die per Place Details für jeden Makler abgefragt werden
+PLACE_DETAIL_FIELDS = [
+    'name', 'formatted_address', 'formatted_phone_number',
+    'website', 'rating', 'user_ratings_total',
+    'opening_hours', 'business_status'
+]
+
+# Suchbegriffe für Versicherungsmakler (je Teilkreis eine Nearby-Suche pro Begriff)
+SEARCH_KEYWORDS = [
+    'Versicherungsmakler',
+    'Versicherungsberater',
+    'Versicherungsagentur',
+    'Generalagentur Versicherung'
+]
+
+# Felder aus der Nearby-Suche, die ein Kandidat behält
+CANDIDATE_FIELDS = (
+    'place_id', 'name', 'vicinity', 'rating', 'user_ratings_total',
+    'geometry', 'business_status'
+)
+
+# GPS-Eingaben bis zu dieser Entfernung auf den nächsten PLZ-Schwerpunkt einrasten (0 = aus)
+GPS_SNAP_MAX_KM = float(os.getenv('GPS_SNAP_MAX_KM', '5'))
+
+# Eingabe im Format "lat, lng"
+_LAT_LNG_PATTERN = re.compile(r"^\s*(-?\d{1,3}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)\s*$")
+_PLZ_ORT_PATTERN = re.compile(r"^\s*(\d{5})\s+([^\d,]+?)\s*$")
+
+_geocode_cache: Optional[TTLCache] = None
+_nearby_cache: Optional[TTLCache] = None
+_spatial_index: Optional[SpatialSearchIndex] = None
+
+
+def get_geocode_cache() -> TTLCache:
+    """Cache für Geocoding-Ergebnisse, Schlüssel ist die normalisierte Eingabe."""
+    global _geocode_cache
+    if _geocode_cache is None:
+        _geocode_cache = TTLCache(
+            'geocode',
+            ttl_seconds=float(os.getenv('GEOCODE_CACHE_TTL_HOURS', '720')) * 3600,
+            max_entries=int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '20000'))
+        )
+    return _geocode_cache
+
+
+def get_nearby_cache() -> TTLCache:
+    """Cache für Nearby-Kandidaten einer Suche (Mittelpunkt + Radius)."""
+    global _nearby_cache
+    if _nearby_cache is None:
+        _nearby_cache = TTLCache(
+            'nearby_results',
+            ttl_seconds=float(os.getenv('NEARBY_CACHE_TTL_HOURS', '24')) * 3600,
+            max_entries=int(os.getenv('NEARBY_CACHE_MAX_ENTRIES', '5000'))
+        )
+    return _nearby_cache
+
+
+def get_spatial_index() -> SpatialSearchIndex:
+    """Räumlicher Index der Suchkreise, deren Kandidaten im Nearby-Cache liegen."""
+    global _spatial_index
+    if _spatial_index is None:
+        _spatial_index = SpatialSearchIndex(ttl_seconds=get_nearby_cache().ttl_seconds)
+    return _spatial_index
+
+
+def normalize_location(location: str) -> str:
+    """Vereinheitlicht Ortseingaben für Cache-Schlüssel und Suchhistorie."""
+    s = re.sub(r"\s*,\s*", ", ", (location or "").strip().lower())
+    return re.sub(r"\s+", " ", s).strip(", ")
+
+
+def nearby_cache_key(coordinates: Dict, radius_meters: int) -> str:
+    """Schlüssel für Nearby-Ergebnisse; Koordinaten auf ca. 10 m gerundet."""
+    return f"{coordinates['lat']:.4f},{coordinates['lng']:.4f}|{int(radius_meters)}"
+
+
+def search_flight_key(location: str, coordinates: Dict, radius_km: int, sort_by: str) -> str:
+    """
+    Schlüssel für identische gleichzeitige Suchen (siehe utils.singleflight).
+
+    Koordinaten werden auf ca. 100 m gerundet; die Sortierung gehört dazu,
+    weil sie bestimmt, welche Makler auf der ersten Seite angereichert werden.
+    """
+    return (f"search|{normalize_location(location)}|"
+            f"{coordinates['lat']:.3f},{coordinates['lng']:.3f}|{int(radius_km)}|{sort_by}")
+
+
 def _normalize_german_address(raw: str) -> str:
     """Normalisiert deutsche Adressen, unterstützt u.a.:
     - "21641 Apensen"
@@ -86,166 +185,417 @@ def _pick_best_geocode_result(input_text: str, results: List[Dict]) -> Optional[
     return scored[0][1] if scored else results[0]
 
 
-def get_coordinates(location: str) -> Optional[Dict]:
+def get_coordinates(location: str, max_age: Optional[float] = None) -> Optional[Dict]:
     """
     Ermittelt Koordinaten für einen gegebenen Standort (Adresse, PLZ + Ort, etc.).
     Bevorzugt deutsche Ergebnisse und versucht, die passendste Adresse zu wählen.
-    """
-    try:
-        api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        if not api_key:
-            logger.error("Google Maps API Key nicht gefunden")
-            return None
+    Ergebnisse werden pro normalisierter Eingabe zwischengespeichert.
 
-        gmaps = googlemaps.Client(key=api_key)
+    GPS-Koordinaten werden offline dem nächsten PLZ-Schwerpunkt zugeordnet. Der
+    Suchmittelpunkt bleibt die GPS-Position; das Ergebnis enthält dann zusätzlich
+    'label' ("PLZ Ort") für Anzeige und Suchhistorie und 'snap' (Schwerpunkt mit
+    lat, lng und distance_km), über den die Suche den Suchergebnis-Cache der
+    getippten PLZ nutzt (siehe snapped_search()).
 
+    Args:
+        location (str): Adresse, PLZ, Ort oder "lat, lng"
+        max_age (float): Cache-Einträge älter als max_age Sekunden neu abfragen
+    """
+    try:
         # 1) Wenn Eingabe "lat, lng" ist, direkt Koordinaten verwenden
-        ll_match = re.match(r"^\s*(-?\d{1,3}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)\s*$", location or "")
+        ll_match = _LAT_LNG_PATTERN.match(location or "")
         if ll_match:
             lat = float(ll_match.group(1))
             lng = float(ll_match.group(2))
             logger.info(f"Erkannte GPS-Koordinaten: lat={lat}, lng={lng}")
+            # PLZ-Schwerpunkt für Beschriftung und Suchergebnis-Cache, Mittelpunkt bleibt die GPS-Position
+            place = get_localities().nearest(lat, lng, GPS_SNAP_MAX_KM) if GPS_SNAP_MAX_KM > 0 else None
+            if place:
+                logger.info(f"GPS-Position liegt in {place['label']} ({place['distance_km']} km zum Schwerpunkt)")
+                return {"lat": lat, "lng": lng, "label": place['label'],
+                        "snap": {"lat": place['lat'], "lng": place['lng'], "distance_km": place['distance_km']}}
             return {"lat": lat, "lng": lng}
 
-        prepared = _normalize_german_address(location)
-
-        # Komponenten-Filter aufbauen (Deutschland + evtl. PLZ)
-        comps = {"country": "DE"}
-        m = re.search(r"\b(\d{5})\b", prepared)
-        if m:
-            comps["postal_code"] = m.group(1)
-
-        # Bias auf Deutschland und deutsche Sprache
-        geocode_result = gmaps.geocode(
-            prepared,
-            region='de',
-            language='de',
-            components=comps
-        )
+        # 2) Exakte Eingabe "PLZ Ort" (z.B. aus der Autovervollständigung) offline auflösen
+        plz_ort = _PLZ_ORT_PATTERN.match(location or "")
+        if plz_ort:
+            centroid = get_localities().plz_centroid(plz_ort.group(1), plz_ort.group(2), exact=True)
+            if centroid:
+                logger.info(f"{location} offline über den PLZ-Schwerpunkt aufgelöst")
+                return centroid
 
-        if not geocode_result:
-            # Fallback: ohne components
-            geocode_result = gmaps.geocode(prepared, region='de', language='de')
+        cache_key = normalize_location(location)
+        cached = get_geocode_cache().get(cache_key, max_age=max_age)
+        if cached:
+            return cached
 
-        if geocode_result:
-            best = _pick_best_geocode_result(prepared, geocode_result)
-            location_data = best['geometry']['location']
-            logger.info(f"Koordinaten für {location}: {location_data['lat']}, {location_data['lng']}")
-            return location_data
-        else:
-            logger.warning(f"Keine Koordinaten für {location} gefunden")
-            return None
+        # Gleichzeitige Anfragen für dieselbe Eingabe teilen sich einen Geocode-Aufruf
+        return single_flight(f"geocode|{cache_key}", lambda: geocode_uncached(location, cache_key))
 
     except Exception as e:
         logger.error(f"Fehler bei der Geocodierung von {location}: {str(e)}")
         return None
 
 
-def search_insurance_brokers(coordinates: Dict, radius_meters: int) -> List[Dict]:
+def geocode_uncached(location: str, cache_key: str, gmaps=None) -> Optional[Dict]:
+    """
+    Fragt Google Geocoding ohne Cache-Prüfung ab und legt das beste Ergebnis im Cache ab.
+
+    Args:
+        location (str): Adresse, PLZ oder Ort
+        cache_key (str): Schlüssel im Geocoding-Cache (normalisierte Eingabe)
+        gmaps: Google Maps Client (Standard: get_maps_client())
+
+    Returns:
+        dict: lat und lng oder None
+    """
+    gmaps = gmaps or get_maps_client()
+    if not gmaps:
+        return None
+
+    prepared = _normalize_german_address(location)
+
+    # Komponenten-Filter aufbauen (Deutschland + evtl. PLZ)
+    comps = {"country": "DE"}
+    m = re.search(r"\b(\d{5})\b", prepared)
+    if m:
+        comps["postal_code"] = m.group(1)
+
+    # Bias auf Deutschland und deutsche Sprache
+    geocode_result = gmaps.geocode(
+        prepared,
+        region='de',
+        language='de',
+        components=comps
+    )
+
+    if not geocode_result:
+        # Fallback: ohne components
+        geocode_result = gmaps.geocode(prepared, region='de', language='de')
+
+    if geocode_result:
+        best = _pick_best_geocode_result(prepared, geocode_result)
+        location_data = best['geometry']['location']
+        logger.info(f"Koordinaten für {location}: {location_data['lat']}, {location_data['lng']}")
+        get_geocode_cache().set(cache_key, location_data)
+        return location_data
+    else:
+        logger.warning(f"Keine Koordinaten für {location} gefunden")
+        return None
+
+
+def get_place_details(gmaps, place_id: str, fields: Optional[List[str]] = None,
+                      max_age: Optional[float] = None, volatile_max_age: Optional[float] = None) -> Optional[Dict]:
+    """
+    Liefert Place Details für eine place_id, bevorzugt aus dem persistenten Cache.
+
+    Bei einem Treffer mit veralteten Bewertungen werden nur rating und
+    user_ratings_total nachgeladen; schlägt das fehl, wird der Cache-Stand genutzt.
+
+    Args:
+        gmaps: Google Maps Client
+        place_id (str): Google Place ID
+        fields (list): Angefragte Felder (Standard: PLACE_DETAIL_FIELDS)
+        max_age (float): Gecachte Details älter als max_age Sekunden komplett neu laden
+        volatile_max_age (float): Bewertungen älter als volatile_max_age Sekunden nachladen
+            (Standard: PLACE_CACHE_RATING_TTL_HOURS)
+
+    Returns:
+        dict: Details inkl. place_id oder None, wenn Google keine Daten liefert
+    """
+    fields = fields or PLACE_DETAIL_FIELDS
+    cache = get_place_details_cache()
+
+    cached, needs_refresh = cache.lookup(place_id, fields, max_age=max_age, volatile_max_age=volatile_max_age)
+    if cached is not None:
+        if not needs_refresh:
+            return cached
+        volatile_fields = [f for f in VOLATILE_FIELDS if f in fields]
+        try:
+            refresh = gmaps.place(place_id=place_id, fields=volatile_fields, language='de')
+            if refresh.get('status') == 'OK':
+                return cache.refresh_volatile(place_id, fields, refresh['result']) or cached
+        except Exception as e:
+            logger.warning(f"Bewertungen für {place_id} konnten nicht aktualisiert werden: {str(e)}")
+        return cached
+
+    place_details = gmaps.place(place_id=place_id, fields=fields, language='de')
+    if place_details.get('status') != 'OK':
+        return None
+
+    broker_info = place_details['result']
+    broker_info['place_id'] = place_id
+    cache.store(place_id, fields, broker_info)
+    return dict(broker_info)
+
+
+def get_maps_client():
+    """
+    Erzeugt einen Google Maps Client oder None, wenn kein API Key konfiguriert ist.
+
+    Der Client ist instrumentiert: jeder Aufruf wird mit Latenz, Status und
+    geschätzten Kosten dem aktuellen Request bzw. Job zugeordnet (siehe utils.api_metrics).
+    """
+    api_key = os.getenv('GOOGLE_MAPS_API_KEY')
+    if not api_key:
+        logger.error("Google Maps API Key nicht gefunden")
+        return None
+    return instrument(googlemaps.Client(key=api_key))
+
+
+def _candidate_from_nearby(result: Dict) -> Dict:
+    """Reduziert ein Nearby-Ergebnis auf die Felder, die für Ranking und Anzeige nötig sind."""
+    return {key: result[key] for key in CANDIDATE_FIELDS if key in result}
+
+
+def get_candidate_details(gmaps, candidate: Dict) -> Dict:
+    """
+    Ergänzt einen Nearby-Kandidaten um Place Details (Cache zuerst).
+
+    Koordinaten und Entfernung stammen aus der Nearby-Suche und bleiben erhalten.
+    Schlägt die Abfrage fehl, wird der Kandidat mit vicinity als Adresse geliefert.
+
+    Args:
+        gmaps: Google Maps Client (None = nur Kandidatendaten verwenden)
+        candidate (dict): Kandidat aus search_insurance_brokers()
+
+    Returns:
+        dict: Makler-Datensatz mit Details
+    """
+    place_id = candidate.get('place_id')
+    details = None
+    if gmaps and place_id:
+        try:
+            details = get_place_details(gmaps, place_id)
+        except Exception as detail_error:
+            logger.warning(f"Fehler beim Abrufen der Details für {place_id}: {str(detail_error)}")
+
+    if not details:
+        # Fallback mit grundlegenden Informationen
+        details = dict(candidate)
+        if candidate.get('vicinity'):
+            details.setdefault('formatted_address', candidate['vicinity'])
+        return details
+
+    for key in ('geometry', 'distance_km'):
+        if key in candidate and key not in details:
+            details[key] = candidate[key]
+    return details
+
+
+def _cached_overlaps(center: Tuple[float, float], radius_meters: int,
+                     max_age: Optional[float]) -> Tuple[Optional[List[Dict]], List[Tuple[Dict, List[Dict]]]]:
+    """
+    Sucht frische frühere Suchkreise, die den neuen Kreis schneiden.
+
+    Returns:
+        tuple: (Kandidaten eines vollständig enthaltenden Kreises oder None,
+        Liste (Kreis, Kandidaten) der teilweise überlappenden Kreise)
+    """
+    covering = []
+    for circle in get_spatial_index().find_overlapping(center[0], center[1], radius_meters, max_age):
+        cached = get_nearby_cache().get(circle['cache_key'], max_age=max_age)
+        if cached is None:
+            continue
+        if circle['contains']:
+            return cached, []
+        covering.append((circle, cached))
+    return None, covering
+
+
+def _plan_uncovered_tiles(center: Tuple[float, float], radius_meters: int, tiles: List[Dict],
+                          covering: List[Tuple[Dict, List[Dict]]]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Lässt Teilkreise aus, die frühere Suchen bereits vollständig abdecken.
+
+    Geprüft werden die normal geplanten Teilkreise und eine feinere Planung mit
+    halbem Radius, die sich enger an die früheren Kreise anschmiegt. Verwendet
+    wird die Planung mit den wenigsten offenen Teilkreisen (bei Gleichstand die
+    normale); die Kandidaten der genutzten früheren Suchen werden übernommen.
+
+    Returns:
+        tuple: (abzufragende Teilkreise, wiederverwendete Kandidaten)
+    """
+    def uncovered_tiles(planned):
+        uncovered = []
+        used = set()
+        for tile in planned:
+            owner = next((i for i, (circle, _) in enumerate(covering)
+                          if circle_contains(circle, tile['lat'], tile['lng'], tile['radius'])), None)
+            if owner is None:
+                uncovered.append(tile)
+            else:
+                used.add(owner)
+        return uncovered, used
+
+    fine_radius = max(MIN_TILE_RADIUS_M, min(MAX_TILE_RADIUS_M, radius_meters / 2))
+    fine_tiles = plan_tiles(center[0], center[1], radius_meters, tile_radius_m=fine_radius)
+    uncovered, used = min(uncovered_tiles(tiles), uncovered_tiles(fine_tiles), key=lambda plan: len(plan[0]))
+    if not used:
+        return tiles, []
+
+    get_metrics().increment('spatial_cache_tiles_skipped', len(tiles) - len(uncovered))
+    logger.info(f"Frühere Suchen decken den Kreis teilweise ab: {len(uncovered)} statt {len(tiles)} Teilkreise offen")
+    seeded = [broker for i in sorted(used) for broker in covering[i][1]]
+    return uncovered, seeded
+
+
+def search_insurance_brokers(coordinates: Dict, radius_meters: int, sort_by: str = 'rating',
+                             max_age: Optional[float] = None) -> List[Dict]:
     """
     Sucht Versicherungsmakler in einem bestimmten Umkreis.
     
+    Liefert leichtgewichtige Kandidaten aus der Nearby-Suche (Name, vicinity,
+    Bewertung, Koordinaten, distance_km) ohne Place Details. Details werden erst
+    bei Bedarf über get_candidate_details() geladen.
+    
+    Große Radien werden in überlappende Teilkreise zerlegt; liefert ein Teilkreis
+    das Google-Maximum von 60 Ergebnissen, wird er adaptiv weiter unterteilt.
+    Suchbegriffe ohne nennenswerten Zusatzertrag in der Region werden ausgelassen,
+    und ein Begriff wird nicht weiter geblättert, sobald eine Seite nichts Neues liefert.
+    Die gefilterten Kandidaten werden pro Mittelpunkt und Radius zwischengespeichert.
+    
     Args:
         coordinates (dict): Dictionary mit 'lat' und 'lng' Schlüsseln
         radius_meters (int): Suchradius in Metern
+        sort_by (str): Sortierung 'distance', 'rating' oder 'score'
+        max_age (float): Cache-Einträge älter als max_age Sekunden neu abfragen
         
     Returns:
-        list: Liste von Versicherungsmaklern mit deren Informationen
+        list: Nach sort_by gerankte Kandidaten mit distance_km
     """
     try:
-        api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        if not api_key:
-            logger.error("Google Maps API Key nicht gefunden")
-            return []
-        gmaps = googlemaps.Client(key=api_key)
-        
-        # Suchbegriffe für Versicherungsmakler
-        search_queries = [
-            'Versicherungsmakler',
-            'Versicherungsberater', 
-            'Versicherungsagentur',
-            'Generalagentur Versicherung'
-        ]
-        
-        all_brokers = []
-        unique_place_ids = set()
-        
+        cache_key = nearby_cache_key(coordinates, radius_meters)
+        cached = get_nearby_cache().get(cache_key, max_age=max_age)
+        if cached is not None:
+            logger.info(f"{len(cached)} Versicherungsmakler aus dem Cache ({cache_key})")
+            return sort_brokers(cached, sort_by, radius_meters / 1000)
+
         # Stelle sicher, dass Koordinaten als Tupel vorliegen
         center = (coordinates.get('lat'), coordinates.get('lng'))
 
-        for query in search_queries:
-            try:
-                # Places API Nearby Search
-                places_result = gmaps.places_nearby(
-                    location=center,
-                    radius=radius_meters,
-                    keyword=query,
-                    type='insurance_agency',
-                    language='de'
-                )
-                
-                brokers = places_result.get('results', [])
-                
-                # Weitere Ergebnisse abrufen wenn verfügbar
-                while 'next_page_token' in places_result:
-                    import time
-                    time.sleep(2)  # Google erfordert eine Pause zwischen Requests
-                    
-                    places_result = gmaps.places_nearby(
-                        page_token=places_result['next_page_token'],
-                        language='de'
-                    )
-                    brokers.extend(places_result.get('results', []))
-                
-                # Duplikate basierend auf place_id entfernen
-                for broker in brokers:
-                    place_id = broker.get('place_id')
-                    if place_id and place_id not in unique_place_ids:
-                        unique_place_ids.add(place_id)
-                        
-                        # Detaillierte Informationen für jeden Makler abrufen
-                        try:
-                            place_details = gmaps.place(
-                                place_id=place_id,
-                                fields=[
-                                    'name', 'formatted_address', 'formatted_phone_number',
-                                    'website', 'rating', 'user_ratings_total', 
-                                    'opening_hours', 'business_status'
-                                ],
-                                language='de'
-                            )
-                            
-                            if place_details['status'] == 'OK':
-                                broker_info = place_details['result']
-                                broker_info['place_id'] = place_id
-                                all_brokers.append(broker_info)
-                                
-                        except Exception as detail_error:
-                            logger.warning(f"Fehler beim Abrufen der Details für {place_id}: {str(detail_error)}")
-                            # Fallback mit grundlegenden Informationen
-                            broker['place_id'] = place_id
-                            all_brokers.append(broker)
-                            
-            except Exception as query_error:
-                logger.warning(f"Fehler bei der Suche nach {query}: {str(query_error)}")
-                continue
-        
-        logger.info(f"Insgesamt {len(all_brokers)} Versicherungsmakler gefunden")
+        # Frühere Suchen, die den Kreis ganz oder teilweise abdecken
+        contained, covering = _cached_overlaps(center, radius_meters, max_age)
+        if contained is not None:
+            get_metrics().increment('spatial_cache_hits')
+            candidates = annotate_and_filter(contained, center[0], center[1], radius_meters / 1000)
+            logger.info(f"{len(candidates)} Versicherungsmakler aus einer umfassenden früheren Suche")
+            return sort_brokers(candidates, sort_by, radius_meters / 1000)
+
+        tiles = plan_tiles(center[0], center[1], radius_meters)
+        candidates = []
+        unique_place_ids = set()
+        if covering:
+            tiles, seeded = _plan_uncovered_tiles(center, radius_meters, tiles, covering)
+            for broker in seeded:
+                if broker.get('place_id') not in unique_place_ids:
+                    unique_place_ids.add(broker.get('place_id'))
+                    candidates.append(broker)
+
+        gmaps = get_maps_client() if tiles else None
+        if tiles and not gmaps:
+            return []
+
+        # Suchbegriffe nach bisherigem Grenzertrag ordnen, ertragsarme auslassen
+        keywords, skipped = get_keyword_planner().plan(center[0], center[1], SEARCH_KEYWORDS)
+        if skipped and tiles:
+            get_metrics().increment('keyword_calls_skipped', len(skipped) * len(tiles))
+            logger.info(f"Suchbegriffe ohne nennenswerten Zusatzertrag ausgelassen: {', '.join(skipped)}")
+        ids_by_keyword = {keyword: set() for keyword in keywords}
+        calls_by_keyword = dict.fromkeys(keywords, 0)
+
+        def fetch_page(query, page_token):
+            calls_by_keyword[query['keyword']] += 1
+            # Places API Nearby Search (Folgeseiten nur über das Token)
+            if page_token:
+                return gmaps.places_nearby(page_token=page_token, language='de')
+            return gmaps.places_nearby(
+                location=(query['lat'], query['lng']),
+                radius=int(query['radius']),
+                keyword=query['keyword'],
+                type='insurance_agency',
+                language='de'
+            )
+
+        def on_page(query, results, page_no):
+            # Duplikate basierend auf place_id entfernen
+            new_ids = 0
+            for broker in results:
+                place_id = broker.get('place_id')
+                if not place_id:
+                    continue
+                ids_by_keyword[query['keyword']].add(place_id)
+                if place_id not in unique_place_ids:
+                    unique_place_ids.add(place_id)
+                    candidates.append(_candidate_from_nearby(broker))
+                    new_ids += 1
+            # Eine Seite ohne neue place_ids: weitere Seiten dieses Begriffs lohnen nicht
+            return new_ids > 0
+
+        subdivided = []
+
+        def on_done(query, stats):
+            if stats['stopped_early']:
+                get_metrics().increment('keyword_pages_saved')
+            # Gesättigte Teilkreise verfeinern, bis Google nicht mehr abschneidet
+            if not is_saturated(stats):
+                return None
+            children = subdivide_tile(query, center[0], center[1], radius_meters)
+            if not children:
+                logger.warning(f"Teilkreis für {query['keyword']} gesättigt, Mindestgröße erreicht")
+                return None
+            subdivided.append(query)
+            return [dict(child, keyword=query['keyword']) for child in children]
+
+        scheduler = PageTokenScheduler(fetch_page)
+        scheduler.run(
+            [dict(tile, keyword=q) for tile in tiles for q in keywords],
+            on_page,
+            on_done
+        )
+        # Nur vollständige Läufe zeigen den Grenzertrag aller Begriffe unverzerrt
+        if tiles and not skipped:
+            get_keyword_planner().record(center[0], center[1], radius_meters, ids_by_keyword, calls_by_keyword)
+        if subdivided:
+            logger.info(f"{len(subdivided)} gesättigte Teilkreise adaptiv unterteilt")
         
-        # Nach Bewertung sortieren (höchste zuerst)
-        all_brokers.sort(key=lambda x: x.get('rating', 0), reverse=True)
+        # Entfernungen berechnen und Treffer außerhalb des Suchkreises verwerfen
+        found = len(candidates)
+        candidates = annotate_and_filter(candidates, center[0], center[1], radius_meters / 1000)
+        logger.info(f"Insgesamt {len(candidates)} Versicherungsmakler gefunden ({found - len(candidates)} außerhalb des Radius verworfen)")
+        if candidates:
+            get_nearby_cache().set(cache_key, candidates)
+            get_spatial_index().register(cache_key, center[0], center[1], radius_meters)
         
-        return all_brokers
+        return sort_brokers(candidates, sort_by, radius_meters / 1000)
         
     except Exception as e:
         logger.error(f"Fehler bei der Maklersuche: {str(e)}")
         return []
 
 
+# Eingaben mit diesen Ländernamen liegen eindeutig nicht in Deutschland
+_FOREIGN_COUNTRY_PATTERN = re.compile(
+    r"\b(Österreich|Austria|Schweiz|Switzerland|Frankreich|France|Niederlande|Netherlands|Holland|"
+    r"Belgien|Belgium|Luxemburg|Luxembourg|Dänemark|Denmark|Polen|Poland|Tschechien|Czechia|"
+    r"Italien|Italy|Spanien|Spain)\b",
+    re.IGNORECASE
+)
+
+
+def is_german_postal_code(plz: str) -> bool:
+    """Prüft, ob eine 5-stellige Zahl im deutschen PLZ-Bereich (01001–99998) liegt."""
+    return bool(re.fullmatch(r"\d{5}", plz or "")) and 1001 <= int(plz) <= 99998
+
+
 def validate_german_location(location: str) -> bool:
     """
     Validiert ob ein Standort in Deutschland liegt.
     
+    Koordinaten werden offline gegen ein vereinfachtes Grenzpolygon geprüft,
+    reine Postleitzahlen über den PLZ-Bereich. Nur mehrdeutige Freitexte und
+    Punkte nahe einer Landgrenze werden per Google API geklärt.
+    
     Args:
         location (str): Standort zum Validieren
         
@@ -253,12 +603,32 @@ def validate_german_location(location: str) -> bool:
         bool: True wenn in Deutschland, False sonst
     """
     try:
-        api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        if not api_key:
+        text = (location or "").strip()
+        if not text:
+            return False
+
+        ll_match = _LAT_LNG_PATTERN.match(text)
+        if ll_match:
+            lat, lng = float(ll_match.group(1)), float(ll_match.group(2))
+            offline = locate_in_germany(lat, lng)
+            if offline is not None:
+                return offline
+        elif re.fullmatch(r"\d{5}", text):
+            return is_german_postal_code(text)
+        elif _FOREIGN_COUNTRY_PATTERN.search(text):
             return False
+        elif re.search(r"\b(Deutschland|Germany)\b", text, re.IGNORECASE):
+            return True
+
+        if not os.getenv('GOOGLE_MAPS_API_KEY'):
+            # Ohne API bleibt für Koordinaten das Polygon ohne Unsicherheitszone
+            return is_in_germany(lat, lng) if ll_match else False
             
-        gmaps = googlemaps.Client(key=api_key)
-        geocode_result = gmaps.geocode(location)
+        gmaps = get_maps_client()
+        if ll_match:
+            geocode_result = gmaps.reverse_geocode((lat, lng), result_type='country')
+        else:
+            geocode_result = gmaps.geocode(location)
         
         if geocode_result:
             for component in geocode_result[0].get('address_components', []):
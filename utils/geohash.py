@@ -0,0 +1,74 @@
+import math
+from typing import List, Set, Tuple
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(lat: float, lng: float, precision: int = 5) -> str:
+    """
+    Kodiert einen Punkt als Geohash.
+
+    Args:
+        lat (float): Breitengrad
+        lng (float): Längengrad
+        precision (int): Anzahl Zeichen (4 ≈ 39 x 20 km, 5 ≈ 4,9 x 4,9 km)
+
+    Returns:
+        str: Geohash
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Höhe und Breite einer Geohash-Zelle in Grad (lat, lng)."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def cells_for_circle(lat: float, lng: float, radius_m: float, precision: int) -> Set[str]:
+    """
+    Alle Geohash-Zellen, die das umschließende Rechteck eines Kreises berühren.
+
+    Returns:
+        set: Geohashes der Zellen
+    """
+    dlat = radius_m / 110574.0
+    dlng = radius_m / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
+    height, width = cell_size(precision)
+
+    lats = _steps(lat - dlat, lat + dlat, height)
+    lngs = _steps(lng - dlng, lng + dlng, width)
+    return {encode(max(-90.0, min(90.0, a)), ((b + 180) % 360) - 180, precision) for a in lats for b in lngs}
+
+
+def _steps(start: float, end: float, step: float) -> List[float]:
+    values = []
+    value = start
+    while value < end:
+        values.append(value)
+        value += step
+    values.append(end)
+    return values
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from utils.api_metrics import api_scope
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Hintergrund-Threads pro Gunicorn-Worker und maximal wartende Jobs
+SEARCH_JOB_WORKERS = int(os.getenv('SEARCH_JOB_WORKERS', '2'))
+SEARCH_JOB_QUEUE_MAX = int(os.getenv('SEARCH_JOB_QUEUE_MAX', '20'))
+
+# Laufende Jobs ohne Lebenszeichen gelten nach dieser Zeit als abgebrochen (Sekunden)
+SEARCH_JOB_TIMEOUT = float(os.getenv('SEARCH_JOB_TIMEOUT', '300'))
+
+# Mindestabstand zwischen zwei Lebenszeichen eines Jobs in der Datenbank (Sekunden)
+JOB_HEARTBEAT_INTERVAL = 5.0
+
+# Aufbewahrung abgeschlossener Jobs (Stunden)
+SEARCH_JOB_TTL_HOURS = float(os.getenv('SEARCH_JOB_TTL_HOURS', '24'))
+
+# Abschnitte eines Suchjobs in ihrer Reihenfolge
+JOB_STAGES = ('queued', 'geocode', 'nearby', 'enrich', 'done')
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+_current_job: contextvars.ContextVar = contextvars.ContextVar('search_job', default=None)
+
+
+class JobStore:
+    """
+    Zustand der Suchjobs in SQLite, damit jeder Gunicorn-Worker den
+    Fortschritt eines Jobs melden kann, egal welcher Worker ihn ausführt.
+    """
+
+    def __init__(self, db_file: str = 'jobs.sqlite3'):
+        self.db_path = data_path(db_file)
+        self._writes = 0
+        self._ensure_schema()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_schema(self):
+        with _schema_lock:
+            if self.db_path in _initialized:
+                return
+            self._conn().execute(
+                'CREATE TABLE IF NOT EXISTS search_jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' kind TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' stage TEXT NOT NULL,'
+                ' params TEXT NOT NULL,'
+                ' progress TEXT NOT NULL,'
+                ' partial TEXT,'
+                ' result TEXT,'
+                ' error TEXT,'
+                ' created_at REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+            _initialized.add(self.db_path)
+
+    def create(self, kind: str, params: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO search_jobs (id, kind, status, stage, params, progress, created_at, updated_at) '
+            "VALUES (?, ?, 'queued', 'queued', ?, '{}', ?, ?)",
+            (job_id, kind, json.dumps(params), now, now)
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+        return job_id
+
+    def update(self, job_id: str, status: Optional[str] = None, stage: Optional[str] = None,
+               progress: Optional[Dict] = None, partial=None, result=None, error: Optional[str] = None):
+        """Aktualisiert die angegebenen Felder eines Jobs."""
+        fields = {'updated_at': time.time()}
+        if status is not None:
+            fields['status'] = status
+        if stage is not None:
+            fields['stage'] = stage
+        if progress is not None:
+            fields['progress'] = json.dumps(progress)
+        if partial is not None:
+            fields['partial'] = json.dumps(partial)
+        if result is not None:
+            fields['result'] = json.dumps(result)
+        if error is not None:
+            fields['error'] = error
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        self._conn().execute(
+            f'UPDATE search_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id)
+        )
+
+    def claim(self, job_id: str) -> bool:
+        """
+        Markiert einen wartenden Job als laufend.
+
+        Returns:
+            bool: False, wenn der Job nicht mehr wartet (z.B. schon als Fehler markiert)
+        """
+        return self._conn().execute(
+            "UPDATE search_jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        ).rowcount == 1
+
+    def touch(self, job_id: str):
+        """Lebenszeichen eines laufenden Jobs (verschiebt nur updated_at)."""
+        self._conn().execute(
+            "UPDATE search_jobs SET updated_at = ? WHERE id = ? AND status = 'running'", (time.time(), job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Liest einen Job.
+
+        Ein laufender Job ohne Lebenszeichen seit SEARCH_JOB_TIMEOUT wird als
+        Fehler markiert. Wartende Jobs laufen nicht ab: Sie stehen nur hinter
+        anderen Jobs in der Warteschlange.
+
+        Returns:
+            dict: id, kind, status, stage, params, progress, partial, result,
+            error, created_at, updated_at oder None, wenn unbekannt
+        """
+        row = self._conn().execute('SELECT * FROM search_jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        for field in ('params', 'progress', 'partial', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else None
+        if job['status'] == 'running' and time.time() - job['updated_at'] > SEARCH_JOB_TIMEOUT:
+            # Worker-Prozess beendet oder hängt: nicht endlos "läuft" melden
+            job['status'] = 'error'
+            job['error'] = job['error'] or 'Zeitüberschreitung – bitte Suche erneut starten'
+            self._conn().execute(
+                "UPDATE search_jobs SET status = 'error', error = ? WHERE id = ? AND status = 'running' "
+                'AND updated_at = ?',
+                (job['error'], job_id, job['updated_at'])
+            )
+        return job
+
+    def prune(self) -> int:
+        """Entfernt alte Jobs."""
+        cutoff = time.time() - SEARCH_JOB_TTL_HOURS * 3600
+        return self._conn().execute('DELETE FROM search_jobs WHERE updated_at < ?', (cutoff,)).rowcount
+
+
+class JobRunner:
+    """
+    Begrenzter Thread-Pool für Suchjobs eines Workers.
+
+    Nimmt höchstens SEARCH_JOB_QUEUE_MAX wartende oder laufende Jobs an; der
+    Request-Thread kehrt sofort mit der Job-ID zurück.
+    """
+
+    def __init__(self, store: JobStore, workers: int = SEARCH_JOB_WORKERS,
+                 queue_max: int = SEARCH_JOB_QUEUE_MAX):
+        self.store = store
+        self.queue_max = queue_max
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search-job')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, kind: str, params: Dict, fn: Callable[['JobContext'], Dict]) -> Optional[str]:
+        """
+        Reiht einen Job ein.
+
+        Args:
+            kind (str): Art des Jobs (Route für die API-Metriken)
+            params (dict): Parameter für Anzeige und Status
+            fn (callable): Arbeit; erhält einen JobContext und liefert das Ergebnis
+
+        Returns:
+            str: Job-ID oder None, wenn die Warteschlange voll ist
+        """
+        with self._lock:
+            if self._pending >= self.queue_max:
+                return None
+            self._pending += 1
+        job_id = self.store.create(kind, params)
+        self._executor.submit(self._run, job_id, kind, fn)
+        return job_id
+
+    def _run(self, job_id: str, kind: str, fn: Callable[['JobContext'], Dict]):
+        try:
+            if not self.store.claim(job_id):
+                logger.info(f"Suchjob {job_id} wird übersprungen: nicht mehr wartend")
+                return
+            context = JobContext(self.store, job_id)
+            token = _current_job.set(context)
+            try:
+                with api_scope(kind, request_id=job_id):
+                    result = fn(context)
+            finally:
+                _current_job.reset(token)
+            self.store.update(job_id, status='done', stage='done', result=result)
+        except Exception as e:
+            logger.error(f"Suchjob {job_id} fehlgeschlagen: {e}")
+            self.store.update(job_id, status='error', error=str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+class JobContext:
+    """Wird an die Job-Funktion übergeben, um Abschnitt und Zwischenergebnisse zu melden."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self.progress: Dict = {}
+        self._last_beat = time.monotonic()
+
+    def stage(self, stage: str, partial=None, **progress):
+        """Meldet den aktuellen Abschnitt, optional mit Zwischenergebnissen."""
+        self.progress.update(progress)
+        self._last_beat = time.monotonic()
+        self.store.update(self.job_id, stage=stage, progress=self.progress, partial=partial)
+
+    def heartbeat(self):
+        """Meldet, dass der Job noch arbeitet (höchstens alle JOB_HEARTBEAT_INTERVAL Sekunden)."""
+        now = time.monotonic()
+        if now - self._last_beat >= JOB_HEARTBEAT_INTERVAL:
+            self._last_beat = now
+            self.store.touch(self.job_id)
+
+
+def job_heartbeat() -> Callable[[], None]:
+    """
+    Lebenszeichen-Funktion des Suchjobs, in dem der Aufrufer läuft.
+
+    Die Funktion bleibt an den Job gebunden und darf auch aus Worker-Threads
+    aufgerufen werden; außerhalb eines Jobs tut sie nichts.
+    """
+    context = _current_job.get()
+    return context.heartbeat if context else (lambda: None)
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Liefert den Job-Pool dieses Workers."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(JobStore())
+        return _runner
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Liest den Zustand eines Jobs (auch aus anderen Workern)."""
+    return get_job_runner().store.get(job_id)
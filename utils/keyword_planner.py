@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.geohash import encode
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Regionen für die Ertragsstatistik (Geohash mit 3 Zeichen ≈ 156 x 156 km)
+REGION_PRECISION = 3
+GLOBAL_REGION = '*'
+
+KEYWORD_PLANNER_ENABLED = os.getenv('KEYWORD_PLANNER_ENABLED', 'true').lower() == 'true'
+# Mindestanzahl Suchen, bevor ein Suchbegriff ausgelassen werden darf
+KEYWORD_MIN_SAMPLES = int(os.getenv('KEYWORD_MIN_SAMPLES', '5'))
+# Anteil eindeutiger Treffer, unter dem ein Suchbegriff als ertragsarm gilt
+KEYWORD_MIN_UNIQUE_SHARE = float(os.getenv('KEYWORD_MIN_UNIQUE_SHARE', '0.02'))
+# Anteil der Suchen, die trotzdem alle Begriffe abfragen, damit die Statistik aktuell bleibt
+KEYWORD_EXPLORE_RATE = float(os.getenv('KEYWORD_EXPLORE_RATE', '0.1'))
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def region_of(lat: float, lng: float) -> str:
+    """Region eines Suchzentrums für die Ertragsstatistik."""
+    return encode(lat, lng, REGION_PRECISION)
+
+
+class KeywordPlanner:
+    """
+    Plant, welche Suchbegriffe für eine Nearby-Suche abgefragt werden.
+
+    Pro Region und Suchbegriff wird gezählt, wie viele place_ids ausschließlich
+    dieser Begriff geliefert hat (Grenzertrag). Begriffe mit dauerhaft
+    vernachlässigbarem Grenzertrag werden ausgelassen, die übrigen nach Ertrag
+    sortiert. Regionen mit zu wenigen Suchen nutzen die globale Statistik.
+    """
+
+    def __init__(self, db_file: str = 'keywords.sqlite3'):
+        self.db_path = data_path(db_file)
+        self._ensure_schema()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_schema(self):
+        with _schema_lock:
+            if self.db_path in _initialized:
+                return
+            conn = self._conn()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS keyword_yield ('
+                ' region TEXT NOT NULL,'
+                ' keyword TEXT NOT NULL,'
+                ' searches INTEGER NOT NULL DEFAULT 0,'
+                ' calls INTEGER NOT NULL DEFAULT 0,'
+                ' returned INTEGER NOT NULL DEFAULT 0,'
+                ' unique_ids INTEGER NOT NULL DEFAULT 0,'
+                ' updated_at REAL NOT NULL,'
+                ' PRIMARY KEY (region, keyword))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS region_density ('
+                ' region TEXT PRIMARY KEY,'
+                ' searches INTEGER NOT NULL DEFAULT 0,'
+                ' distinct_ids INTEGER NOT NULL DEFAULT 0,'
+                ' area_km2 REAL NOT NULL DEFAULT 0,'
+                ' updated_at REAL NOT NULL)'
+            )
+            _initialized.add(self.db_path)
+
+    def _region_stats(self, region: str) -> Tuple[int, int, Dict[str, Dict]]:
+        conn = self._conn()
+        density = conn.execute(
+            'SELECT searches, distinct_ids FROM region_density WHERE region = ?', (region,)
+        ).fetchone()
+        rows = conn.execute(
+            'SELECT keyword, searches, calls, returned, unique_ids FROM keyword_yield WHERE region = ?',
+            (region,)
+        ).fetchall()
+        searches, distinct = (density['searches'], density['distinct_ids']) if density else (0, 0)
+        return searches, distinct, {row['keyword']: dict(row) for row in rows}
+
+    def plan(self, lat: float, lng: float, keywords: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Ordnet Suchbegriffe nach Grenzertrag und lässt ertragsarme aus.
+
+        Args:
+            lat (float): Breitengrad des Suchzentrums
+            lng (float): Längengrad des Suchzentrums
+            keywords (list): Alle verfügbaren Suchbegriffe
+
+        Returns:
+            tuple: (abzufragende Begriffe, ausgelassene Begriffe)
+        """
+        if not KEYWORD_PLANNER_ENABLED or len(keywords) < 2:
+            return list(keywords), []
+
+        try:
+            searches, distinct, stats = self._region_stats(region_of(lat, lng))
+            if searches < KEYWORD_MIN_SAMPLES:
+                searches, distinct, stats = self._region_stats(GLOBAL_REGION)
+        except Exception as e:
+            logger.warning(f"Suchbegriff-Statistik nicht verfügbar: {e}")
+            return list(keywords), []
+
+        if searches < KEYWORD_MIN_SAMPLES or not distinct:
+            return list(keywords), []
+
+        def share(keyword):
+            return stats.get(keyword, {}).get('unique_ids', 0) / distinct
+
+        def coverage(keyword):
+            return stats.get(keyword, {}).get('returned', 0) / distinct
+
+        # Reihenfolge: erst eindeutiger Ertrag, dann Gesamtertrag; unbekannte Begriffe zuerst
+        ordered = sorted(keywords, key=lambda k: (k in stats, -share(k), -coverage(k)))
+        if random.random() < KEYWORD_EXPLORE_RATE:
+            return ordered, []
+
+        planned = [ordered[0]]
+        skipped = []
+        for keyword in ordered[1:]:
+            sampled = stats.get(keyword, {}).get('searches', 0) >= KEYWORD_MIN_SAMPLES
+            if sampled and share(keyword) < KEYWORD_MIN_UNIQUE_SHARE:
+                skipped.append(keyword)
+            else:
+                planned.append(keyword)
+        return planned, skipped
+
+    def record(self, lat: float, lng: float, radius_m: float,
+               ids_by_keyword: Dict[str, Set[str]], calls_by_keyword: Dict[str, int]):
+        """
+        Verbucht den Ertrag einer Suche, bei der alle Begriffe in ids_by_keyword liefen.
+
+        Args:
+            ids_by_keyword (dict): Gefundene place_ids pro Suchbegriff
+            calls_by_keyword (dict): Nearby-Aufrufe pro Suchbegriff
+        """
+        if not ids_by_keyword:
+            return
+        all_ids = set().union(*ids_by_keyword.values())
+        now = time.time()
+        area_km2 = 3.14159 * (radius_m / 1000) ** 2
+
+        rows = []
+        for keyword, ids in ids_by_keyword.items():
+            others = set().union(*(v for k, v in ids_by_keyword.items() if k != keyword))
+            rows.append((keyword, calls_by_keyword.get(keyword, 0), len(ids), len(ids - others)))
+
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for region in (region_of(lat, lng), GLOBAL_REGION):
+                conn.executemany(
+                    'INSERT INTO keyword_yield (region, keyword, searches, calls, returned, unique_ids, updated_at) '
+                    'VALUES (?, ?, 1, ?, ?, ?, ?) '
+                    'ON CONFLICT (region, keyword) DO UPDATE SET '
+                    ' searches = searches + 1, calls = calls + excluded.calls,'
+                    ' returned = returned + excluded.returned, unique_ids = unique_ids + excluded.unique_ids,'
+                    ' updated_at = excluded.updated_at',
+                    [(region, keyword, calls, returned, unique, now) for keyword, calls, returned, unique in rows]
+                )
+                conn.execute(
+                    'INSERT INTO region_density (region, searches, distinct_ids, area_km2, updated_at) '
+                    'VALUES (?, 1, ?, ?, ?) '
+                    'ON CONFLICT (region) DO UPDATE SET searches = searches + 1,'
+                    ' distinct_ids = distinct_ids + excluded.distinct_ids,'
+                    ' area_km2 = area_km2 + excluded.area_km2, updated_at = excluded.updated_at',
+                    (region, len(all_ids), area_km2, now)
+                )
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            logger.warning(f"Suchbegriff-Statistik konnte nicht gespeichert werden: {e}")
+
+    def summary(self) -> Dict:
+        """Globale Ertragsstatistik pro Suchbegriff für die Metriken."""
+        searches, distinct, stats = self._region_stats(GLOBAL_REGION)
+        return {
+            'searches': searches,
+            'distinct_ids': distinct,
+            'keywords': {
+                keyword: dict(
+                    {k: v for k, v in row.items() if k != 'keyword'},
+                    unique_share=round(row['unique_ids'] / distinct, 4) if distinct else None
+                )
+                for keyword, row in stats.items()
+            }
+        }
+
+
+_planner: Optional[KeywordPlanner] = None
+
+
+def get_keyword_planner() -> KeywordPlanner:
+    """Liefert den prozessweiten Suchbegriff-Planer."""
+    global _planner
+    if _planner is None:
+        _planner = KeywordPlanner()
+    return _planner
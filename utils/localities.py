@@ -0,0 +1,252 @@
+"""
+Deutsche Postleitzahlen und Orte für die Offline-Geocodierung.
+
+Standardmäßig wird eine mitgelieferte Auswahl großer Städte geladen
+(utils/data/plz_seed.tsv). Für flächendeckende Abdeckung PLZ_DATA_PATH auf den
+GeoNames-Export "DE.txt" (https://download.geonames.org/export/zip/) setzen;
+beide Dateien haben dasselbe tabulatorgetrennte Format.
+"""
+
+import os
+import re
+import math
+import bisect
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from utils.geo import haversine_m
+
+logger = logging.getLogger(__name__)
+
+SEED_FILE = os.path.join(os.path.dirname(__file__), 'data', 'plz_seed.tsv')
+
+# Zellgröße des Rasters für die Suche nach dem nächsten PLZ-Schwerpunkt (Grad)
+GRID_CELL_DEG = 0.1
+
+# Kleinste Zellbreite in km innerhalb Deutschlands (Längengrad bei 55,1° N)
+_MIN_CELL_KM = GRID_CELL_DEG * 111.32 * math.cos(math.radians(55.1))
+
+# Spalten im GeoNames-Format
+_COL_COUNTRY, _COL_PLZ, _COL_ORT, _COL_STATE = 0, 1, 2, 3
+_COL_LAT, _COL_LNG = 9, 10
+
+
+def normalize_place_name(name: str) -> str:
+    """Vereinheitlicht Ortsnamen für Vergleiche (Kleinschreibung, Umlaute, Leerzeichen)."""
+    s = (name or '').strip().lower()
+    for umlaut, replacement in (('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')):
+        s = s.replace(umlaut, replacement)
+    return re.sub(r'[\s\-]+', ' ', s)
+
+
+def load_localities(path: Optional[str] = None) -> List[Dict]:
+    """
+    Liest eine PLZ-Datei im GeoNames-Format.
+
+    Args:
+        path (str): Pfad der Datei (Standard: PLZ_DATA_PATH oder die mitgelieferte Auswahl)
+
+    Returns:
+        list: Einträge mit plz, ort, state, lat und lng
+    """
+    path = path or os.getenv('PLZ_DATA_PATH') or SEED_FILE
+    localities = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) <= _COL_LNG or cols[_COL_COUNTRY] != 'DE':
+                    continue
+                try:
+                    localities.append({
+                        'plz': cols[_COL_PLZ],
+                        'ort': cols[_COL_ORT],
+                        'state': cols[_COL_STATE],
+                        'lat': float(cols[_COL_LAT]),
+                        'lng': float(cols[_COL_LNG])
+                    })
+                except ValueError:
+                    continue
+    except OSError as e:
+        logger.error(f"PLZ-Datei {path} konnte nicht gelesen werden: {e}")
+        if path != SEED_FILE:
+            return load_localities(SEED_FILE)
+    return localities
+
+
+class LocalityIndex:
+    """
+    Nachschlagen von PLZ-Schwerpunkten und Präfixsuche ohne Google-Aufruf.
+
+    Für die Präfixsuche liegen PLZ und normalisierte Ortsnamen je in einer
+    sortierten Liste; ein Präfix entspricht per bisect einem zusammenhängenden
+    Bereich.
+    """
+
+    def __init__(self, localities: List[Dict]):
+        self.localities = localities
+        self._by_plz: Dict[str, List[Dict]] = {}
+        for locality in localities:
+            self._by_plz.setdefault(locality['plz'], []).append(locality)
+
+        # Eindeutige (PLZ, Ort)-Paare mit Mittelpunkt als Vorschläge
+        places: Dict[Tuple[str, str], List[Dict]] = {}
+        for locality in localities:
+            places.setdefault((locality['plz'], locality['ort']), []).append(locality)
+        self._places = [
+            {
+                'label': f"{plz} {ort}",
+                'plz': plz,
+                'ort': ort,
+                'state': entries[0]['state'],
+                'lat': round(sum(e['lat'] for e in entries) / len(entries), 5),
+                'lng': round(sum(e['lng'] for e in entries) / len(entries), 5)
+            }
+            for (plz, ort), entries in places.items()
+        ]
+
+        by_plz = sorted(range(len(self._places)), key=lambda i: (self._places[i]['plz'], self._places[i]['ort']))
+        self._plz_keys = [self._places[i]['plz'] for i in by_plz]
+        self._plz_order = by_plz
+
+        names = sorted(
+            (normalize_place_name(place['ort']), place['plz'], i) for i, place in enumerate(self._places)
+        )
+        self._name_keys = [name for name, _, _ in names]
+        self._name_order = [i for _, _, i in names]
+
+        # Raster für die Umkehrsuche: Zelle -> Vorschläge mit Mittelpunkt in der Zelle
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for i, place in enumerate(self._places):
+            self._grid.setdefault(self._cell(place['lat'], place['lng']), []).append(i)
+        rows = [cell[0] for cell in self._grid] or [0]
+        cols = [cell[1] for cell in self._grid] or [0]
+        self._max_ring = max(max(rows) - min(rows), max(cols) - min(cols)) + 1
+
+    def __len__(self):
+        return len(self.localities)
+
+    def by_plz(self, plz: str) -> List[Dict]:
+        """Alle Orte mit dieser Postleitzahl."""
+        return self._by_plz.get(plz, [])
+
+    def plz_centroid(self, plz: str, ort: Optional[str] = None, exact: bool = False) -> Optional[Dict]:
+        """
+        Mittelpunkt einer Postleitzahl.
+
+        Args:
+            plz (str): 5-stellige Postleitzahl
+            ort (str): Optionaler Ortsname; passt er zu keinem Ort der PLZ, gibt es kein Ergebnis
+            exact (bool): Ortsname muss vollständig statt nur am Anfang übereinstimmen
+
+        Returns:
+            dict: lat und lng oder None, wenn die PLZ unbekannt ist
+        """
+        entries = self.by_plz(plz)
+        if ort:
+            wanted = normalize_place_name(ort)
+            entries = [
+                e for e in entries
+                if (normalize_place_name(e['ort']) == wanted if exact
+                    else normalize_place_name(e['ort']).startswith(wanted))
+            ]
+        if not entries:
+            return None
+        return {
+            'lat': sum(e['lat'] for e in entries) / len(entries),
+            'lng': sum(e['lng'] for e in entries) / len(entries)
+        }
+
+    @staticmethod
+    def _cell(lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / GRID_CELL_DEG), math.floor(lng / GRID_CELL_DEG)
+
+    def nearest(self, lat: float, lng: float, max_km: Optional[float] = None) -> Optional[Dict]:
+        """
+        Nächstgelegener PLZ-Schwerpunkt (Umkehr-Geocodierung ohne Google).
+
+        Durchsucht die Rasterzellen ringförmig um den Punkt, bis kein weiter
+        außen liegender Ring mehr näher sein kann.
+
+        Args:
+            lat (float): Breitengrad
+            lng (float): Längengrad
+            max_km (float): Nur Schwerpunkte bis zu dieser Entfernung
+
+        Returns:
+            dict: Vorschlag (label, plz, ort, state, lat, lng) mit distance_km oder None
+        """
+        row, col = self._cell(lat, lng)
+        best, best_m = None, math.inf
+        for ring in range(self._max_ring + 1):
+            # Punkte außerhalb der bisherigen Ringe sind mindestens so weit entfernt
+            bound_km = (ring - 1) * _MIN_CELL_KM if ring else 0.0
+            if best_m / 1000 <= bound_km or (max_km is not None and bound_km > max_km):
+                break
+            for r in range(row - ring, row + ring + 1):
+                step = 1 if abs(r - row) == ring else 2 * ring
+                for c in range(col - ring, col + ring + 1, step or 1):
+                    for i in self._grid.get((r, c), ()):
+                        place = self._places[i]
+                        distance = haversine_m(lat, lng, place['lat'], place['lng'])
+                        if distance < best_m:
+                            best, best_m = place, distance
+        if best is None or (max_km is not None and best_m / 1000 > max_km):
+            return None
+        return dict(best, distance_km=round(best_m / 1000, 2))
+
+    @staticmethod
+    def _prefix_range(keys: List[str], prefix: str) -> range:
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\uffff')
+        return range(start, end)
+
+    def suggest(self, query: str, limit: int = 10, scan_limit: int = 1000) -> List[Dict]:
+        """
+        Vorschläge für eine Eingabe im Suchfeld.
+
+        Ziffern am Anfang werden als PLZ-Präfix gelesen, ein folgender Text als
+        Präfix des Ortsnamens ("214 Ap"); reiner Text sucht über Ortsnamen. Bei
+        Ortsnamen kommt zuerst je ein Eintrag pro Ort, damit eine große Stadt mit
+        vielen Postleitzahlen nicht alle Plätze belegt.
+
+        Args:
+            query (str): Eingabe des Nutzers
+            limit (int): Maximale Anzahl Vorschläge
+            scan_limit (int): Maximale Anzahl geprüfter Einträge
+
+        Returns:
+            list: Vorschläge mit label ("PLZ Ort"), plz, ort, state, lat und lng
+        """
+        match = re.match(r"^\s*(\d{1,5})\s*(.*)$", query or '')
+        if match:
+            name_prefix = normalize_place_name(match.group(2))
+            indices = (self._plz_order[i] for i in self._prefix_range(self._plz_keys, match.group(1)))
+            results = []
+            for i in indices:
+                if len(results) >= limit:
+                    break
+                if normalize_place_name(self._places[i]['ort']).startswith(name_prefix):
+                    results.append(self._places[i])
+            return results
+
+        prefix = normalize_place_name(query)
+        if not prefix:
+            return []
+        matches = self._prefix_range(self._name_keys, prefix)
+        first_per_place, more = [], []
+        seen = set()
+        for i in matches[:scan_limit]:
+            place = self._places[self._name_order[i]]
+            (more if place['ort'] in seen else first_per_place).append(place)
+            seen.add(place['ort'])
+        return (first_per_place + more)[:limit]
+
+
+@lru_cache(maxsize=1)
+def get_localities() -> LocalityIndex:
+    """Einmal pro Prozess geladener Index der deutschen Orte."""
+    index = LocalityIndex(load_localities())
+    logger.info(f"{len(index)} PLZ-Einträge für die Offline-Geocodierung geladen")
+    return index
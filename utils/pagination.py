@@ -0,0 +1,141 @@
+import os
+import time
+import heapq
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+import googlemaps
+
+from utils.jobs import job_heartbeat
+
+logger = logging.getLogger(__name__)
+
+# Google liefert höchstens 3 Seiten à 20 Ergebnisse pro Nearby-Suche
+MAX_PAGES = 3
+
+
+class PageTokenScheduler:
+    """
+    Führt mehrere paginierte Places-Suchen gleichzeitig aus.
+
+    Statt nach jeder Seite fest zu schlafen, werden alle next_page_tokens in einer
+    gemeinsamen Warteschlange nach Fälligkeit verwaltet. Während ein Token reift,
+    laufen andere Suchen und die Verarbeitung bereits geladener Seiten weiter.
+    Meldet Google INVALID_REQUEST (Token noch nicht aktiv), wird nach kurzem
+    Intervall erneut versucht.
+    """
+
+    def __init__(self, fetch_page: Callable[[Dict, Optional[str]], Dict],
+                 max_workers: Optional[int] = None,
+                 token_delay: Optional[float] = None,
+                 retry_interval: Optional[float] = None,
+                 token_timeout: float = 10.0,
+                 max_pages: int = MAX_PAGES):
+        """
+        Args:
+            fetch_page (callable): fetch_page(query, page_token) -> places_nearby-Antwort
+            max_workers (int): Parallele Places-Anfragen
+            token_delay (float): Sekunden bis zum ersten Versuch mit einem neuen Token
+            retry_interval (float): Sekunden zwischen Versuchen bei INVALID_REQUEST
+            token_timeout (float): Maximale Wartezeit auf ein Token
+            max_pages (int): Maximale Seiten pro Suche
+        """
+        self.fetch_page = fetch_page
+        self.max_workers = max_workers or int(os.getenv('PLACES_MAX_WORKERS', '4'))
+        self.token_delay = token_delay if token_delay is not None else float(os.getenv('PLACES_TOKEN_DELAY', '1.0'))
+        self.retry_interval = retry_interval if retry_interval is not None else float(os.getenv('PLACES_TOKEN_RETRY_INTERVAL', '0.25'))
+        self.token_timeout = token_timeout
+        self.max_pages = max_pages
+        self.token_retries = 0
+
+    def run(self, queries: List[Dict],
+            on_page: Callable[[Dict, List[Dict], int], bool],
+            on_done: Optional[Callable[[Dict, Dict], Optional[List[Dict]]]] = None):
+        """
+        Arbeitet alle Suchen inklusive Folgeseiten ab.
+
+        Args:
+            queries (list): Suchanfragen (beliebige Dicts, werden an fetch_page übergeben)
+            on_page (callable): on_page(query, results, page_no) -> False beendet die Paginierung
+            on_done (callable): on_done(query, stats) -> optionale Liste neuer Suchanfragen;
+                stats enthält pages, results, truncated (Seitenlimit erreicht) und stopped_early
+                (on_page hat abgebrochen)
+        """
+        seq = itertools.count()
+        waiting = []  # Heap: (fällig_ab, seq, query, token, page_no, token_seit)
+        stats = {}
+        # Lange Suchen (viele Teilkreise) melden dem Suchjob regelmäßig ein Lebenszeichen
+        heartbeat = job_heartbeat()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+
+            def submit(query, token, page_no, token_since):
+                future = executor.submit(self.fetch_page, query, token)
+                pending[future] = (query, token, page_no, token_since)
+
+            def finish(query):
+                new_queries = on_done(query, stats[id(query)]) if on_done else None
+                for new_query in new_queries or []:
+                    start(new_query)
+
+            def start(query):
+                stats[id(query)] = {'pages': 0, 'results': 0, 'truncated': False, 'stopped_early': False}
+                submit(query, None, 1, None)
+
+            for query in queries:
+                start(query)
+
+            while pending or waiting:
+                heartbeat()
+                now = time.monotonic()
+                while waiting and waiting[0][0] <= now:
+                    _, _, query, token, page_no, token_since = heapq.heappop(waiting)
+                    submit(query, token, page_no, token_since)
+
+                if not pending:
+                    # Nur noch reifende Tokens: bis zum nächsten fälligen warten
+                    time.sleep(max(0.0, waiting[0][0] - time.monotonic()))
+                    continue
+
+                timeout = max(0.0, waiting[0][0] - now) if waiting else None
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    query, token, page_no, token_since = pending.pop(future)
+                    query_stats = stats[id(query)]
+                    try:
+                        places_result = future.result()
+                    except googlemaps.exceptions.ApiError as e:
+                        if (token and e.status == 'INVALID_REQUEST' and
+                                time.monotonic() - token_since < self.token_timeout):
+                            # Token noch nicht aktiv: zeitnah erneut versuchen
+                            self.token_retries += 1
+                            heapq.heappush(waiting, (time.monotonic() + self.retry_interval, next(seq),
+                                                     query, token, page_no, token_since))
+                            continue
+                        logger.warning(f"Places-Suche {query.get('keyword')} Seite {page_no} fehlgeschlagen: {e}")
+                        finish(query)
+                        continue
+                    except Exception as e:
+                        logger.warning(f"Places-Suche {query.get('keyword')} Seite {page_no} fehlgeschlagen: {str(e)}")
+                        finish(query)
+                        continue
+
+                    results = places_result.get('results', [])
+                    query_stats['pages'] += 1
+                    query_stats['results'] += len(results)
+
+                    proceed = on_page(query, results, page_no)
+                    next_token = places_result.get('next_page_token')
+                    if next_token and proceed is not False and page_no < self.max_pages:
+                        now = time.monotonic()
+                        heapq.heappush(waiting, (now + self.token_delay, next(seq),
+                                                 query, next_token, page_no + 1, now))
+                    else:
+                        # truncated: Google hätte weitere Ergebnisse geliefert (Seitenlimit erreicht)
+                        query_stats['truncated'] = bool(next_token) and page_no >= self.max_pages
+                        query_stats['stopped_early'] = bool(next_token) and proceed is False
+                        finish(query)
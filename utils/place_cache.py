@@ -0,0 +1,102 @@
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Felder, die sich häufig ändern und daher früher aufgefrischt werden
+VOLATILE_FIELDS = ('rating', 'user_ratings_total')
+
+
+class PlaceDetailsCache:
+    """
+    Persistenter Cache für Google Place Details.
+
+    Einträge werden über place_id und angefragte Feldliste adressiert. Statische
+    Felder (Name, Adresse, Telefon, Website) leben bis zur Haupt-TTL, Bewertungen
+    werden nach einer kürzeren TTL separat nachgeladen.
+    """
+
+    def __init__(self, static_ttl_seconds: float, volatile_ttl_seconds: float, max_entries: int):
+        self.volatile_ttl_seconds = volatile_ttl_seconds
+        self._cache = TTLCache('place_details', static_ttl_seconds, max_entries)
+
+    @staticmethod
+    def make_key(place_id: str, fields: List[str]) -> str:
+        return f"{place_id}|{','.join(sorted(fields))}"
+
+    def lookup(self, place_id: str, fields: List[str], max_age: Optional[float] = None,
+               volatile_max_age: Optional[float] = None) -> Tuple[Optional[Dict], bool]:
+        """
+        Sucht Details im Cache.
+
+        Args:
+            place_id (str): Google Place ID
+            fields (list): Angefragte Felder
+            max_age (float): Einträge älter als max_age Sekunden als fehlend behandeln
+            volatile_max_age (float): Abweichende TTL der Bewertungsfelder in Sekunden
+
+        Returns:
+            tuple: (Details oder None, True wenn Bewertungsfelder aufgefrischt werden müssen)
+        """
+        entry = self._cache.get(self.make_key(place_id, fields), max_age=max_age)
+        if not entry:
+            return None, False
+
+        volatile_ttl = self.volatile_ttl_seconds if volatile_max_age is None else volatile_max_age
+        volatile_age = time.time() - entry.get('volatile_at', 0)
+        needs_refresh = (
+            any(f in fields for f in VOLATILE_FIELDS) and
+            volatile_age > volatile_ttl
+        )
+        return dict(entry['result']), needs_refresh
+
+    def store(self, place_id: str, fields: List[str], result: Dict):
+        """Speichert vollständige Details für place_id und Feldliste."""
+        now = time.time()
+        self._cache.set(self.make_key(place_id, fields), {
+            'result': result,
+            'volatile_at': now
+        }, created_at=now)
+
+    def refresh_volatile(self, place_id: str, fields: List[str], volatile: Dict) -> Optional[Dict]:
+        """
+        Aktualisiert nur die Bewertungsfelder eines Eintrags, ohne dessen
+        Haupt-TTL zu verlängern.
+
+        Returns:
+            dict: Aktualisierte Details oder None, wenn der Eintrag inzwischen fehlt
+        """
+        key = self.make_key(place_id, fields)
+        entry, age = self._cache.get_with_age(key)
+        if not entry:
+            return None
+
+        now = time.time()
+        for field in VOLATILE_FIELDS:
+            if field in volatile:
+                entry['result'][field] = volatile[field]
+        entry['volatile_at'] = now
+        self._cache.set(key, entry, created_at=now - age)
+        return dict(entry['result'])
+
+    def evict(self) -> int:
+        return self._cache.evict()
+
+
+_place_details_cache: Optional[PlaceDetailsCache] = None
+
+
+def get_place_details_cache() -> PlaceDetailsCache:
+    """Liefert die prozessweite Instanz des Place-Details-Caches."""
+    global _place_details_cache
+    if _place_details_cache is None:
+        _place_details_cache = PlaceDetailsCache(
+            static_ttl_seconds=float(os.getenv('PLACE_CACHE_TTL_HOURS', '720')) * 3600,
+            volatile_ttl_seconds=float(os.getenv('PLACE_CACHE_RATING_TTL_HOURS', '24')) * 3600,
+            max_entries=int(os.getenv('PLACE_CACHE_MAX_ENTRIES', '50000'))
+        )
+    return _place_details_cache
@@ -0,0 +1,192 @@
+"""
+Vorwärmen der Caches für häufig gesuchte Gebiete.
+
+Liest die meistgesuchten (Ort, Radius)-Paare aus der Suchhistorie und frischt
+Geocoding, Nearby-Ergebnisse, Place Details und gescrapte Kontaktdaten der
+ersten Ergebnisseite auf, bevor die Einträge ablaufen. Die fertige Ergebnismenge
+landet im Suchergebnis-Cache, sodass die nächste Suche des Gebiets ein Treffer
+ist. Die Anzahl der Google-Aufrufe pro Lauf ist begrenzt.
+
+Aufruf:
+    python -m utils.prewarm              # einmaliger Lauf
+    python -m utils.prewarm --daemon     # täglich zur Stunde PREWARM_HOUR
+    python -m utils.prewarm --dry-run    # nur Gebiete und Schätzung anzeigen
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils.api_metrics import api_scope, get_metrics
+from utils.enrichment import enrich_brokers, RESULTS_PAGE_SIZE
+from utils.geocoding import (
+    get_coordinates, search_insurance_brokers, get_geocode_cache, get_nearby_cache, nearby_cache_key,
+    SEARCH_KEYWORDS
+)
+from utils.pagination import MAX_PAGES
+from utils.result_store import create_result_set, save_result_page
+from utils.scraper import get_scrape_cache
+from utils.search_cache import get_search_cache
+from utils.search_history import top_search_areas
+from utils.tiling import plan_tiles
+
+logger = logging.getLogger(__name__)
+
+PREWARM_TOP_AREAS = int(os.getenv('PREWARM_TOP_AREAS', '20'))
+PREWARM_HISTORY_DAYS = int(os.getenv('PREWARM_HISTORY_DAYS', '30'))
+PREWARM_MAX_GOOGLE_CALLS = int(os.getenv('PREWARM_MAX_GOOGLE_CALLS', '500'))
+PREWARM_HOUR = int(os.getenv('PREWARM_HOUR', '3'))
+
+# Einträge werden aufgefrischt, sobald dieser Anteil ihrer TTL verstrichen ist
+PREWARM_REFRESH_FRACTION = float(os.getenv('PREWARM_REFRESH_FRACTION', '0.5'))
+
+
+def estimate_search_calls(area: Dict) -> int:
+    """Obergrenze der Google-Aufrufe für ein Gebiet (Geocode + Nearby + Details der ersten Seite)."""
+    tiles = plan_tiles(area['lat'], area['lng'], area['radius_km'] * 1000)
+    return 1 + len(tiles) * len(SEARCH_KEYWORDS) * MAX_PAGES + RESULTS_PAGE_SIZE
+
+
+def _calls_used(request_id: str) -> int:
+    summary = get_metrics().request_summary(request_id)
+    return sum(summary['calls'].values()) if summary else 0
+
+
+def prewarm(limit: Optional[int] = None, budget: Optional[int] = None,
+            days: Optional[int] = None, dry_run: bool = False) -> Dict:
+    """
+    Wärmt die Caches der meistgesuchten Gebiete vor.
+
+    Gebiete, deren geschätzte Aufrufe das Restbudget übersteigen, werden
+    übersprungen; kleinere Gebiete weiter hinten in der Liste kommen noch dran.
+
+    Args:
+        limit (int): Anzahl der Gebiete (Standard: PREWARM_TOP_AREAS)
+        budget (int): Maximale Google-Aufrufe (Standard: PREWARM_MAX_GOOGLE_CALLS)
+        days (int): Betrachteter Zeitraum der Suchhistorie in Tagen
+        dry_run (bool): Nur planen, keine Aufrufe
+
+    Returns:
+        dict: Zusammenfassung mit warmed, skipped, google_calls und areas
+    """
+    limit = limit or PREWARM_TOP_AREAS
+    budget = PREWARM_MAX_GOOGLE_CALLS if budget is None else budget
+    areas = top_search_areas(limit, days or PREWARM_HISTORY_DAYS)
+
+    geocode_max_age = get_geocode_cache().ttl_seconds * PREWARM_REFRESH_FRACTION
+    nearby_max_age = get_nearby_cache().ttl_seconds * PREWARM_REFRESH_FRACTION
+    scrape_max_age = get_scrape_cache().ttl_seconds * PREWARM_REFRESH_FRACTION
+
+    report = {'warmed': 0, 'skipped': 0, 'google_calls': 0, 'areas': []}
+    with api_scope('prewarm') as scope:
+        for area in areas:
+            entry = dict(area, estimated_calls=estimate_search_calls(area), status='geplant')
+            report['areas'].append(entry)
+            used = _calls_used(scope['request_id'])
+
+            _, age = get_nearby_cache().get_with_age(nearby_cache_key(area, area['radius_km'] * 1000))
+            if age is not None and age < nearby_max_age:
+                # Nearby-Ergebnisse noch frisch, trotzdem Details/Scraping der ersten Seite prüfen
+                entry['estimated_calls'] = RESULTS_PAGE_SIZE
+
+            if used + entry['estimated_calls'] > budget:
+                entry['status'] = 'übersprungen (Budget)'
+                report['skipped'] += 1
+                continue
+            if dry_run:
+                continue
+
+            try:
+                coordinates = (get_coordinates(area['location'], max_age=geocode_max_age) or
+                               {'lat': area['lat'], 'lng': area['lng']})
+                location = coordinates.get('label', area['location'])
+                sort_by = area.get('sort') or 'distance'
+                candidates = search_insurance_brokers(
+                    coordinates, area['radius_km'] * 1000, sort_by, max_age=nearby_max_age
+                )
+                brokers = enrich_brokers(candidates[:RESULTS_PAGE_SIZE], location, area['radius_km'],
+                                         scrape_max_age=scrape_max_age)
+                if candidates:
+                    # Wie eine normale Suche ablegen, damit die nächste Suche des Gebiets ein Cache-Treffer ist
+                    result_id = create_result_set({
+                        'location': location,
+                        'radius': area['radius_km'],
+                        'sort': sort_by,
+                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    }, candidates)
+                    save_result_page(result_id, 1, brokers)
+                    get_search_cache().store(location, area['radius_km'], sort_by, result_id, coordinates)
+                entry['status'] = 'vorgewärmt'
+                entry['candidates'] = len(candidates)
+                report['warmed'] += 1
+            except Exception as e:
+                logger.error(f"Vorwärmen von {area['location']} fehlgeschlagen: {e}")
+                entry['status'] = 'Fehler'
+
+            entry['google_calls'] = _calls_used(scope['request_id']) - used
+
+        report['google_calls'] = _calls_used(scope['request_id'])
+
+    logger.info(
+        f"Vorwärmen abgeschlossen: {report['warmed']} Gebiete aufgefrischt, "
+        f"{report['skipped']} übersprungen, {report['google_calls']} Google-Aufrufe"
+    )
+    return report
+
+
+def seconds_until_hour(hour: int, now: Optional[datetime] = None) -> float:
+    """Sekunden bis zur nächsten vollen Stunde hour (Ortszeit)."""
+    now = now or datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def run_scheduler(hour: int = PREWARM_HOUR, **kwargs):
+    """Führt prewarm() täglich zur Stunde hour aus (blockierend)."""
+    while True:
+        wait = seconds_until_hour(hour)
+        logger.info(f"Nächstes Vorwärmen in {wait / 3600:.1f} Stunden")
+        time.sleep(wait)
+        try:
+            prewarm(**kwargs)
+        except Exception as e:
+            logger.error(f"Vorwärmen fehlgeschlagen: {e}")
+
+
+def _print_report(report: Dict):
+    for area in report['areas']:
+        print(f"{area['status']:<24} {area['location']} ({area['radius_km']} km) – "
+              f"{area['searches']} Suchen, ~{area['estimated_calls']} Aufrufe")
+    print(f"\n{report['warmed']} vorgewärmt, {report['skipped']} übersprungen, "
+          f"{report['google_calls']} Google-Aufrufe")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Caches für häufig gesuchte Gebiete vorwärmen')
+    parser.add_argument('--limit', type=int, default=None, help='Anzahl der Gebiete')
+    parser.add_argument('--budget', type=int, default=None, help='Maximale Google-Aufrufe pro Lauf')
+    parser.add_argument('--days', type=int, default=None, help='Zeitraum der Suchhistorie in Tagen')
+    parser.add_argument('--dry-run', action='store_true', help='Nur planen, keine Aufrufe')
+    parser.add_argument('--daemon', action='store_true', help='Täglich zur Stunde PREWARM_HOUR ausführen')
+    args = parser.parse_args(argv)
+
+    if args.daemon:
+        run_scheduler(limit=args.limit, budget=args.budget, days=args.days)
+        return 0
+
+    _print_report(prewarm(args.limit, args.budget, args.days, args.dry_run))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
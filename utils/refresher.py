@@ -0,0 +1,313 @@
+"""
+Schrittweise Auffrischung des Makler-Bestands.
+
+Statt alle Makler regelmäßig neu abzurufen, wählt jeder Lauf nur Makler aus,
+deren Place Details, Bewertungen oder gescrapte Kontaktdaten älter als die
+jeweilige TTL sind. Makler in kürzlich und häufig gesuchten Gebieten kommen
+zuerst, danach die bestbewerteten. Verarbeitet wird in kleinen parallelen
+Batches, bis das Zeit- oder Google-Aufrufbudget erschöpft ist.
+
+Aufruf:
+    python -m utils.refresher              # einmaliger Lauf
+    python -m utils.refresher --daemon     # alle REFRESH_INTERVAL_MINUTES Minuten
+    python -m utils.refresher --dry-run    # nur Auswahl anzeigen
+"""
+
+import os
+import sys
+import time
+import math
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from utils.api_metrics import api_scope, get_metrics
+from utils.broker_store import get_broker_store, PLACES_FIELDS
+from utils.enrichment import build_broker_record, details_from_store
+from utils.geo import haversine_m
+from utils.geocoding import get_maps_client, get_place_details, PLACE_DETAIL_FIELDS
+from utils.place_cache import get_place_details_cache, VOLATILE_FIELDS
+from utils.scraper import scrape_contacts
+from utils.search_history import top_search_areas
+
+logger = logging.getLogger(__name__)
+
+_NOT_AVAILABLE = 'Nicht verfügbar'
+
+# TTLs pro Feldgruppe: Stammdaten (Name, Adresse, Telefon, Website), Bewertungen, Kontaktdaten
+REFRESH_DETAILS_TTL_HOURS = float(os.getenv('REFRESH_DETAILS_TTL_HOURS', '720'))
+REFRESH_RATING_TTL_HOURS = float(os.getenv('REFRESH_RATING_TTL_HOURS', '168'))
+REFRESH_SCRAPE_TTL_HOURS = float(os.getenv('REFRESH_SCRAPE_TTL_HOURS', '336'))
+
+# Budget pro Lauf
+REFRESH_MAX_BROKERS = int(os.getenv('REFRESH_MAX_BROKERS', '200'))
+REFRESH_MAX_GOOGLE_CALLS = int(os.getenv('REFRESH_MAX_GOOGLE_CALLS', '100'))
+REFRESH_MAX_SECONDS = float(os.getenv('REFRESH_MAX_SECONDS', '600'))
+REFRESH_BATCH_SIZE = int(os.getenv('REFRESH_BATCH_SIZE', '20'))
+REFRESH_WORKERS = int(os.getenv('REFRESH_WORKERS', '4'))
+
+# Priorisierung über die Suchhistorie: Gebiete, Zeitraum und Halbwertszeit einer Suche
+REFRESH_TOP_AREAS = int(os.getenv('REFRESH_TOP_AREAS', '20'))
+REFRESH_HISTORY_DAYS = int(os.getenv('REFRESH_HISTORY_DAYS', '30'))
+REFRESH_SEARCH_HALF_LIFE_DAYS = float(os.getenv('REFRESH_SEARCH_HALF_LIFE_DAYS', '7'))
+
+REFRESH_INTERVAL_MINUTES = float(os.getenv('REFRESH_INTERVAL_MINUTES', '60'))
+
+
+def due_fields(broker: Dict, now: Optional[float] = None) -> Dict[str, bool]:
+    """
+    Welche Feldgruppen eines gespeicherten Maklers veraltet sind.
+
+    Returns:
+        dict: details, rating und scrape jeweils True, wenn neu abzurufen
+    """
+    now = now or time.time()
+    last_details = broker.get('last_details') or 0
+    rating_at = (broker['provenance'].get('rating') or {}).get('at', last_details)
+    return {
+        'details': now - last_details > REFRESH_DETAILS_TTL_HOURS * 3600,
+        'rating': now - rating_at > REFRESH_RATING_TTL_HOURS * 3600,
+        'scrape': (broker['website'] != _NOT_AVAILABLE and
+                   now - (broker.get('last_scraped') or 0) > REFRESH_SCRAPE_TTL_HOURS * 3600)
+    }
+
+
+def plan_refresh(limit: Optional[int] = None, now: Optional[float] = None,
+                 areas: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    Wählt die aufzufrischenden Makler und sortiert sie nach Priorität.
+
+    Priorität = Σ Suchen in Gebieten, die den Makler enthalten (mit Halbwertszeit
+    REFRESH_SEARCH_HALF_LIFE_DAYS gewichtet) + Bewertung / 5. Ein gesuchtes
+    Gebiet geht also vor, innerhalb gleicher Gebiete entscheidet die Bewertung.
+
+    Args:
+        limit (int): Maximale Anzahl Makler (Standard: REFRESH_MAX_BROKERS)
+        now (float): Zeitpunkt für die TTL-Prüfung
+        areas (list): Suchgebiete (Standard: top_search_areas())
+
+    Returns:
+        list: Dicts mit broker, due und priority, höchste Priorität zuerst
+    """
+    store = get_broker_store()
+    if not store:
+        return []
+    limit = limit or REFRESH_MAX_BROKERS
+    now = now or time.time()
+    if areas is None:
+        areas = top_search_areas(REFRESH_TOP_AREAS, REFRESH_HISTORY_DAYS)
+    cutoffs = (
+        now - REFRESH_DETAILS_TTL_HOURS * 3600,
+        now - REFRESH_RATING_TTL_HOURS * 3600,
+        now - REFRESH_SCRAPE_TTL_HOURS * 3600
+    )
+
+    candidates = {}
+    region_weight = {}
+    for area in areas:
+        weight = area['searches'] * 0.5 ** (
+            (now - area['last_searched_at']) / 86400 / REFRESH_SEARCH_HALF_LIFE_DAYS
+        )
+        lat_delta = area['radius_km'] / 111.32
+        lng_delta = area['radius_km'] / (111.32 * max(math.cos(math.radians(area['lat'])), 0.01))
+        bbox = (area['lat'] - lat_delta, area['lng'] - lng_delta, area['lat'] + lat_delta, area['lng'] + lng_delta)
+        for broker in store.stale_brokers(*cutoffs, bbox=bbox, limit=limit):
+            if haversine_m(area['lat'], area['lng'], broker['lat'], broker['lng']) > area['radius_km'] * 1000:
+                continue
+            candidates[broker['place_id']] = broker
+            region_weight[broker['place_id']] = region_weight.get(broker['place_id'], 0) + weight
+    # Außerhalb gesuchter Gebiete: die bestbewerteten veralteten Makler
+    for broker in store.stale_brokers(*cutoffs, limit=limit):
+        candidates.setdefault(broker['place_id'], broker)
+
+    plan = []
+    for place_id, broker in candidates.items():
+        due = due_fields(broker, now)
+        if not any(due.values()):
+            continue
+        priority = region_weight.get(place_id, 0) + (broker['rating'] or 0) / 5
+        plan.append({'broker': broker, 'due': due, 'priority': round(priority, 3)})
+    plan.sort(key=lambda item: (-item['priority'], item['broker']['place_id']))
+    return plan[:limit]
+
+
+def refresh_broker(gmaps, broker: Dict, due: Dict[str, bool]):
+    """
+    Frischt die veralteten Felder eines Maklers auf.
+
+    Place Details kommen über get_place_details() (Place-Details-Cache zuerst),
+    Kontaktdaten über scrape_contacts(); nicht fällige Felder bleiben
+    unverändert. Herkunft und Zeitstempel werden nur für tatsächlich bei Google
+    abgerufene Felder bzw. erfolgreich gescrapte Websites gesetzt; Details aus dem
+    Cache und fehlgeschlagenes Scraping lassen die alten Stände stehen.
+
+    Returns:
+        tuple: (Makler-Datensatz, Herkunft) für BrokerStore.upsert_many()
+    """
+    sources = {}
+    details = None
+    if gmaps and (due['details'] or due['rating']):
+        lookup = dict(
+            max_age=REFRESH_DETAILS_TTL_HOURS * 3600 if due['details'] else None,
+            volatile_max_age=REFRESH_RATING_TTL_HOURS * 3600
+        )
+        cache = get_place_details_cache()
+        cached, needs_refresh = cache.lookup(broker['place_id'], PLACE_DETAIL_FIELDS, **lookup)
+        try:
+            details = get_place_details(gmaps, broker['place_id'], **lookup)
+        except Exception as e:
+            logger.warning(f"Place Details für {broker['place_id']} nicht aktualisiert: {e}")
+        if details and cached is None:
+            sources.update({field: 'places' for field in PLACES_FIELDS})
+            if details.get('formatted_phone_number'):
+                sources['phone'] = 'places'
+        elif details and needs_refresh:
+            # Cache-Treffer mit veralteten Bewertungen: nur diese stammen frisch von Google,
+            # sofern das Nachladen geklappt hat
+            _, still_stale = cache.lookup(broker['place_id'], PLACE_DETAIL_FIELDS, **lookup)
+            if not still_stale:
+                sources.update({field: 'places' for field in VOLATILE_FIELDS})
+    if not details:
+        details = details_from_store(broker, {})
+
+    # Ohne Website in den Details die gespeicherte verwenden (fehlende Werte überschreiben nichts)
+    website = details.get('website') or (broker['website'] if broker['website'] != _NOT_AVAILABLE else '')
+    scraped = None
+    if website and (due['scrape'] or website != broker['website']):
+        scraped = scrape_contacts(website, max_age=REFRESH_SCRAPE_TTL_HOURS * 3600)
+        if scraped:
+            sources.update({'email': 'scrape', 'contact_person': 'scrape', 'scraped': True})
+            if 'formatted_phone_number' not in details:
+                sources['phone'] = 'scrape'
+    return build_broker_record(details, scraped, '', 0), sources
+
+
+def _calls_used(request_id: str) -> int:
+    summary = get_metrics().request_summary(request_id)
+    return sum(summary['calls'].values()) if summary else 0
+
+
+def refresh(limit: Optional[int] = None, budget: Optional[int] = None,
+            max_seconds: Optional[float] = None, dry_run: bool = False) -> Dict:
+    """
+    Frischt veraltete Makler in Batches auf, bis ein Budget erschöpft ist.
+
+    Jeder Makler mit fälligen Place Details zählt mit einem Google-Aufruf gegen
+    das Budget; passt er nicht mehr hinein, wird er übersprungen, reine
+    Scraping-Aufträge laufen weiter. Jeder Batch wird in einer Transaktion
+    gespeichert, ohne last_seen zu verändern.
+
+    Args:
+        limit (int): Maximale Anzahl Makler (Standard: REFRESH_MAX_BROKERS)
+        budget (int): Maximale Google-Aufrufe (Standard: REFRESH_MAX_GOOGLE_CALLS)
+        max_seconds (float): Zeitbudget in Sekunden (Standard: REFRESH_MAX_SECONDS)
+        dry_run (bool): Nur planen, keine Aufrufe
+
+    Returns:
+        dict: Zusammenfassung mit planned, refreshed, details, scraped, skipped,
+        google_calls, elapsed_s und stopped (Grund für einen vorzeitigen Abbruch)
+    """
+    started = time.monotonic()
+    budget = REFRESH_MAX_GOOGLE_CALLS if budget is None else budget
+    deadline = started + (REFRESH_MAX_SECONDS if max_seconds is None else max_seconds)
+    plan = plan_refresh(limit)
+
+    report = {'planned': len(plan), 'refreshed': 0, 'details': 0, 'scraped': 0, 'skipped': 0,
+              'google_calls': 0, 'elapsed_s': 0, 'stopped': None}
+    if dry_run or not plan:
+        report['plan'] = [{'place_id': item['broker']['place_id'], 'name': item['broker']['name'],
+                           'priority': item['priority'], 'due': item['due']} for item in plan]
+        return report
+
+    store = get_broker_store()
+    with api_scope('refresh') as scope:
+        gmaps = get_maps_client()
+        pending = list(plan)
+        with ThreadPoolExecutor(max_workers=max(1, REFRESH_WORKERS)) as executor:
+            while pending:
+                if time.monotonic() >= deadline:
+                    report['stopped'] = 'Zeitbudget'
+                    break
+                # Batch zusammenstellen, der das restliche Aufrufbudget nicht überschreitet
+                calls_left = budget - _calls_used(scope['request_id'])
+                batch = []
+                while pending and len(batch) < REFRESH_BATCH_SIZE:
+                    item = pending.pop(0)
+                    needs_call = bool(gmaps) and (item['due']['details'] or item['due']['rating'])
+                    if needs_call and calls_left <= 0:
+                        report['skipped'] += 1
+                        report['stopped'] = 'Aufrufbudget'
+                        continue
+                    if not needs_call and not item['due']['scrape']:
+                        # Ohne API Key sind nur Kontaktdaten auffrischbar
+                        report['skipped'] += 1
+                        continue
+                    calls_left -= needs_call
+                    batch.append(item)
+                if not batch:
+                    break
+
+                results = list(executor.map(
+                    lambda item: refresh_broker(gmaps, item['broker'], item['due']), batch
+                ))
+                store.upsert_many(results, touch_seen=False)
+                report['refreshed'] += len(results)
+                report['details'] += sum(1 for _, sources in results if 'name' in sources)
+                report['scraped'] += sum(1 for _, sources in results if sources.get('scraped'))
+            report['skipped'] += len(pending)
+
+        report['google_calls'] = _calls_used(scope['request_id'])
+
+    report['elapsed_s'] = round(time.monotonic() - started, 1)
+    logger.info(
+        f"Auffrischung abgeschlossen: {report['refreshed']} von {report['planned']} Maklern "
+        f"({report['details']} Details, {report['scraped']} Websites), {report['skipped']} übersprungen, "
+        f"{report['google_calls']} Google-Aufrufe in {report['elapsed_s']} s"
+    )
+    return report
+
+
+def run_scheduler(interval_minutes: float = REFRESH_INTERVAL_MINUTES, **kwargs):
+    """Führt refresh() alle interval_minutes Minuten aus (blockierend)."""
+    while True:
+        try:
+            refresh(**kwargs)
+        except Exception as e:
+            logger.error(f"Auffrischung fehlgeschlagen: {e}")
+        time.sleep(interval_minutes * 60)
+
+
+def _print_report(report: Dict):
+    for item in report.get('plan', []):
+        due = ', '.join(field for field, is_due in item['due'].items() if is_due)
+        print(f"{item['priority']:>8.3f}  {item['name']} ({due})")
+    print(f"\n{report['refreshed']} von {report['planned']} Maklern aufgefrischt "
+          f"({report['details']} Details, {report['scraped']} Websites), {report['skipped']} übersprungen, "
+          f"{report['google_calls']} Google-Aufrufe"
+          + (f", Abbruch: {report['stopped']}" if report['stopped'] else ''))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Veraltete Makler im Bestand auffrischen')
+    parser.add_argument('--limit', type=int, default=None, help='Maximale Anzahl Makler pro Lauf')
+    parser.add_argument('--budget', type=int, default=None, help='Maximale Google-Aufrufe pro Lauf')
+    parser.add_argument('--max-seconds', type=float, default=None, help='Zeitbudget pro Lauf in Sekunden')
+    parser.add_argument('--dry-run', action='store_true', help='Nur Auswahl anzeigen, keine Aufrufe')
+    parser.add_argument('--daemon', action='store_true', help='Alle REFRESH_INTERVAL_MINUTES Minuten ausführen')
+    args = parser.parse_args(argv)
+
+    if args.daemon:
+        run_scheduler(limit=args.limit, budget=args.budget, max_seconds=args.max_seconds)
+        return 0
+
+    _print_report(refresh(args.limit, args.budget, args.max_seconds, args.dry_run))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
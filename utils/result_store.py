@@ -0,0 +1,102 @@
+import os
+import re
+import uuid
+import base64
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_store: Optional[TTLCache] = None
+
+
+def _get_store() -> TTLCache:
+    global _store
+    if _store is None:
+        _store = TTLCache(
+            'result_sets',
+            ttl_seconds=float(os.getenv('RESULT_STORE_TTL_HOURS', '24')) * 3600,
+            max_entries=int(os.getenv('RESULT_STORE_MAX_ENTRIES', '20000'))
+        )
+    return _store
+
+
+def create_result_set(params: Dict, candidates: List[Dict]) -> str:
+    """
+    Legt eine serverseitige Ergebnismenge mit allen Nearby-Kandidaten an.
+
+    Args:
+        params (dict): Suchparameter (location, radius, sort, timestamp)
+        candidates (list): Gerankte Kandidaten aus search_insurance_brokers()
+
+    Returns:
+        str: ID der Ergebnismenge
+    """
+    result_id = uuid.uuid4().hex
+    _get_store().set(result_id, {'params': params, 'candidates': candidates})
+    return result_id
+
+
+def get_result_set(result_id: str) -> Optional[Dict]:
+    """Liest eine Ergebnismenge oder None, wenn sie unbekannt oder abgelaufen ist."""
+    if not result_id:
+        return None
+    return _get_store().get(result_id)
+
+
+def save_result_page(result_id: str, page: int, brokers: List[Dict]):
+    """Speichert die angereicherten Makler einer Ergebnisseite."""
+    _get_store().set(f"{result_id}:page:{page}", brokers)
+
+
+def get_result_page(result_id: str, page: int) -> Optional[List[Dict]]:
+    """Liest eine bereits angereicherte Ergebnisseite."""
+    return _get_store().get(f"{result_id}:page:{page}")
+
+
+def encode_cursor(result_id: str, offset: int) -> str:
+    """
+    Cursor für die API: zeigt auf eine Position in einer Ergebnismenge.
+
+    Die Kandidatenliste einer Ergebnismenge ändert sich nach dem Anlegen nicht,
+    deshalb bleibt ein Cursor stabil, bis die Ergebnismenge abläuft.
+    """
+    return base64.urlsafe_b64encode(f"{result_id}:{int(offset)}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    """
+    Liest einen Cursor aus encode_cursor().
+
+    Returns:
+        tuple: (result_id, offset) oder None bei ungültigem Cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    match = re.fullmatch(r'([0-9a-f]{32}):(\d+)', raw)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def save_upload_results(results: Dict) -> str:
+    """
+    Legt das Ergebnis eines Excel-Uploads (bestehende, neue und doppelte Makler) ab.
+
+    Returns:
+        str: ID für die Session
+    """
+    upload_id = uuid.uuid4().hex
+    _get_store().set(f"upload:{upload_id}", results)
+    return upload_id
+
+
+def get_upload_results(upload_id: str) -> Optional[Dict]:
+    """Liest ein Upload-Ergebnis oder None, wenn es unbekannt oder abgelaufen ist."""
+    if not upload_id:
+        return None
+    return _get_store().get(f"upload:{upload_id}")
@@ -0,0 +1,163 @@
+import time
+import queue
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.api_metrics import api_scope
+from utils.enrichment import enrich_brokers, RESULTS_PAGE_SIZE
+from utils.result_store import get_result_set, get_result_page, save_result_page
+from utils.singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# Abstand der Keep-alive-Kommentare, damit Proxies die Verbindung offen halten (Sekunden)
+STREAM_KEEPALIVE_SECONDS = 15
+
+_NOT_AVAILABLE = 'Nicht verfügbar'
+
+
+def enrich_result_page(result_id: str, page: int,
+                       on_details: Optional[Callable[[int, Dict], None]] = None,
+                       on_scraped: Optional[Callable[[int, Dict], None]] = None) -> Optional[List[Dict]]:
+    """
+    Liefert eine Ergebnisseite und reichert sie beim ersten Abruf an.
+
+    Gleichzeitige Abrufe derselben Seite (Nachladen und Stream, auch aus anderen
+    Workern) teilen sich eine Anreicherung; die Callbacks feuern nur beim
+    Abruf, der tatsächlich anreichert.
+
+    Returns:
+        list: Makler der Seite oder None, wenn die Ergebnismenge abgelaufen ist
+    """
+    result_set = get_result_set(result_id)
+    if not result_set:
+        return None
+    brokers = get_result_page(result_id, page)
+    if brokers is not None:
+        return brokers
+
+    params = result_set['params']
+    offset = (page - 1) * RESULTS_PAGE_SIZE
+
+    def enrich():
+        enriched = enrich_brokers(result_set['candidates'][offset:offset + RESULTS_PAGE_SIZE],
+                                  params['location'], params['radius'],
+                                  on_details=on_details, on_scraped=on_scraped)
+        save_result_page(result_id, page, enriched)
+        return enriched
+
+    return single_flight(f"result_page|{result_id}|{page}", enrich)
+
+
+def enrich_result_slice(result_id: str, offset: int, limit: int) -> Optional[List[Dict]]:
+    """
+    Angereicherte Makler ab offset, unabhängig von der Seitengröße der Anzeige.
+
+    Lädt dazu die betroffenen Ergebnisseiten über enrich_result_page(), sodass
+    API und Ergebnisseite dieselben gespeicherten Seiten nutzen.
+
+    Returns:
+        list: Bis zu limit Makler oder None, wenn die Ergebnismenge abgelaufen ist
+    """
+    result_set = get_result_set(result_id)
+    if not result_set:
+        return None
+    end = min(offset + limit, len(result_set['candidates']))
+    brokers = []
+    for page in range(offset // RESULTS_PAGE_SIZE + 1, -(-end // RESULTS_PAGE_SIZE) + 1):
+        page_brokers = enrich_result_page(result_id, page)
+        if page_brokers is None:
+            return None
+        page_start = (page - 1) * RESULTS_PAGE_SIZE
+        brokers.extend(page_brokers[max(offset - page_start, 0):end - page_start])
+    return brokers
+
+
+def _update_fields(broker: Dict) -> Dict:
+    return {
+        'email': broker.get('email', _NOT_AVAILABLE),
+        'contact_person': broker.get('contact_person', _NOT_AVAILABLE),
+        'phone': broker.get('phone', _NOT_AVAILABLE)
+    }
+
+
+def stream_result_page(result_id: str, page: int, route: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    Ereignisse für das schrittweise Anzeigen einer Ergebnisseite (Server-Sent Events).
+
+    Die Anreicherung läuft in einem eigenen Thread und läuft auch weiter, wenn
+    der Client die Verbindung schließt, damit die Seite gespeichert wird.
+
+    Ereignisse:
+        ('broker', {index, broker}): sobald die Place Details eines Maklers vorliegen
+        ('update', {index, email, contact_person, phone, broker}): nach dem Scraping der Website
+        ('summary', {page, offset, total, count, has_more, with_email, with_website, elapsed_ms})
+        ('error', {message})
+        (None, {}): Keep-alive ohne Daten
+
+    Args:
+        result_id (str): ID der Ergebnismenge
+        page (int): Seite (ab 1)
+        route (str): Route für die Zuordnung der Google-Aufrufe
+
+    Yields:
+        tuple: (Ereignisname, Daten)
+    """
+    started = time.monotonic()
+    result_set = get_result_set(result_id)
+    if not result_set:
+        yield 'error', {'message': 'Ergebnisse nicht mehr verfügbar. Bitte erneut suchen.'}
+        return
+
+    total = len(result_set['candidates'])
+    offset = (page - 1) * RESULTS_PAGE_SIZE
+    events: queue.Queue = queue.Queue()
+
+    def worker():
+        try:
+            with api_scope(route):
+                brokers = enrich_result_page(
+                    result_id, page,
+                    on_details=lambda i, broker: events.put(('broker', i, broker)),
+                    on_scraped=lambda i, broker: events.put(('update', i, broker))
+                )
+            events.put(('done', None, brokers or []))
+        except Exception as e:
+            logger.error(f"Anreicherung für Ergebnis-Stream fehlgeschlagen: {e}")
+            events.put(('error', None, None))
+
+    threading.Thread(target=worker, name=f'result-stream-{result_id[:8]}', daemon=True).start()
+
+    sent = set()
+    while True:
+        try:
+            kind, i, payload = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+        except queue.Empty:
+            yield None, {}
+            continue
+
+        if kind == 'broker':
+            sent.add(i)
+            yield 'broker', {'index': offset + i, 'broker': payload}
+        elif kind == 'update':
+            yield 'update', dict(_update_fields(payload), index=offset + i, broker=payload)
+        elif kind == 'error':
+            yield 'error', {'message': 'Ergebnisseite konnte nicht geladen werden'}
+            return
+        else:
+            # Gespeicherte oder von einem anderen Abruf angereicherte Seite: komplett senden
+            for j, broker in enumerate(payload):
+                if j not in sent:
+                    yield 'broker', {'index': offset + j, 'broker': broker}
+            yield 'summary', {
+                'page': page,
+                'offset': offset,
+                'total': total,
+                'count': len(payload),
+                'has_more': offset + len(payload) < total,
+                'with_email': sum(1 for b in payload if b.get('email', _NOT_AVAILABLE) != _NOT_AVAILABLE),
+                'with_website': sum(1 for b in payload if b.get('website', _NOT_AVAILABLE) != _NOT_AVAILABLE),
+                'elapsed_ms': round((time.monotonic() - started) * 1000)
+            }
+            return
@@ -1,3 +1,4 @@
+import os
 import requests
 from bs4 import BeautifulSoup
 import re
@@ -6,24 +7,59 @@ from typing import Dict, Optional
 from urllib.parse import urljoin, urlparse
 import time
 
+from utils.cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
-def scrape_broker_website(url: str) -> Dict[str, str]:
+_scrape_cache: Optional[TTLCache] = None
+
+
+def get_scrape_cache() -> TTLCache:
+    """Cache für erfolgreich gescrapte Kontaktdaten, Schlüssel ist die URL."""
+    global _scrape_cache
+    if _scrape_cache is None:
+        _scrape_cache = TTLCache(
+            'scraped_contacts',
+            ttl_seconds=float(os.getenv('SCRAPE_CACHE_TTL_HOURS', '168')) * 3600,
+            max_entries=int(os.getenv('SCRAPE_CACHE_MAX_ENTRIES', '50000'))
+        )
+    return _scrape_cache
+
+
+def scrape_broker_website(url: str, max_age: Optional[float] = None) -> Dict[str, str]:
     """
     Scrapt eine Versicherungsmakler-Website für zusätzliche Informationen.
     
+    Erfolgreiche Ergebnisse werden pro URL zwischengespeichert.
+    
     Args:
         url (str): URL der zu scrapenden Website
+        max_age (float): Cache-Einträge älter als max_age Sekunden neu scrapen
         
     Returns:
         dict: Dictionary mit gescrapten Informationen
     """
+    return scrape_contacts(url, max_age=max_age) or {
+        'email': 'Nicht verfügbar',
+        'contact_person': 'Nicht verfügbar',
+        'phone': 'Nicht verfügbar'
+    }
+
+
+def scrape_contacts(url: str, max_age: Optional[float] = None) -> Optional[Dict[str, str]]:
+    """
+    Wie scrape_broker_website(), unterscheidet aber ein fehlgeschlagenes Scraping
+    von einer Website ohne Kontaktdaten.
+    
+    Returns:
+        dict: Gescrapte Informationen oder None bei ungültiger URL bzw. Fehler
+    """
     if not url or not url.startswith(('http://', 'https://')):
-        return {
-            'email': 'Nicht verfügbar',
-            'contact_person': 'Nicht verfügbar',
-            'phone': 'Nicht verfügbar'
-        }
+        return None
+    
+    cached = get_scrape_cache().get(url, max_age=max_age)
+    if cached:
+        return cached
     
     try:
         # Headers setzen um als echter Browser zu erscheinen
@@ -52,6 +88,7 @@ def scrape_broker_website(url: str) -> Dict[str, str]:
         }
         
         logger.info(f"Website {url} erfolgreich gescrapt")
+        get_scrape_cache().set(url, scraped_data)
         return scraped_data
         
     except requests.exceptions.Timeout:
@@ -61,11 +98,7 @@ def scrape_broker_website(url: str) -> Dict[str, str]:
     except Exception as e:
         logger.error(f"Unerwarteter Fehler beim Scraping von {url}: {str(e)}")
     
-    return {
-        'email': 'Nicht verfügbar',
-        'contact_person': 'Nicht verfügbar',
-        'phone': 'Nicht verfügbar'
-    }
+    return None
 
 
 def extract_email(soup: BeautifulSoup, text: str) -> str:
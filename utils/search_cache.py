@@ -0,0 +1,153 @@
+import os
+import logging
+from typing import Dict, Optional
+
+from utils.api_metrics import get_metrics
+from utils.cache import TTLCache
+from utils.geocoding import normalize_location
+from utils.jobs import get_job_runner, SEARCH_JOB_TIMEOUT
+from utils.result_store import get_result_set, get_result_page
+from utils.search_pipeline import run_search_once
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+class SearchResultCache:
+    """
+    Zuletzt berechnete Ergebnismenge pro Suchort, Radius und Sortierung.
+
+    Einträge jünger als fresh_seconds werden direkt ausgeliefert. Bis
+    stale_seconds wird die alte Ergebnismenge sofort angezeigt und im
+    Hintergrund (als Suchjob) neu berechnet; danach gilt der Eintrag als
+    abgelaufen. Auffrischungen laden auch gecachte Nearby-Ergebnisse und
+    Kontaktdaten neu, die älter als fresh_seconds sind. Die Sortierung
+    gehört zum Schlüssel, weil sie bestimmt, welche Makler auf der ersten
+    Seite angereichert sind.
+    """
+
+    def __init__(self, fresh_seconds: float, stale_seconds: float, max_entries: int):
+        self.fresh_seconds = fresh_seconds
+        self._cache = TTLCache('search_results', max(fresh_seconds, stale_seconds), max_entries)
+        # Merker für laufende Auffrischungen, damit jede Suche nur einmal neu läuft
+        self._refreshing = TTLCache('search_refresh', SEARCH_JOB_TIMEOUT, max_entries)
+
+    @staticmethod
+    def make_key(location: str, radius_km: int, sort_by: str) -> str:
+        return f"{normalize_location(location)}|{int(radius_km)}|{sort_by}"
+
+    def lookup(self, location: str, radius_km: int, sort_by: str) -> Optional[Dict]:
+        """
+        Sucht eine gespeicherte Ergebnismenge.
+
+        Returns:
+            dict: result_id, coordinates, age (Sekunden) und stale (bool)
+            oder None, wenn nichts Verwendbares vorliegt
+        """
+        entry, age = self._cache.get_with_age(self.make_key(location, radius_km, sort_by))
+        if not entry or not get_result_set(entry['result_id']):
+            return None
+        return dict(entry, age=age, stale=age > self.fresh_seconds)
+
+    def store(self, location: str, radius_km: int, sort_by: str, result_id: str, coordinates: Dict):
+        """Merkt die Ergebnismenge einer vollständig gelaufenen Suche vor."""
+        self._cache.set(self.make_key(location, radius_km, sort_by), {
+            'result_id': result_id,
+            'coordinates': {'lat': coordinates['lat'], 'lng': coordinates['lng']}
+        })
+
+    def refresh_in_background(self, location: str, radius_km: int, sort_by: str, coordinates: Dict) -> bool:
+        """
+        Startet die Neuberechnung einer veralteten Suche als Hintergrundjob.
+
+        Returns:
+            bool: True, wenn ein Job eingereiht wurde (nicht bei laufender
+            Auffrischung oder voller Warteschlange)
+        """
+        key = self.make_key(location, radius_km, sort_by)
+        if self._refreshing.get(key):
+            return False
+        self._refreshing.set(key, True)
+
+        def refresh(job):
+            try:
+                job.stage('nearby')
+                search = run_search_once(location, coordinates, radius_km, sort_by, max_age=self.fresh_seconds)
+                if search.get('result_id'):
+                    self.store(location, radius_km, sort_by, search['result_id'], coordinates)
+                else:
+                    # Gebiet liefert keine Treffer mehr: alte Liste nicht weiter ausliefern
+                    self._cache.delete(key)
+                return {'result_id': search.get('result_id'), 'total': search.get('total', 0)}
+            finally:
+                self._refreshing.delete(key)
+
+        job_id = get_job_runner().submit(
+            'search_refresh', {'location': location, 'radius': radius_km, 'sort': sort_by}, refresh
+        )
+        if not job_id:
+            self._refreshing.delete(key)
+            logger.warning(f"Auffrischung für {location} nicht möglich: Job-Warteschlange voll")
+            return False
+        logger.info(f"Veraltete Suche {location} ({radius_km} km) wird im Hintergrund aufgefrischt")
+        return True
+
+
+_search_cache: Optional[SearchResultCache] = None
+
+
+def get_search_cache() -> SearchResultCache:
+    """Liefert die prozessweite Instanz des Suchergebnis-Caches."""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchResultCache(
+            fresh_seconds=float(os.getenv('SEARCH_CACHE_TTL_MINUTES', '60')) * 60,
+            stale_seconds=float(os.getenv('SEARCH_CACHE_STALE_HOURS', '24')) * 3600,
+            max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '5000'))
+        )
+    return _search_cache
+
+
+def cached_search(location: str, coordinates: Dict, radius_km: int, sort_by: str,
+                  force_refresh: bool = False) -> Optional[Dict]:
+    """
+    Liefert eine gespeicherte Suche im Format von run_search() (stale-while-revalidate).
+
+    Args:
+        location (str): Suchort (nach der Geocodierung, z.B. "PLZ Ort")
+        coordinates (dict): Koordinaten des Suchorts
+        radius_km (int): Suchradius in km
+        sort_by (str): Sortierung
+        force_refresh (bool): Cache umgehen (Nutzer hat "Aktualisieren" gewählt)
+
+    Returns:
+        dict: result_id, brokers, total, params sowie cache_age und cache_stale,
+        oder None, wenn neu gesucht werden muss
+    """
+    if not SEARCH_CACHE_ENABLED or force_refresh:
+        return None
+
+    cache = get_search_cache()
+    entry = cache.lookup(location, radius_km, sort_by)
+    if not entry:
+        get_metrics().increment('search_cache_miss')
+        return None
+
+    if entry['stale']:
+        get_metrics().increment('search_cache_stale')
+        cache.refresh_in_background(location, radius_km, sort_by, entry['coordinates'])
+    else:
+        get_metrics().increment('search_cache_fresh')
+
+    result_set = get_result_set(entry['result_id'])
+    if not result_set:
+        return None
+    return {
+        'result_id': entry['result_id'],
+        'brokers': get_result_page(entry['result_id'], 1) or [],
+        'total': len(result_set['candidates']),
+        'params': result_set['params'],
+        'cache_age': entry['age'],
+        'cache_stale': entry['stale']
+    }
@@ -0,0 +1,102 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+_DB_FILE = 'history.sqlite3'
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def _conn():
+    db_path = data_path(_DB_FILE)
+    conn = get_connection(db_path)
+    with _schema_lock:
+        if db_path in _initialized:
+            return conn
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS search_history ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' location_key TEXT NOT NULL,'
+            ' location TEXT NOT NULL,'
+            ' lat REAL NOT NULL,'
+            ' lng REAL NOT NULL,'
+            ' radius_km INTEGER NOT NULL,'
+            ' sort TEXT,'
+            ' searched_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_search_history_time '
+            'ON search_history (searched_at)'
+        )
+        _initialized.add(db_path)
+    return conn
+
+
+def record_search(location_key: str, location: str, coordinates: Dict, radius_km: int,
+                  sort_by: Optional[str] = None):
+    """
+    Speichert eine Suche für Auswertungen (z.B. Cache-Vorwärmung).
+
+    Args:
+        location_key (str): Normalisierte Eingabe (siehe normalize_location)
+        location (str): Eingabe wie vom Nutzer geschrieben
+        coordinates (dict): Ermittelte Koordinaten mit 'lat' und 'lng'
+        radius_km (int): Suchradius in km
+        sort_by (str): Gewählte Sortierung
+    """
+    try:
+        _conn().execute(
+            'INSERT INTO search_history (location_key, location, lat, lng, radius_km, sort, searched_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (location_key, location, coordinates['lat'], coordinates['lng'], radius_km, sort_by, time.time())
+        )
+    except Exception as e:
+        logger.warning(f"Suche konnte nicht in der Historie gespeichert werden: {e}")
+
+
+def top_search_areas(limit: int = 20, days: int = 30) -> List[Dict]:
+    """
+    Häufigste Suchgebiete (Ort + Radius) der letzten Tage.
+
+    Returns:
+        list: Dicts mit location, location_key, lat, lng, radius_km, sort,
+        searches und last_searched_at, absteigend nach Häufigkeit
+    """
+    since = time.time() - days * 86400
+    rows = _conn().execute(
+        'SELECT location_key, radius_km, COUNT(*) AS searches, MAX(searched_at) AS last_searched_at, '
+        ' MAX(id) AS last_id '
+        'FROM search_history WHERE searched_at >= ? '
+        'GROUP BY location_key, radius_km '
+        'ORDER BY searches DESC, last_searched_at DESC LIMIT ?',
+        (since, limit)
+    ).fetchall()
+
+    areas = []
+    for row in rows:
+        # Eingabe, Koordinaten und Sortierung der letzten Suche in diesem Gebiet
+        last = _conn().execute(
+            'SELECT location, lat, lng, sort FROM search_history WHERE id = ?', (row['last_id'],)
+        ).fetchone()
+        areas.append({
+            'location': last['location'],
+            'location_key': row['location_key'],
+            'lat': last['lat'],
+            'lng': last['lng'],
+            'radius_km': row['radius_km'],
+            'sort': last['sort'],
+            'searches': row['searches'],
+            'last_searched_at': row['last_searched_at']
+        })
+    return areas
+
+
+def prune_history(days: int = 90) -> int:
+    """Löscht Einträge, die älter als days Tage sind."""
+    cur = _conn().execute('DELETE FROM search_history WHERE searched_at < ?', (time.time() - days * 86400,))
+    return cur.rowcount
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from utils.enrichment import enrich_brokers, RESULTS_PAGE_SIZE
+from utils.geo import annotate_and_filter, sort_brokers
+from utils.geocoding import search_insurance_brokers, search_flight_key
+from utils.result_store import create_result_set, get_result_set, save_result_page
+from utils.singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+
+def run_search(location: str, coordinates: Dict, radius_km: int, sort_by: str,
+               progress: Optional[Callable] = None, enrich_first_page: bool = True,
+               max_age: Optional[float] = None) -> Dict:
+    """
+    Führt eine Maklersuche aus: Nearby-Kandidaten, Anreicherung der ersten
+    Seite und Ablage als serverseitige Ergebnismenge.
+
+    Args:
+        location (str): Suchort wie eingegeben
+        coordinates (dict): Koordinaten des Suchorts
+        radius_km (int): Suchradius in km
+        sort_by (str): Sortierung 'distance', 'rating' oder 'score'
+        progress (callable): Optional progress(stage, partial, **werte) für Suchjobs
+        enrich_first_page (bool): False legt die Ergebnismenge direkt nach der Nearby-Suche
+            an; die erste Seite wird dann über den Ergebnis-Stream angereichert
+        max_age (float): Gecachte Nearby-Ergebnisse und Kontaktdaten älter als max_age
+            Sekunden neu laden (Auffrischen einer gespeicherten Suche)
+
+    Returns:
+        dict: result_id, brokers (erste Seite, ohne Anreicherung leer), total und params;
+        bei keinen Treffern nur total = 0
+    """
+    report = progress or (lambda stage, partial=None, **values: None)
+
+    # Versicherungsmakler in der Nähe suchen (nur Nearby-Kandidaten, ohne Details)
+    report('nearby')
+    candidates = search_insurance_brokers(coordinates, radius_km * 1000, sort_by, max_age=max_age)  # km zu m
+    if not candidates:
+        return {'total': 0}
+    return _save_search(location, radius_km, sort_by, candidates, report, enrich_first_page, max_age)
+
+
+def narrow_search(result_id: str, location: str, coordinates: Dict, radius_km: int, sort_by: str,
+                  progress: Optional[Callable] = None, enrich_first_page: bool = True) -> Dict:
+    """
+    Schneidet eine gespeicherte Ergebnismenge auf den Kreis um coordinates zu.
+
+    Für eingerastete GPS-Positionen: Die Ergebnismenge ihrer PLZ (Radius um den
+    Abstand zum Schwerpunkt vergrößert) enthält alle Makler im Kreis um die
+    GPS-Position. Entfernungen und Sortierung gelten danach ab der GPS-Position.
+
+    Returns:
+        dict: wie run_search()
+    """
+    result_set = get_result_set(result_id)
+    if not result_set:
+        return {'total': 0}
+    candidates = annotate_and_filter(result_set['candidates'], coordinates['lat'], coordinates['lng'], radius_km)
+    if not candidates:
+        return {'total': 0}
+    report = progress or (lambda stage, partial=None, **values: None)
+    return _save_search(location, radius_km, sort_by, sort_brokers(candidates, sort_by, radius_km),
+                        report, enrich_first_page)
+
+
+def _save_search(location: str, radius_km: int, sort_by: str, candidates, report: Callable,
+                 enrich_first_page: bool, max_age: Optional[float] = None) -> Dict:
+    """Legt die Ergebnismenge an und reichert auf Wunsch die erste Seite an (siehe run_search())."""
+    search_params = {
+        'location': location,
+        'radius': radius_km,
+        'sort': sort_by,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    result_id = create_result_set(search_params, candidates)
+
+    if not enrich_first_page:
+        logger.info(f"Gefunden: {len(candidates)} Versicherungsmakler, Anreicherung über den Ergebnis-Stream")
+        return {'result_id': result_id, 'brokers': [], 'total': len(candidates), 'params': search_params}
+
+    # Kandidaten der ersten Seite schon vor der Anreicherung anzeigen
+    report('enrich', candidates[:RESULTS_PAGE_SIZE], total=len(candidates),
+           enriching=min(len(candidates), RESULTS_PAGE_SIZE))
+
+    # Details und Web-Scraping nur für die erste Ergebnisseite, der Rest wird bei Bedarf nachgeladen
+    enhanced_brokers = enrich_brokers(candidates[:RESULTS_PAGE_SIZE], location, radius_km, scrape_max_age=max_age)
+    save_result_page(result_id, 1, enhanced_brokers)
+
+    logger.info(f"Gefunden: {len(candidates)} Versicherungsmakler, {len(enhanced_brokers)} sofort angereichert")
+    return {
+        'result_id': result_id,
+        'brokers': enhanced_brokers,
+        'total': len(candidates),
+        'params': search_params
+    }
+
+
+def run_search_once(location: str, coordinates: Dict, radius_km: int, sort_by: str,
+                    progress: Optional[Callable] = None, enrich_first_page: bool = True,
+                    max_age: Optional[float] = None) -> Dict:
+    """
+    Wie run_search(), aber identische gleichzeitige Suchen (auch aus anderen
+    Workern) warten auf die erste und teilen deren Ergebnismenge. Fortschritt
+    meldet nur die Suche, die tatsächlich rechnet.
+    """
+    key = search_flight_key(location, coordinates, radius_km, sort_by)
+    if not enrich_first_page:
+        key += '|stream'
+    if max_age is not None:
+        # Auffrischungen nicht mit dem (evtl. älteren) Ergebnis einer normalen Suche bedienen
+        key += f'|max_age={int(max_age)}'
+    return single_flight(
+        key, lambda: run_search(location, coordinates, radius_km, sort_by, progress, enrich_first_page, max_age)
+    )
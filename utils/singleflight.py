@@ -0,0 +1,171 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: nur Zusammenfassen innerhalb eines Prozesses
+    fcntl = None
+
+from utils.cache import TTLCache
+from utils.storage import data_path
+
+logger = logging.getLogger(__name__)
+
+# Wie lange Folger höchstens auf den Leader warten (Sekunden)
+SINGLEFLIGHT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_TIMEOUT', '120'))
+
+# Wie lange ein fertiges Ergebnis für Nachzügler anderer Worker bereitliegt (Sekunden)
+SINGLEFLIGHT_RESULT_TTL = float(os.getenv('SINGLEFLIGHT_RESULT_TTL', '30'))
+
+_POLL_INTERVAL = 0.05
+
+
+class SingleFlight:
+    """
+    Fasst gleichzeitige identische Aufrufe zusammen.
+
+    Innerhalb eines Prozesses warten Folger auf ein Future des Leaders. Über
+    Gunicorn-Worker hinweg sorgt eine Lock-Datei pro Schlüssel dafür, dass nur
+    ein Worker rechnet; die anderen lesen danach das Ergebnis aus dem
+    gemeinsamen SQLite-Store. Der Leader löscht die Lock-Datei, solange er sie
+    noch hält, sodass nur Dateien laufender Aufrufe existieren.
+    """
+
+    def __init__(self, timeout: float = SINGLEFLIGHT_TIMEOUT, result_ttl: float = SINGLEFLIGHT_RESULT_TTL):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._results = TTLCache('singleflight', ttl_seconds=result_ttl, max_entries=1000)
+        self.stats = {'leader': 0, 'shared_local': 0, 'shared_worker': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Führt fn() für key höchstens einmal gleichzeitig aus.
+
+        Args:
+            key (str): Schlüssel identischer Aufrufe
+            fn (callable): Berechnung; das Ergebnis muss JSON-serialisierbar sein
+
+        Returns:
+            Ergebnis von fn() – ggf. das eines anderen Requests
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            logger.info(f"Warte auf laufende identische Anfrage ({key})")
+            self.stats['shared_local'] += 1
+            return future.result(timeout=self.timeout)
+
+        try:
+            result = self._run_across_workers(key, fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lock_path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return data_path(os.path.join('locks', f'{digest}.lock'))
+
+    def _run_across_workers(self, key: str, fn: Callable[[], Any]) -> Any:
+        if fcntl is None:
+            self.stats['leader'] += 1
+            return fn()
+
+        lock_path = self._lock_path(key)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        lock_file, waited = self._open_locked(lock_path)
+        try:
+            # Ein anderer Worker war schneller und hat das Ergebnis abgelegt
+            shared = self._results.get(key)
+            if shared is not None:
+                if waited:
+                    logger.info(f"Ergebnis eines anderen Workers übernommen ({key})")
+                self.stats['shared_worker'] += 1
+                return shared['value']
+
+            self.stats['leader'] += 1
+            result = fn()
+            self._results.set(key, {'value': result})
+            return result
+        finally:
+            # Noch unter dem Lock löschen; Wartende erkennen die gelöschte Datei am Inode
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _open_locked(self, lock_path: str):
+        """
+        Öffnet und sperrt die Lock-Datei eines Schlüssels.
+
+        Hat der vorherige Halter die Datei gelöscht, während hier gewartet wurde,
+        gehört die Sperre zu einer verwaisten Datei; dann wird die aktuelle
+        Datei neu geöffnet.
+
+        Returns:
+            tuple: (gesperrte Datei, True wenn gewartet werden musste)
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            lock_file = open(lock_path, 'a')
+            try:
+                waited = self._acquire(lock_file, deadline) or waited
+                current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            except BaseException:
+                lock_file.close()
+                raise
+            if current:
+                return lock_file, waited
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            waited = True
+
+    def _acquire(self, lock_file, deadline: float) -> bool:
+        """Nimmt die Lock-Datei exklusiv; True, wenn dafür gewartet werden musste."""
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return waited
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError('Zeitüberschreitung beim Warten auf identische Anfrage')
+                waited = True
+                time.sleep(_POLL_INTERVAL)
+
+
+_flight: Optional[SingleFlight] = None
+_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Liefert die prozessweite SingleFlight-Instanz."""
+    global _flight
+    with _flight_lock:
+        if _flight is None:
+            _flight = SingleFlight()
+        return _flight
+
+
+def single_flight(key: str, fn: Callable[[], Any]) -> Any:
+    """Kurzform für get_single_flight().do(key, fn)."""
+    return get_single_flight().do(key, fn)
@@ -0,0 +1,139 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from utils.geo import haversine_m
+from utils.geohash import cells_for_circle
+from utils.storage import data_path, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Zellgröße des Index (4 Zeichen ≈ 39 x 20 km)
+INDEX_PRECISION = 4
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def circle_contains(outer: Dict, lat: float, lng: float, radius_m: float) -> bool:
+    """True, wenn der Kreis (lat, lng, radius_m) vollständig in outer liegt."""
+    return haversine_m(outer['lat'], outer['lng'], lat, lng) + radius_m <= outer['radius_m']
+
+
+class SpatialSearchIndex:
+    """
+    Räumlicher Index abgeschlossener Suchkreise.
+
+    Jeder Kreis wird in allen Geohash-Zellen eingetragen, die er berührt. Eine
+    Abfrage liest nur die Zellen des neuen Kreises und prüft die Kandidaten
+    anschließend exakt per Haversine.
+    """
+
+    def __init__(self, ttl_seconds: float, db_file: str = 'spatial.sqlite3', precision: int = INDEX_PRECISION):
+        self.ttl_seconds = ttl_seconds
+        self.db_path = data_path(db_file)
+        self.precision = precision
+        self._writes = 0
+        self._ensure_schema()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _ensure_schema(self):
+        with _schema_lock:
+            if self.db_path in _initialized:
+                return
+            conn = self._conn()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS search_circles ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' cache_key TEXT NOT NULL UNIQUE,'
+                ' lat REAL NOT NULL,'
+                ' lng REAL NOT NULL,'
+                ' radius_m REAL NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_search_circles_created '
+                'ON search_circles (created_at)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS circle_cells ('
+                ' cell TEXT NOT NULL,'
+                ' circle_id INTEGER NOT NULL,'
+                ' PRIMARY KEY (cell, circle_id))'
+            )
+            _initialized.add(self.db_path)
+
+    def register(self, cache_key: str, lat: float, lng: float, radius_m: float):
+        """Trägt einen abgeschlossenen Suchkreis ein (ersetzt einen Eintrag mit gleichem Schlüssel)."""
+        cells = cells_for_circle(lat, lng, radius_m, self.precision)
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            old = conn.execute('SELECT id FROM search_circles WHERE cache_key = ?', (cache_key,)).fetchone()
+            if old:
+                conn.execute('DELETE FROM circle_cells WHERE circle_id = ?', (old['id'],))
+                conn.execute('DELETE FROM search_circles WHERE id = ?', (old['id'],))
+            cur = conn.execute(
+                'INSERT INTO search_circles (cache_key, lat, lng, radius_m, created_at) VALUES (?, ?, ?, ?, ?)',
+                (cache_key, lat, lng, radius_m, time.time())
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO circle_cells (cell, circle_id) VALUES (?, ?)',
+                [(cell, cur.lastrowid) for cell in cells]
+            )
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            logger.warning(f"Suchkreis konnte nicht indexiert werden: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def find_overlapping(self, lat: float, lng: float, radius_m: float,
+                         max_age: Optional[float] = None) -> List[Dict]:
+        """
+        Frische Suchkreise, die den Kreis (lat, lng, radius_m) schneiden.
+
+        Args:
+            max_age (float): Nur Kreise jünger als max_age Sekunden (Standard: TTL)
+
+        Returns:
+            list: Kreise mit cache_key, lat, lng, radius_m, created_at und
+            'contains' (True, wenn sie den Kreis vollständig enthalten);
+            enthaltende Kreise zuerst, danach absteigend nach Radius
+        """
+        cells = sorted(cells_for_circle(lat, lng, radius_m, self.precision))
+        placeholders = ','.join('?' * len(cells))
+        rows = self._conn().execute(
+            'SELECT DISTINCT c.cache_key, c.lat, c.lng, c.radius_m, c.created_at '
+            'FROM circle_cells cc JOIN search_circles c ON c.id = cc.circle_id '
+            f'WHERE cc.cell IN ({placeholders}) AND c.created_at >= ?',
+            (*cells, time.time() - (self.ttl_seconds if max_age is None else min(max_age, self.ttl_seconds)))
+        ).fetchall()
+
+        circles = []
+        for row in rows:
+            circle = dict(row)
+            distance = haversine_m(lat, lng, circle['lat'], circle['lng'])
+            if distance >= radius_m + circle['radius_m']:
+                continue
+            circle['contains'] = distance + radius_m <= circle['radius_m']
+            circles.append(circle)
+        circles.sort(key=lambda c: (not c['contains'], -c['radius_m']))
+        return circles
+
+    def prune(self) -> int:
+        """Entfernt Kreise, deren Ergebnisse abgelaufen sind."""
+        conn = self._conn()
+        cutoff = time.time() - self.ttl_seconds
+        conn.execute(
+            'DELETE FROM circle_cells WHERE circle_id IN '
+            '(SELECT id FROM search_circles WHERE created_at < ?)', (cutoff,)
+        )
+        return conn.execute('DELETE FROM search_circles WHERE created_at < ?', (cutoff,)).rowcount
+
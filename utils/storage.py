@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Lokales Datenverzeichnis für Caches und SQLite-Dateien
+DATA_DIR = os.getenv('DATA_DIR', 'instance')
+
+_local = threading.local()
+
+
+def data_path(filename: str) -> str:
+    """Gibt den Pfad einer Datei im Datenverzeichnis zurück und legt das Verzeichnis bei Bedarf an."""
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Liefert eine SQLite-Verbindung für den aktuellen Thread.
+
+    Verbindungen werden pro Thread und Datei wiederverwendet. WAL-Modus erlaubt
+    gleichzeitiges Lesen aus mehreren Gunicorn-Workern während geschrieben wird.
+
+    Args:
+        db_path (str): Pfad zur SQLite-Datei
+
+    Returns:
+        sqlite3.Connection: Verbindung mit Row-Factory
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.DatabaseError as e:
+            logger.warning(f"WAL-Modus für {db_path} nicht verfügbar: {e}")
+        connections[db_path] = conn
+    return conn
@@ -0,0 +1,100 @@
+import os
+import math
+import logging
+from typing import Dict, List
+
+from utils.geo import haversine_m, offset_point
+
+logger = logging.getLogger(__name__)
+
+# Google Places Nearby akzeptiert höchstens 50 km Radius
+MAX_TILE_RADIUS_M = int(os.getenv('PLACES_MAX_TILE_RADIUS', '50000'))
+# Unterhalb dieses Radius wird nicht weiter unterteilt
+MIN_TILE_RADIUS_M = int(os.getenv('PLACES_MIN_TILE_RADIUS', '500'))
+# Eine Nearby-Suche liefert höchstens 60 Ergebnisse (3 Seiten à 20)
+SATURATION_RESULTS = 60
+# Überlappung der Teilkreise, damit an den Rändern keine Lücken entstehen
+TILE_OVERLAP = 1.1
+
+
+def plan_tiles(lat: float, lng: float, radius_m: float,
+               tile_radius_m: float = MAX_TILE_RADIUS_M) -> List[Dict]:
+    """
+    Überdeckt einen Suchkreis mit überlappenden Teilkreisen.
+
+    Liegt der Radius unter tile_radius_m, genügt ein einzelner Kreis. Sonst werden
+    die Mittelpunkte auf einem Hexagonalgitter mit Abstand sqrt(3) * r / TILE_OVERLAP
+    angeordnet, sodass die Teilkreise die Ebene überlappend überdecken.
+
+    Args:
+        lat (float): Breitengrad des Suchzentrums
+        lng (float): Längengrad des Suchzentrums
+        radius_m (float): Suchradius in Metern
+        tile_radius_m (float): Radius der Teilkreise in Metern
+
+    Returns:
+        list: Teilkreise als Dicts mit 'lat', 'lng', 'radius'
+    """
+    if radius_m <= tile_radius_m:
+        return [{'lat': lat, 'lng': lng, 'radius': radius_m}]
+
+    spacing = math.sqrt(3) * tile_radius_m / TILE_OVERLAP
+    row_height = spacing * math.sqrt(3) / 2
+    rows = int(math.ceil((radius_m + tile_radius_m) / row_height))
+    cols = int(math.ceil((radius_m + tile_radius_m) / spacing)) + 1
+
+    tiles = []
+    for row in range(-rows, rows + 1):
+        dy = row * row_height
+        shift = spacing / 2 if row % 2 else 0.0
+        for col in range(-cols, cols + 1):
+            dx = col * spacing + shift
+            distance = math.hypot(dx, dy)
+            # Nur Kreise, die den Suchkreis schneiden
+            if distance > radius_m + tile_radius_m:
+                continue
+            bearing = math.degrees(math.atan2(dx, dy))
+            tile_lat, tile_lng = offset_point(lat, lng, distance, bearing) if distance else (lat, lng)
+            tiles.append({'lat': tile_lat, 'lng': tile_lng, 'radius': tile_radius_m})
+
+    logger.info(f"Suchkreis {radius_m / 1000:.0f} km in {len(tiles)} Teilkreise aufgeteilt")
+    return tiles
+
+
+def subdivide_tile(tile: Dict, search_lat: float, search_lng: float, search_radius_m: float) -> List[Dict]:
+    """
+    Teilt einen gesättigten Kreis in sieben kleinere Kreise (Mitte + Sechseck).
+
+    Sieben Kreise mit halbem Radius überdecken den Ausgangskreis vollständig;
+    TILE_OVERLAP sorgt für Reserve an den Nahtstellen. Teilkreise außerhalb des
+    eigentlichen Suchkreises werden verworfen.
+
+    Returns:
+        list: Teilkreise oder leere Liste, wenn die Mindestgröße erreicht ist
+    """
+    child_radius = tile['radius'] / 2 * TILE_OVERLAP
+    if child_radius < MIN_TILE_RADIUS_M:
+        return []
+
+    children = [{'lat': tile['lat'], 'lng': tile['lng'], 'radius': child_radius}]
+    ring_distance = tile['radius'] * math.sqrt(3) / 2
+    for bearing in range(0, 360, 60):
+        child_lat, child_lng = offset_point(tile['lat'], tile['lng'], ring_distance, bearing)
+        children.append({'lat': child_lat, 'lng': child_lng, 'radius': child_radius})
+
+    return [
+        child for child in children
+        if haversine_m(search_lat, search_lng, child['lat'], child['lng']) <= search_radius_m + child['radius']
+    ]
+
+
+def is_saturated(stats: Dict) -> bool:
+    """
+    True, wenn eine Nearby-Suche das Ergebnislimit von Google erreicht hat.
+
+    Früh abgebrochene Suchen (Seite ohne neue place_ids) gelten nie als
+    gesättigt: Ihr Gebiet haben andere Suchbegriffe bereits abgedeckt.
+    """
+    if stats.get('stopped_early'):
+        return False
+    return bool(stats.get('truncated') or stats.get('results', 0) >= SATURATION_RESULTS)